@@ -0,0 +1,123 @@
+import os
+import queue
+import threading
+
+import cv2
+
+# Artifact levels: NONE writes nothing, SUMMARY writes the result image (and text) of each stage, FULL also
+# writes every intermediate image
+NONE = 0
+SUMMARY = 1
+FULL = 2
+LEVELS = {'none': NONE, 'summary': SUMMARY, 'full': FULL}
+
+
+def parse_level(level):
+    """Turn a level name, a debug flag (True means full) or a level number into a level number."""
+    if level is None or level is False:
+        return NONE
+    if level is True:
+        return FULL
+    if isinstance(level, str):
+        return LEVELS[level]
+    return level
+
+
+def write_image(path, image):
+    cv2.imwrite(path, image)
+    print(f"Image saved at: {path}")
+
+
+class ArtifactSink:
+    """Collects the debug images and text files of the detection stages.
+
+    Every artifact is tagged with a level and is dropped when the sink's level is lower. Images can be given as
+    callables, which are only called for artifacts that are kept, so the drawing work is skipped as well. At
+    FULL level the images are encoded and written by a background thread; the sink keeps a reference to each
+    image, so stages only hand over images they no longer modify. close() (or leaving the sink's with block)
+    waits for the pending writes.
+    """
+
+    def __init__(self, level=NONE, root='.', background=None):
+        self.level = parse_level(level)
+        self.root = root
+        if background is None:
+            background = self.level >= FULL
+
+        self._queue = None
+        self._thread = None
+        if background and self.level > NONE:
+            self._queue = queue.Queue()
+            self._thread = threading.Thread(target=self._write_pending, name='artifact-writer', daemon=True)
+            self._thread.start()
+
+    def wants(self, level=FULL):
+        """True if artifacts of the given level are kept."""
+        return self.level >= level
+
+    def path(self, folder, name):
+        folder = os.path.join(self.root, folder)
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name)
+
+    def image(self, folder, name, image, level=FULL):
+        """Save an image (an array, or a callable returning one) as folder/name. Returns the path, or None if
+        the artifact was skipped."""
+        if not self.wants(level):
+            return None
+        if callable(image):
+            image = image()
+        if image is None:
+            return None
+
+        path = self.path(folder, name)
+        if self._queue is not None:
+            self._queue.put((path, image))
+        else:
+            write_image(path, image)
+        return path
+
+    def text(self, folder, name, lines, level=SUMMARY):
+        """Write lines of text (or a callable returning them) to folder/name. Returns the path, or None."""
+        if not self.wants(level):
+            return None
+        if callable(lines):
+            lines = lines()
+
+        path = self.path(folder, name)
+        with open(path, 'w') as file:
+            file.writelines(f"{line}\n" for line in lines)
+        print(f"Text saved at: {path}")
+        return path
+
+    def _write_pending(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                write_image(*item)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until every image handed to the sink so far is written."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            self._queue = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Shared sink for stages called without one: it keeps nothing and never starts a thread
+NO_ARTIFACTS = ArtifactSink(NONE)
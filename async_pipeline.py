@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import multiprocessing
+import os
+import threading
+import traceback
+import uuid
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from grayscalebinarize import count_pages
+from instrumentation import StageRecorder
+from pipeline import CACHED_KEYS, isolated_workspace, process_page, stitch_pages, add_midi
+
+# Kinds of progress events
+STAGE_STARTED = 'stage_started'
+STAGE_FINISHED = 'stage_finished'
+PAGE_DONE = 'page_done'
+DONE = 'done'
+FAILED = 'failed'
+
+# One progress event of a conversion. stage is the pipeline stage (None for page and job events), page the
+# 0-based page number where it applies, and info the stage's info (for example 'notes' when note
+# identification finishes), the page counts of PAGE_DONE, the result of DONE or the error of FAILED.
+ProgressEvent = namedtuple('ProgressEvent', ['kind', 'stage', 'page', 'info'])
+
+# Set in each worker process by set_event_queue
+worker_events = None
+
+
+def set_event_queue(events):
+    """Initializer of the worker processes: the queue that carries progress events to the parent."""
+    global worker_events
+    worker_events = events
+
+
+class EventRecorder(StageRecorder):
+    """Stage recorder that reports the start and end of every stage of a job as ProgressEvents on a queue."""
+
+    def __init__(self, job_id, events):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+
+    @contextlib.contextmanager
+    def stage(self, name, **info):
+        self.events.put((self.job_id, ProgressEvent(STAGE_STARTED, name, info.get('page'), dict(info))))
+        with super().stage(name, **info) as stage_info:
+            yield stage_info
+        finished = ProgressEvent(STAGE_FINISHED, name, stage_info.get('page'), dict(stage_info))
+        self.events.put((self.job_id, finished))
+
+
+def run_page_job(job_id, pdf_path, page_number, threshold, dpi):
+    """Process one page in a worker process, in its own workspace, reporting its stages. Returns the plain-data
+    part of the page result (see pipeline.CACHED_KEYS), or None if the page could not be processed."""
+    recorder = EventRecorder(job_id, worker_events)
+    with isolated_workspace():
+        result = process_page(pdf_path, page_number, threshold, recorder=recorder, dpi=dpi, parallel=False)
+    return {key: result[key] for key in CACHED_KEYS} if result is not None else None
+
+
+class AsyncConverter:
+    """asyncio front end of the pipeline.
+
+    Pages run in a pool of worker processes, so the event loop never runs a CPU-bound stage and conversions of
+    different clients share the workers. The workers send their stage events over one multiprocessing queue,
+    which a single reader thread hands to the event loop of the job they belong to; a conversion does not need
+    a thread of its own. Use as an async context manager, or call close() when done.
+    """
+
+    def __init__(self, workers=None):
+        self.events = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=set_event_queue,
+                                            initargs=(self.events,))
+        self.jobs = {}
+        self.reader = threading.Thread(target=self.dispatch_events, name='progress-reader', daemon=True)
+        self.reader.start()
+
+    def dispatch_events(self):
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+            job_id, event = item
+            target = self.jobs.get(job_id)
+            if target is not None:
+                loop, job_events = target
+                loop.call_soon_threadsafe(job_events.put_nowait, event)
+
+    async def convert(self, pdf_path, output_name=None, output_dir=None, threshold=185, all_pages=False,
+                      dpi=None):
+        """Convert a PDF, yielding ProgressEvents as the conversion goes.
+
+        Stage events arrive as the workers start and finish stages, a PAGE_DONE event follows every page (with
+        the pages done so far and the notes found so far), and the last event is DONE with the result of
+        pipeline.add_midi in info['result'] (the MIDI bytes when output_dir is None) or FAILED with
+        info['error']. With all_pages=True the pages are processed at the same time and stitched in page order.
+        """
+        loop = asyncio.get_running_loop()
+        pdf_path = os.path.abspath(pdf_path)  # The workers run in their own working directories
+        if output_name is None:
+            output_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        job_id = uuid.uuid4().hex
+        job_events = asyncio.Queue()
+        self.jobs[job_id] = (loop, job_events)
+        next_event = None
+
+        try:
+            num_pages = await loop.run_in_executor(None, count_pages, pdf_path) if all_pages else 1
+            pages = {asyncio.ensure_future(loop.run_in_executor(self.executor, run_page_job, job_id, pdf_path,
+                                                                page_number, threshold, dpi)): page_number
+                     for page_number in range(num_pages)}
+            page_results = {}
+            notes_found = 0
+            next_event = asyncio.ensure_future(job_events.get())
+
+            while pages:
+                done, _ = await asyncio.wait(set(pages) | {next_event}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in done:
+                    yield next_event.result()
+                    next_event = asyncio.ensure_future(job_events.get())
+
+                for future in done & set(pages):
+                    page_number = pages.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        yield ProgressEvent(FAILED, None, page_number, {'error': traceback.format_exc(limit=3)})
+                        return
+                    page_results[page_number] = result
+                    notes_found += len(result['notes_data']) if result is not None else 0
+                    yield ProgressEvent(PAGE_DONE, None, page_number, {
+                        'pages_done': len(page_results),
+                        'pages': num_pages,
+                        'notes_found': notes_found,
+                        'processed': result is not None,
+                    })
+
+            # Stage events that were still on their way when the last page finished
+            while not job_events.empty():
+                yield job_events.get_nowait()
+
+            results = [page_results[page_number] for page_number in range(num_pages)
+                       if page_results[page_number] is not None]
+            if not results:
+                yield ProgressEvent(FAILED, None, None, {'error': f"no page of {pdf_path} could be processed"})
+                return
+
+            yield ProgressEvent(STAGE_STARTED, 'midi', None, {})
+            result = await loop.run_in_executor(None, self.assemble, results, output_name, output_dir, all_pages)
+            yield ProgressEvent(STAGE_FINISHED, 'midi', None, {})
+            yield ProgressEvent(DONE, None, None, {'result': result})
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+            del self.jobs[job_id]
+
+    @staticmethod
+    def assemble(results, output_name, output_dir, all_pages):
+        if not all_pages:
+            return add_midi(results[0], results[0]['assigned_notes'], output_name, output_dir)
+        assigned_notes = stitch_pages(results)
+        return add_midi({'pages': results, 'assigned_notes': assigned_notes}, assigned_notes, output_name,
+                        output_dir)
+
+    async def convert_with_callback(self, pdf_path, on_event, **options):
+        """Run convert(), calling on_event(event) for every progress event. Returns the result of the DONE
+        event, or None if the conversion failed."""
+        result = None
+        async for event in self.convert(pdf_path, **options):
+            on_event(event)
+            if event.kind == DONE:
+                result = event.info['result']
+        return result
+
+    def close(self):
+        self.executor.shutdown()
+        self.events.put(None)
+        self.reader.join()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+def print_event(name, event):
+    info = {key: value for key, value in event.info.items() if key != 'result'}
+    print(f"[{name}] {event.kind} {event.stage or ''} page={event.page} {info}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert music PDFs to MIDI concurrently, printing progress.")
+    parser.add_argument('pdfs', nargs='+', help="PDF files to convert")
+    parser.add_argument('--all-pages', action='store_true', help="Convert every page of each PDF")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument('--output-dir', default='midi_files', help="Folder for the MIDI files")
+    args = parser.parse_args()
+
+    async def convert_all():
+        async with AsyncConverter(args.workers) as converter:
+            await asyncio.gather(*(
+                converter.convert_with_callback(path, functools.partial(print_event, os.path.basename(path)),
+                                                output_dir=os.path.abspath(args.output_dir),
+                                                all_pages=args.all_pages)
+                for path in args.pdfs))
+
+    asyncio.run(convert_all())
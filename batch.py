@@ -0,0 +1,108 @@
+import argparse
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pipeline import isolated_workspace, run_pipeline, run_pipeline_pages
+
+
+def collect_pdfs(inputs):
+    """Expand directories, glob patterns and file paths into a sorted list of unique PDF paths."""
+    pdf_paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            pdf_paths.update(glob.glob(os.path.join(item, '*.pdf')))
+        else:
+            pdf_paths.update(path for path in glob.glob(item) if path.lower().endswith('.pdf'))
+    return sorted(os.path.abspath(path) for path in pdf_paths)
+
+
+def output_names(pdf_paths):
+    """Name each MIDI file after its PDF, adding a suffix when two PDFs in different folders share a name."""
+    names = []
+    seen = {}
+    for pdf_path in pdf_paths:
+        name = os.path.splitext(os.path.basename(pdf_path))[0]
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+    return names
+
+
+def convert_pdf(pdf_path, output_name, output_dir, all_pages=False, page_workers=1, debug_dir=None, dpi=None):
+    """Convert one PDF inside its own workspace. Returns (pdf_path, midi_path, error, seconds)."""
+    start = time.perf_counter()
+    workspace = os.path.join(debug_dir, output_name) if debug_dir is not None else None
+
+    try:
+        with isolated_workspace(workspace):
+            if all_pages:
+                result = run_pipeline_pages(pdf_path, output_name, output_dir, max_workers=page_workers,
+                                            debug_dir='pages' if debug_dir is not None else None, dpi=dpi)
+            else:
+                result = run_pipeline(pdf_path, output_name, output_dir, debug=debug_dir is not None, dpi=dpi)
+    except Exception:
+        return pdf_path, None, traceback.format_exc(limit=3), time.perf_counter() - start
+
+    if result is None:
+        return pdf_path, None, "no page could be processed", time.perf_counter() - start
+    return pdf_path, result['midi_path'], None, time.perf_counter() - start
+
+
+def run_batch(pdf_paths, output_dir="midi_files", jobs=None, all_pages=False, page_workers=1, debug_dir=None,
+              dpi=None):
+    """Convert the PDFs with up to `jobs` conversions running at once. Returns one
+    (pdf_path, midi_path, error, seconds) tuple per PDF, in input order."""
+    output_dir = os.path.abspath(output_dir)
+    if debug_dir is not None:
+        debug_dir = os.path.abspath(debug_dir)
+
+    reports = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(convert_pdf, pdf_path, name, output_dir, all_pages, page_workers, debug_dir, dpi)
+                   for pdf_path, name in zip(pdf_paths, output_names(pdf_paths))]
+        for future in as_completed(futures):
+            pdf_path, midi_path, error, seconds = future.result()
+            status = "ok" if error is None else "FAILED"
+            print(f"[{status}] {pdf_path} ({seconds:.2f} s)")
+            reports[pdf_path] = (pdf_path, midi_path, error, seconds)
+
+    return [reports[pdf_path] for pdf_path in pdf_paths]
+
+
+def print_summary(reports):
+    print("\nBatch summary:")
+    for pdf_path, midi_path, error, seconds in reports:
+        if error is None:
+            print(f"  ok      {seconds:8.2f} s  {pdf_path} -> {midi_path}")
+        else:
+            print(f"  FAILED  {seconds:8.2f} s  {pdf_path}: {error.strip().splitlines()[-1]}")
+
+    failed = sum(1 for report in reports if report[2] is not None)
+    total_time = sum(report[3] for report in reports)
+    print(f"{len(reports) - failed} converted, {failed} failed, {total_time:.2f} s of conversion time")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a batch of music PDF files to MIDI concurrently.")
+    parser.add_argument('inputs', nargs='+', help="PDF files, directories of PDFs or glob patterns")
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="Number of PDFs converted at the same time (default: number of CPUs)")
+    parser.add_argument('--output-dir', default="midi_files", help="Folder for the MIDI files")
+    parser.add_argument('--all-pages', action='store_true', help="Convert every page of each PDF")
+    parser.add_argument('--page-workers', type=int, default=1,
+                        help="Worker processes per PDF for --all-pages")
+    parser.add_argument('--debug-dir', default=None,
+                        help="Keep each job's workspace and intermediate images under this folder")
+    parser.add_argument('--dpi', type=int, default=None, help="Render resolution (default: 72 DPI)")
+    args = parser.parse_args()
+
+    pdfs = collect_pdfs(args.inputs)
+    if not pdfs:
+        parser.error("no PDF files found")
+
+    batch_reports = run_batch(pdfs, args.output_dir, args.jobs, args.all_pages, args.page_workers, args.debug_dir,
+                              args.dpi)
+    raise SystemExit(1 if print_summary(batch_reports) else 0)
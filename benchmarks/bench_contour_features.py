@@ -0,0 +1,70 @@
+"""Compare the shared contour-feature engine with the original per-contour loop of detect_blobs on the bundled
+scores.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_contour_features
+"""
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from grayscalebinarize import render_and_binarize
+from staff_removal import process_array
+from note_head_detection import apply_method2
+from contour_features import contour_features
+
+
+def features_loop(image):
+    """The original implementation: every contour measured in Python. Returns sorted
+    (x, y, w, h, area, perimeter, solidity, completeness) rows, the reference for correctness and timing."""
+    contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rows = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        area = cv2.contourArea(contour)
+        perimeter = cv2.arcLength(contour, True)
+        hull = cv2.convexHull(contour)
+        hull_area = cv2.contourArea(hull)
+        hull_perimeter = cv2.arcLength(hull, True)
+        solidity = float(area) / hull_area if hull_area > 0 else 0
+        completeness = perimeter / hull_perimeter if hull_perimeter > 0 else 0
+        rows.append((x, y, w, h, area, perimeter, solidity, completeness))
+    return sorted(rows)
+
+
+def features_engine(image):
+    """The shared engine with the hull of every contour, as the loop measures it."""
+    features = contour_features(image, hull=True)
+    return sorted(zip(*(features[name].tolist() for name in
+                        ('x', 'y', 'w', 'h', 'area', 'perimeter', 'solidity', 'completeness'))))
+
+
+def bench_score(pdf_path, repeats=5):
+    _, binarized_array = render_and_binarize(pdf_path)
+    _, _, page_without_staff = process_array(binarized_array)
+    closing = cv2.cvtColor(apply_method2(page_without_staff, outline_gaussian=False)[3], cv2.COLOR_BGR2GRAY)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        reference = features_loop(closing)
+    loop_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        engine = features_engine(closing)
+    engine_time = (time.perf_counter() - start) / repeats
+
+    identical = len(reference) == len(engine) and np.allclose(np.array(reference), np.array(engine))
+    print(f"{os.path.basename(pdf_path)}: {len(reference)} contours, loop {loop_time * 1000:.1f} ms, "
+          f"engine {engine_time * 1000:.1f} ms (every contour measured), identical features: {identical}")
+    if not identical:
+        raise AssertionError(f"Contour features differ from the reference loop on {pdf_path}")
+
+
+if __name__ == "__main__":
+    for path in sorted(glob.glob(os.path.join('Image', 'music*.pdf'))):
+        bench_score(path)
@@ -0,0 +1,69 @@
+"""Compare the mask-based dot pruning of draw_boundingbox with the original per-pixel loop on the bundled scores.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_draw_boundingbox
+"""
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from grayscalebinarize import render_and_binarize
+from staff_removal import process_array
+from note_events import draw_blob_records
+from note_head_detection import detect_noteheads
+from musicnote_identification import draw_boundingbox_array
+from pipeline import run_file_detectors
+
+
+def draw_boundingbox_loop(notehead_image, yellow_boxes):
+    """The original per-pixel implementation, kept as the reference for correctness and timing."""
+    for i in range(notehead_image.shape[0]):
+        for j in range(notehead_image.shape[1]):
+            pixel = notehead_image[i, j]
+            if np.array_equal(pixel, [0, 0, 255]) or np.array_equal(pixel, [0, 255, 0]):
+                inside_bbox = False
+                for (bx, by, bw, bh) in yellow_boxes:
+                    if bx <= j <= bx + bw and by <= i <= by + bh:
+                        inside_bbox = True
+                        break
+                if not inside_bbox:
+                    notehead_image[i, j] = [255, 255, 255]
+    return notehead_image
+
+
+def bench_score(pdf_path, repeats=5):
+    _, binarized_array = render_and_binarize(pdf_path)
+    _, _, page_without_staff = process_array(binarized_array)
+    notehead_image = draw_blob_records(cv2.cvtColor(page_without_staff, cv2.COLOR_GRAY2BGR),
+                                       detect_noteheads(page_without_staff))
+    _, bar_boxes_img = run_file_detectors(page_without_staff)
+
+    start = time.perf_counter()
+    vectorized, yellow_boxes = draw_boundingbox_array(bar_boxes_img, notehead_image.copy())
+    for _ in range(repeats - 1):
+        draw_boundingbox_array(bar_boxes_img, notehead_image.copy())
+    vectorized_time = (time.perf_counter() - start) / repeats
+
+    if vectorized is None:
+        print(f"{pdf_path}: no bar bounding boxes found, skipping")
+        return
+
+    start = time.perf_counter()
+    reference = draw_boundingbox_loop(notehead_image.copy(), yellow_boxes)
+    loop_time = time.perf_counter() - start
+
+    identical = np.array_equal(vectorized, reference)
+    print(f"{os.path.basename(pdf_path)}: {notehead_image.shape[1]}x{notehead_image.shape[0]} px, "
+          f"loop {loop_time * 1000:.1f} ms, mask {vectorized_time * 1000:.2f} ms, "
+          f"speedup {loop_time / vectorized_time:.0f}x, identical output: {identical}")
+    if not identical:
+        raise AssertionError(f"Mask-based pruning differs from the reference loop on {pdf_path}")
+
+
+if __name__ == "__main__":
+    for path in sorted(glob.glob(os.path.join('Image', 'music*.pdf'))):
+        bench_score(path)
@@ -0,0 +1,66 @@
+"""Compare the np.lexsort serialisation of timeline.timeline_to_midi with sorting the note events in Python, on a
+synthetic score of many systems.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_timeline
+"""
+import time
+
+import numpy as np
+
+from timeline import TIMELINE_DTYPE, timeline_to_midi
+
+
+def synthetic_timeline(systems=2000, columns=32, seed=0):
+    """Random chords in both hands: every column of a system holds one to three notes per staff."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    onset = 0.0
+    for system in range(systems):
+        for column in range(columns):
+            for track in (0, 1):
+                duration = float(rng.choice([0.5, 1.0, 2.0]))
+                for pitch in rng.choice(np.arange(48, 84), size=rng.integers(1, 4), replace=False).tolist():
+                    rows.append((onset, duration, track, pitch, 2 * system + track, column * 20))
+            onset += 1.0
+    return np.array(rows, dtype=TIMELINE_DTYPE)
+
+
+def events_loop(timeline, ticks_per_beat=480):
+    """Reference: (track, delta, kind, pitch) of every event, sorted with Python tuples."""
+    events = []
+    for onset, duration, track, pitch, _, _ in timeline.tolist():
+        on = int(round(onset * ticks_per_beat))
+        events.append((track, on, 1, pitch))
+        events.append((track, on + int(round(duration * ticks_per_beat)), 0, pitch))
+    events.sort()
+    rows = []
+    previous = {}
+    for track, tick, kind, pitch in events:
+        rows.append((track, tick - previous.get(track, 0), kind, pitch))
+        previous[track] = tick
+    return rows
+
+
+def events_midi(midi):
+    return [(track_index, message.time, int(message.type == 'note_on'), message.note)
+            for track_index, track in enumerate(midi.tracks) for message in track if not message.is_meta]
+
+
+if __name__ == "__main__":
+    timeline = synthetic_timeline()
+
+    start = time.perf_counter()
+    reference = events_loop(timeline)
+    loop_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    midi = timeline_to_midi(timeline)
+    lexsort_time = time.perf_counter() - start
+
+    identical = events_midi(midi) == reference
+    print(f"{len(timeline)} notes: Python sort {loop_time * 1000:.1f} ms, "
+          f"timeline_to_midi {lexsort_time * 1000:.1f} ms (including MIDI messages), identical events: {identical}")
+    if not identical:
+        raise AssertionError("timeline_to_midi events differ from the reference sort")
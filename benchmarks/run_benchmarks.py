@@ -0,0 +1,172 @@
+"""Benchmark every pipeline stage and the end-to-end conversion on the bundled scores.
+
+Besides Image/music*.pdf, larger pages are built from each score: the binarized page tiled vertically
+(more staves per page) and the page rendered at a higher resolution. Each case reports the median time of every
+stage over a number of repeats, with pages per second and notes per second.
+
+Run from the repository root:
+
+    python -m benchmarks.run_benchmarks --save-baseline      # record benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --max-slowdown 15    # fail if a stage got more than 15 % slower
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import main
+from grayscalebinarize import render_and_binarize
+from instrumentation import StageRecorder
+from pipeline import isolated_workspace, process_binarized
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def tile_staves(binarized_array, copies):
+    """Stack the page vertically so it holds `copies` times as many staves."""
+    return np.vstack([binarized_array] * copies)
+
+
+def summarise(runs):
+    """Median wall time per stage over the recorded runs, plus throughput for the whole run. Each run is
+    (recorder, notes, seconds), timed around the whole run: the detector stages overlap and some stages nest
+    others, so the stage times do not add up to it."""
+    stage_times = {}
+    for recorder, _, _ in runs:
+        for name, total in recorder.report()['totals'].items():
+            stage_times.setdefault(name, []).append(total['wall_s'])
+
+    stages = {name: statistics.median(times) for name, times in stage_times.items()}
+    total = statistics.median(seconds for _, _, seconds in runs)
+    notes = runs[0][1]
+    return {
+        'stages': stages,
+        'total_s': total,
+        'pages_per_s': 1 / total if total > 0 else None,
+        'notes_per_s': notes / total if total > 0 else None,
+        'notes': notes,
+    }
+
+
+def count_notes(result):
+    return len(result['notes_data']) if result is not None else 0
+
+
+def bench_end_to_end(score_name, repeats, repo_root):
+    """Time main.main() in in-memory mode on Image/<score_name>.pdf. The runs happen in a scratch workspace
+    that links to the bundled Image folder, so the tracked stage folders and midi_files are left alone."""
+    runs = []
+    with isolated_workspace():
+        os.symlink(os.path.join(repo_root, 'Image'), 'Image')
+        for _ in range(repeats):
+            recorder = StageRecorder()
+            start = time.perf_counter()
+            result = main.main(score_name, in_memory=True, recorder=recorder)
+            runs.append((recorder, count_notes(result), time.perf_counter() - start))
+    return summarise(runs)
+
+
+def bench_page(binarized_array, repeats):
+    """Time the stages from staff removal onwards on a binarized page array."""
+    runs = []
+    for _ in range(repeats):
+        recorder = StageRecorder()
+        start = time.perf_counter()
+        result = process_binarized(binarized_array, recorder=recorder)
+        runs.append((recorder, count_notes(result), time.perf_counter() - start))
+    return summarise(runs)
+
+
+def run_cases(repeats, tile_copies, dpi):
+    results = {}
+    repo_root = os.getcwd()
+
+    for pdf_path in sorted(glob.glob(os.path.join('Image', 'music*.pdf'))):
+        score_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        print(f"Benchmarking {score_name}...")
+
+        results[f"{score_name}/end_to_end"] = bench_end_to_end(score_name, repeats, repo_root)
+
+        _, binarized_array = render_and_binarize(os.path.join(repo_root, pdf_path))
+        _, high_dpi_array = render_and_binarize(os.path.join(repo_root, pdf_path), dpi=dpi)
+        # Synthetic pages run in a scratch workspace so the bundled stage folders are left alone
+        with isolated_workspace():
+            results[f"{score_name}/tiled_x{tile_copies}"] = bench_page(tile_staves(binarized_array, tile_copies),
+                                                                       repeats)
+            results[f"{score_name}/dpi_{dpi}"] = bench_page(high_dpi_array, repeats)
+
+    return results
+
+
+def compare(results, baseline, max_slowdown, min_time):
+    """Return a list of regression messages for stages more than max_slowdown percent slower than baseline.
+    Stages faster than min_time seconds in the baseline are too noisy to compare and are skipped."""
+    regressions = []
+    for case, summary in results.items():
+        base_case = baseline.get(case)
+        if base_case is None:
+            continue
+        for name, seconds in summary['stages'].items():
+            base_seconds = base_case['stages'].get(name)
+            if base_seconds is None or base_seconds < min_time:
+                continue
+            slowdown = (seconds - base_seconds) / base_seconds * 100
+            if slowdown > max_slowdown:
+                regressions.append(f"{case} {name}: {base_seconds * 1000:.1f} ms -> {seconds * 1000:.1f} ms "
+                                   f"(+{slowdown:.0f} %)")
+    return regressions
+
+
+def print_results(results):
+    for case, summary in results.items():
+        print(f"\n{case}: {summary['total_s'] * 1000:.1f} ms, {summary['pages_per_s']:.2f} pages/s, "
+              f"{summary['notes_per_s']:.1f} notes/s ({summary['notes']} notes)")
+        for name, seconds in summary['stages'].items():
+            print(f"  {name:<20} {seconds * 1000:9.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the OMR pipeline on the bundled scores.")
+    parser.add_argument('--repeats', type=int, default=3, help="Runs per case; the median is reported")
+    parser.add_argument('--tile', type=int, default=4, help="Vertical copies of the page for the tiled case")
+    parser.add_argument('--dpi', type=int, default=144, help="Render resolution of the high-resolution case")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--max-slowdown', type=float, default=20.0,
+                        help="Fail when a stage is more than this many percent slower than the baseline")
+    parser.add_argument('--min-time', type=float, default=0.005,
+                        help="Ignore stages that took less than this many seconds in the baseline")
+    parser.add_argument('--output', default=None, help="Also save the results as JSON to this path")
+    args = parser.parse_args()
+
+    bench_results = run_cases(args.repeats, args.tile, args.dpi)
+    print_results(bench_results)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(bench_results, output_file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(bench_results, baseline_file, indent=2)
+        print(f"\nBaseline saved to: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one.")
+        sys.exit(0)
+
+    with open(args.baseline) as baseline_file:
+        found = compare(bench_results, json.load(baseline_file), args.max_slowdown, args.min_time)
+
+    if found:
+        print(f"\nStages more than {args.max_slowdown:.0f} % slower than the baseline:")
+        for message in found:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo stage is more than {args.max_slowdown:.0f} % slower than the baseline.")
@@ -0,0 +1,116 @@
+import cv2
+import numpy as np
+
+# One row per outer contour of an image, in the order findContours(RETR_EXTERNAL) returns them. Every feature
+# but the hull ones is computed for all contours at once from their concatenated points; the convex hull is only
+# taken for the rows the caller asks for.
+#   x, y, w, h:     bounding box, the same as cv2.boundingRect of the contour
+#   cx, cy:         box centre (x + w // 2, y + h // 2)
+#   area:           cv2.contourArea of the contour
+#   perimeter:      cv2.arcLength of the closed contour
+#   circularity:    4 pi area / perimeter^2 (0 for a zero perimeter)
+#   solidity:       area / convex hull area (0 without a hull or when the hull was not taken)
+#   completeness:   perimeter / convex hull perimeter (0 without a hull or when the hull was not taken)
+#   mx, my:         centroid from cv2.moments of the contour (-1 when its area moment is 0)
+FEATURE_DTYPE = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('w', np.int32),
+    ('h', np.int32),
+    ('cx', np.int32),
+    ('cy', np.int32),
+    ('area', np.float64),
+    ('perimeter', np.float64),
+    ('circularity', np.float64),
+    ('solidity', np.float64),
+    ('completeness', np.float64),
+    ('mx', np.int32),
+    ('my', np.int32),
+])
+
+
+def aspect_ratio(features):
+    """Long side of the box over its short side."""
+    w, h = features['w'].astype(np.float64), features['h'].astype(np.float64)
+    return np.maximum(w, h) / np.minimum(w, h)
+
+
+def outer_contours(image):
+    """cv2.findContours(RETR_EXTERNAL, CHAIN_APPROX_SIMPLE) of the nonzero pixels of a grey or colour image."""
+    foreground = np.asarray(image) != 0
+    if foreground.ndim == 3:
+        foreground = foreground.any(axis=2)
+    contours, _ = cv2.findContours(foreground.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return contours
+
+
+def polygon_features(contours, features):
+    """Fill the box, area, perimeter, circularity and moment centroid of every contour. The closed polygons are
+    laid end to end and each sum of cv2.contourArea, cv2.arcLength and cv2.moments is one reduceat over them."""
+    lengths = np.array([len(contour) for contour in contours])
+    starts = np.cumsum(lengths) - lengths
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.float64)
+    x, y = points[:, 0], points[:, 1]
+
+    # Each point's predecessor along its own closed contour, so edge i runs into point i as cv2 walks it
+    previous = np.arange(-1, len(points) - 1)
+    previous[starts] = starts + lengths - 1
+    prev_x, prev_y = x[previous], y[previous]
+
+    left, top = np.minimum.reduceat(x, starts), np.minimum.reduceat(y, starts)
+    features['x'], features['y'] = left, top
+    features['w'] = np.maximum.reduceat(x, starts) - left + 1
+    features['h'] = np.maximum.reduceat(y, starts) - top + 1
+    features['cx'] = features['x'] + features['w'] // 2
+    features['cy'] = features['y'] + features['h'] // 2
+
+    # Green's theorem over the polygon edges, as cv2.moments sums them
+    cross = prev_x * y - x * prev_y
+    a00 = np.add.reduceat(cross, starts)
+    a10 = np.add.reduceat((x + prev_x) * cross, starts)
+    a01 = np.add.reduceat((y + prev_y) * cross, starts)
+    # cv2.arcLength takes each edge length in single precision and sums them in double, in this order
+    edges = np.sqrt(((x - prev_x) ** 2 + (y - prev_y) ** 2).astype(np.float32)).astype(np.float64)
+    perimeter = np.add.reduceat(edges, starts)
+
+    area = np.abs(a00) * 0.5
+    features['area'] = area
+    features['perimeter'] = perimeter
+    features['circularity'] = np.divide(4 * np.pi * area, perimeter ** 2, out=np.zeros_like(area),
+                                        where=perimeter > 0)
+
+    # cv2.moments orients every contour to a positive area and leaves the moments 0 below FLT_EPSILON
+    has_area = np.abs(a00) > np.finfo(np.float32).eps
+    sign = np.where(a00 > 0, 1.0, -1.0)
+    m00 = a00 * (sign * 0.5)
+    for name, moment in (('mx', a10), ('my', a01)):
+        centroid = np.divide(moment * (sign / 6), m00, out=np.full_like(m00, -1), where=has_area)
+        features[name] = centroid.astype(np.int32)
+
+
+def contour_features(image, hull=None):
+    """Feature table (FEATURE_DTYPE) of the outer contours of the nonzero pixels of an image, in findContours
+    order.
+
+    The image is traced once, and the box, area, perimeter, circularity and moment centroid of all contours come
+    from batch sums over their points. hull, if given, takes that table and returns a boolean mask of the rows
+    whose convex hull features (solidity, completeness) are wanted; hull=True takes them for every row.
+    """
+    contours = outer_contours(image)
+    features = np.zeros(len(contours), dtype=FEATURE_DTYPE)
+    if not contours:
+        return features
+    polygon_features(contours, features)
+
+    if not hull:
+        return features
+    wanted = np.ones(len(features), dtype=bool) if hull is True else hull(features)
+    for i in np.flatnonzero(wanted).tolist():
+        convex_hull = cv2.convexHull(contours[i])
+        hull_area = cv2.contourArea(convex_hull)
+        hull_perimeter = cv2.arcLength(convex_hull, True)
+        row = features[i]
+        row['solidity'] = row['area'] / hull_area if hull_area > 0 else 0
+        row['completeness'] = row['perimeter'] / hull_perimeter if hull_perimeter > 0 else 0
+
+    return features
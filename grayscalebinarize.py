@@ -1,42 +1,74 @@
 import fitz
 from PIL import Image
+import numpy as np
 import os
 
 
-def pdf_to_grayscale_and_binarize(pdfpath, outputfolder, threshold=185):
+def count_pages(pdfpath):
+    """Return the number of pages in the PDF."""
+    with fitz.open(pdfpath) as pdf_document:
+        return len(pdf_document)
+
+
+def render_pixmap(pdfpath, page_number=0, dpi=None):
+    """Render one PDF page straight to a single-channel grayscale pixmap, or return None if the PDF has no
+    pages. dpi=None keeps the PDF's default resolution of 72 DPI."""
     print(f"Processing PDF: {pdfpath}")
 
     # Open the PDF file
-    pdf_document = fitz.open(pdfpath)
-
-    # Check if the PDF has at least one page
-    if len(pdf_document) == 0:
-        print("The PDF has no pages.")
-        return None
+    with fitz.open(pdfpath) as pdf_document:
+        # Check if the PDF has at least one page
+        if len(pdf_document) == 0:
+            print("The PDF has no pages.")
+            return None
 
-    # Process only the first page (page index 0)
-    page_number = 0
-    page = pdf_document.load_page(page_number)
-    pix = page.get_pixmap()
-    # Assuming pix is an object that has width, height, and samples attributes
-    width, height = pix.width, pix.height
-    mode = "RGB"
-    data = pix.samples
+        page = pdf_document.load_page(page_number)
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
 
     print(f"Loaded page {page_number + 1} from the PDF.")
+    print(f"Original image size: {(pix.width, pix.height)} at {dpi or 72} DPI")
+    return pix
+
+
+def pixmap_to_array(pix):
+    """Wrap the samples of a grayscale pixmap as a NumPy array without copying them.
+
+    The array shares the pixmap's memory, so the pixmap must be kept alive for as long as the array is used.
+    """
+    samples = np.frombuffer(pix.samples_mv, dtype=np.uint8)
+    return samples.reshape(pix.height, pix.stride)[:, :pix.width]
+
 
-    # Convert pixmap to a PIL Image
-    # Convert width and height to a tuple
-    img = Image.frombytes(mode, (width, height), data)
-    print(f"Original image size: {img.size}")
+def render_page(pdfpath, page_number=0, dpi=None):
+    """Render one PDF page and return it as a grayscale NumPy array, or None if the PDF has no pages."""
+    pix = render_pixmap(pdfpath, page_number, dpi)
+    if pix is None:
+        return None
+
+    # Copy out of the pixmap, whose memory is freed with it
+    return pixmap_to_array(pix).copy()
 
-    # Convert to grayscale
-    gray_img = img.convert("L")
-    print("Converted image to grayscale.")
 
-    # Binarize the grayscale image
-    binarized_img = gray_img.point(lambda p: p > threshold and 255)
+def binarize(gray_array, threshold=185):
+    """Set pixels brighter than the threshold to 255 and all others to 0."""
+    binarized_array = np.where(gray_array > threshold, np.uint8(255), np.uint8(0))
     print(f"Binarized image with threshold {threshold}.")
+    return binarized_array
+
+
+def render_and_binarize(pdfpath, threshold=185, page_number=0, dpi=None):
+    """Render one PDF page and return its grayscale and binarized images as NumPy arrays."""
+    gray_array = render_page(pdfpath, page_number, dpi)
+    if gray_array is None:
+        return None, None
+
+    return gray_array, binarize(gray_array, threshold)
+
+
+def pdf_to_grayscale_and_binarize(pdfpath, outputfolder, threshold=185, page_number=0, dpi=None):
+    gray_array, binarized_array = render_and_binarize(pdfpath, threshold, page_number, dpi)
+    if gray_array is None:
+        return None
 
     # Create the output folder if it does not exist
     if not os.path.exists(outputfolder):
@@ -46,13 +78,13 @@ def pdf_to_grayscale_and_binarize(pdfpath, outputfolder, threshold=185):
     # Save the grayscale image
     grayscale_image_path = os.path.join(outputfolder,
                                         f"{os.path.basename(pdfpath).replace('.pdf', '')}_pg_{page_number + 1}_GS.png")
-    gray_img.save(grayscale_image_path)
+    Image.fromarray(gray_array).save(grayscale_image_path)
     print(f"Saved grayscale image to: {grayscale_image_path}")
 
     # Save the binarized image
     binarizedimagepath = os.path.join(outputfolder,
                                       f"{os.path.basename(pdfpath).replace('.pdf', '')}_pg_{page_number + 1}_BN.png")
-    binarized_img.save(binarizedimagepath)
+    Image.fromarray(binarized_array).save(binarizedimagepath)
     print(f"Saved binarized image to: {binarizedimagepath}")
 
     return binarizedimagepath
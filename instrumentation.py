@@ -0,0 +1,154 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None where the platform does not report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageRecorder:
+    """Records wall time, CPU time and memory for each pipeline stage.
+
+    Timing and peak RSS cost a few microseconds per stage, so a recorder can stay enabled in production.
+    With track_arrays=True, tracemalloc also records the peak Python/NumPy allocation of every stage; this is
+    noticeably slower and meant for investigations.
+
+    Stages may run at the same time in different threads (see scheduler.run_tasks), so cpu_s is the CPU time
+    of the thread that ran the stage (time.thread_time), not of the whole process. The tracemalloc peak and
+    the peak RSS are process-wide: a stage that overlapped another stage, in any thread, is recorded with
+    overlapped=True and without array_peak_mb, since its peak would include the other stage's allocations.
+    Run the detectors with parallel=False (--sequential) for per-stage array peaks.
+    """
+
+    def __init__(self, track_arrays=False):
+        self.track_arrays = track_arrays
+        self.stages = []
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+        # Whether each running stage has overlapped another one so far, by stage token
+        self.active = {}
+        if track_arrays and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def enter(self):
+        """Register a starting stage and return its token. Every running stage now overlaps this one."""
+        token = object()
+        with self.lock:
+            overlapped = bool(self.active)
+            for other in self.active:
+                self.active[other] = True
+            self.active[token] = overlapped
+            # The tracemalloc peak is only reset when no other stage is measuring it
+            if self.track_arrays and not overlapped:
+                tracemalloc.reset_peak()
+        return token
+
+    def leave(self, token):
+        """Unregister a finished stage and return whether it overlapped another stage."""
+        with self.lock:
+            return self.active.pop(token)
+
+    @contextlib.contextmanager
+    def stage(self, name, **info):
+        """Time the enclosed block as one stage. Extra keyword arguments are stored with the stage."""
+        token = self.enter()
+        if self.track_arrays:
+            traced_start = tracemalloc.get_traced_memory()[0]
+        rss_start = peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield info
+        finally:
+            wall_end = time.perf_counter()
+            cpu_s = time.thread_time() - cpu_start
+            traced_peak = tracemalloc.get_traced_memory()[1] if self.track_arrays else None
+            overlapped = self.leave(token)
+            record = {
+                'name': name,
+                'start_s': wall_start - self.origin,
+                'wall_s': wall_end - wall_start,
+                'cpu_s': cpu_s,
+                'peak_rss_mb': peak_rss_mb(),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'overlapped': overlapped,
+            }
+            if rss_start is not None:
+                record['rss_growth_mb'] = record['peak_rss_mb'] - rss_start
+            if self.track_arrays and not overlapped:
+                record['array_peak_mb'] = (traced_peak - traced_start) / (1024 * 1024)
+            record.update(info)
+            with self.lock:
+                self.stages.append(record)
+
+    def merge(self, stages, origin=None, **info):
+        """Add stages recorded by another recorder (for example in a worker process), tagging them with info.
+        Passing that recorder's origin puts its stages on this recorder's timeline; perf_counter is a
+        system-wide monotonic clock, so this also holds across processes."""
+        offset = origin - self.origin if origin is not None else 0.0
+        with self.lock:
+            self.stages.extend(dict(stage, start_s=stage['start_s'] + offset, **info) for stage in stages)
+
+    def report(self):
+        """Return the recorded stages and their totals as a JSON-serialisable dict."""
+        totals = {}
+        for stage in self.stages:
+            total = totals.setdefault(stage['name'], {'wall_s': 0.0, 'cpu_s': 0.0, 'count': 0})
+            total['wall_s'] += stage['wall_s']
+            total['cpu_s'] += stage['cpu_s']
+            total['count'] += 1
+
+        return {
+            'total_wall_s': time.perf_counter() - self.origin,
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+            'totals': totals,
+        }
+
+    def save_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+        print(f"Stage timing report saved to: {path}")
+
+    def save_chrome_trace(self, path):
+        """Write the stages in the Chrome trace event format (open with chrome://tracing or Perfetto)."""
+        events = []
+        for stage in self.stages:
+            args = {key: value for key, value in stage.items()
+                    if key not in ('name', 'start_s', 'wall_s', 'pid', 'tid')}
+            events.append({
+                'name': stage['name'],
+                'ph': 'X',
+                'ts': stage['start_s'] * 1e6,
+                'dur': stage['wall_s'] * 1e6,
+                'pid': stage['pid'],
+                'tid': stage['tid'],
+                'args': args,
+            })
+
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        print(f"Chrome trace saved to: {path}")
+
+
+def stage(recorder, name, **info):
+    """recorder.stage(name) when a recorder is given, otherwise a context manager that does nothing."""
+    if recorder is None:
+        return contextlib.nullcontext(info)
+    return recorder.stage(name, **info)
@@ -8,20 +8,64 @@ from stem_detection import stem_detect
 from beam_detection import beam_detect
 from bar_lines_detection import bar_detect
 from musicnote_identification import (
+    bars_to_notes_data,
     draw_yellow_line_on_beam,
     draw_boundingbox,
+    group_notes_into_bars,
     identify_notes,
 )
-from pitch_identification import read_results_file_and_create_folder, process_notes_with_staffs
-from map_notes_to_midi import parse_notes, parse_clef_classification, assign_clef_to_notes, create_piano_midi
+from pitch_identification import process_notes_with_staffs
+from map_notes_to_midi import notes_from_processed, parse_clef_classification, assign_clef_to_notes, create_piano_midi
+from note_tables import save_processed_notes
+from pipeline import run_pipeline, run_pipeline_pages, run_pipeline_cached, stream_pipeline
+from result_cache import ResultCache
+from instrumentation import StageRecorder
+from artifacts import FULL, LEVELS, SUMMARY, ArtifactSink, parse_level
+from scheduler import task, run_tasks
 import argparse
 
 
 
-def main(pdf_filename):
+def main(pdf_filename, in_memory=False, debug=False, all_pages=False, workers=None, recorder=None, cache=None,
+         dpi=None, parallel=True, strips=False, stream=False, polyphonic=False, runlength=False):
     # Paths
     pdf_path = f'Image/{pdf_filename}.pdf'
 
+    # With a result cache, repeated conversions of the same PDF and parameters skip the pipeline. A hit runs no
+    # stage, so there are no debug artifacts or MIDI chunks to give out; the cached path is always in memory
+    if cache is not None:
+        if parse_level(debug) or stream:
+            raise ValueError("cache cannot be combined with debug artifacts or stream")
+        return run_pipeline_cached(pdf_path, cache, pdf_filename, all_pages=all_pages, max_workers=workers,
+                                   recorder=recorder, dpi=dpi, strips=strips, polyphonic=polyphonic,
+                                   runlength=runlength, parallel=parallel)
+
+    # debug is a debug flag or an artifact level name ('none', 'summary', 'full')
+    debug = parse_level(debug)
+
+    # Streaming mode hands out the MIDI one chunk per staff, a page at a time as each page is recognised; the
+    # polyphonic timeline needs whole systems, so it cannot be streamed
+    if stream:
+        if polyphonic:
+            raise ValueError("stream cannot be combined with polyphonic")
+        for page_number, bar, chunk in stream_pipeline(pdf_path, pdf_filename, all_pages=all_pages,
+                                                       max_workers=workers, dpi=dpi, recorder=recorder,
+                                                       parallel=parallel, strips=strips, runlength=runlength):
+            print(f"MIDI chunk {chunk.index}: page {page_number + 1}, staff {bar}, "
+                  f"starts at {chunk.start_seconds:.2f} s ({len(chunk.data)} bytes)")
+        return None
+
+    # Multi-page mode runs the in-memory pipeline for every page in a process pool
+    if all_pages:
+        return run_pipeline_pages(pdf_path, pdf_filename, max_workers=workers,
+                                  debug_dir=f'debug_{pdf_filename}' if debug else None, recorder=recorder, dpi=dpi,
+                                  debug_level=debug, strips=strips, polyphonic=polyphonic, runlength=runlength)
+
+    # In-memory mode passes arrays between stages and only writes debug images when asked to
+    if in_memory:
+        return run_pipeline(pdf_path, pdf_filename, debug=debug, recorder=recorder, dpi=dpi, parallel=parallel,
+                            strips=strips, polyphonic=polyphonic, runlength=runlength)
+
     output_folder = 'processed_images'
     notehead_folder = 'notehead_images'
     bar_folder = 'bar_line_images'
@@ -36,16 +80,20 @@ def main(pdf_filename):
         cropped_image_path_with_staff, cropped_image_path_without_staff = process_image(binarized_image_path)
 
         if cropped_image_path_without_staff:
-            crop_clef(cropped_image_path_without_staff)
-            # Note detection step starts here
-            print("Running notehead detection...")
-            notes_detect(cropped_image_path_without_staff)
-            stem_detect(cropped_image_path_without_staff)
-            beam_detect(cropped_image_path_without_staff)
-            bar_detect(cropped_image_path_without_staff)
+            # The detectors and the staff line search only read their input image and write to their own
+            # folders, so they run at the same time
+            print("Running clef, notehead, stem, beam and bar detection...")
+            detected = run_tasks([
+                task('clef', crop_clef, cropped_image_path_without_staff),
+                task('notehead', notes_detect, cropped_image_path_without_staff),
+                task('stem', stem_detect, cropped_image_path_without_staff),
+                task('beam', beam_detect, cropped_image_path_without_staff),
+                task('bar', bar_detect, cropped_image_path_without_staff),
+                task('staff_lines', getstafflinerow, process_image_path, "outputstaffline.png"),
+            ], recorder=recorder, parallel=parallel)
 
             # Get staff line row indexes
-            staff_line_rows, total_staff_lines = getstafflinerow(process_image_path, "outputstaffline.png")
+            staff_line_rows, total_staff_lines = detected['staff_lines']
             print(f"Total Staff Lines Detected: {total_staff_lines}")
             print(f"Staff Line Row Indexes: {staff_line_rows}")  # You can now use this in other functions
 
@@ -58,17 +106,21 @@ def main(pdf_filename):
                 # Now draw the yellow beam lines on the notehead image based on lines.png
                 modified_image = draw_yellow_line_on_beam('beam_images/lines.png', processed_image)
 
-            # Identify crochets (green dots) and quavers (green dots with yellow beam lines)
+            # Identify crochets (green dots) and quavers (green dots with yellow beam lines). The notes table is
+            # passed on in memory; its .npz and text views are only written at the summary and full artifact levels
             print("Identifying crochets and quavers...")
-            identify_notes(modified_image, note_classification_output_folder)
-
-            # Read the results file and get the notes data and total number of bars
-            notes_data, num_bars = read_results_file_and_create_folder('note_identification/results.txt')
+            tables = ArtifactSink(debug, background=False)
+            notes = identify_notes(modified_image, note_classification_output_folder, tables)[-1]
+            notes_data, num_bars = bars_to_notes_data(group_notes_into_bars(notes))
 
             # Process the notes with the staff lines
-            process_notes_with_staffs(notes_data, staff_line_rows, num_bars)
+            processed_notes = process_notes_with_staffs(notes_data, staff_line_rows, num_bars,
+                                                        'processed_notes.txt' if tables.wants(FULL) else None)
+            if tables.wants(SUMMARY):
+                save_processed_notes('processed_notes.npz', processed_notes)
+
             # Process MIDI file creation
-            notes = parse_notes('processed_notes.txt')
+            notes = notes_from_processed(processed_notes)
             clefs = parse_clef_classification('clef_images/clef_classification.txt')
             assigned_notes = assign_clef_to_notes(notes, clefs)
 
@@ -78,6 +130,66 @@ def main(pdf_filename):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process a music PDF file.")
     parser.add_argument('filename', type=str, help="The name of the music PDF file (without extension)")
+    parser.add_argument('--in-memory', action='store_true',
+                        help="Pass images between stages in memory instead of through PNG files")
+    parser.add_argument('--debug', action='store_true',
+                        help="Also write the intermediate images in in-memory mode (same as --artifacts full)")
+    parser.add_argument('--artifacts', choices=sorted(LEVELS), default=None,
+                        help="Debug artifacts of the in-memory modes: none, summary (one result image per stage) "
+                             "or full (every intermediate image, written on a background thread). In file mode "
+                             "summary also writes the .npz note tables and full their text views")
+    parser.add_argument('--all-pages', action='store_true',
+                        help="Process every page of the PDF in parallel and combine them into one MIDI file")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes for --all-pages (default: number of CPUs)")
+    parser.add_argument('--profile', type=str, default=None,
+                        help="Save per-stage timing and memory as JSON to this path (implies --in-memory)")
+    parser.add_argument('--trace', type=str, default=None,
+                        help="Save per-stage timing as a Chrome trace to this path (implies --in-memory)")
+    parser.add_argument('--track-arrays', action='store_true',
+                        help="Also record the peak array memory of each stage with tracemalloc (slower); stages "
+                             "that ran alongside others get no peak, so combine with --sequential")
+    parser.add_argument('--cache', type=str, default=None,
+                        help="Folder of the result cache; a repeated conversion is served from it")
+    parser.add_argument('--cache-size-mb', type=int, default=512,
+                        help="Size limit of the result cache in MB (least recently used entries are evicted)")
+    parser.add_argument('--dpi', type=int, default=None,
+                        help="Render resolution for the in-memory modes (default: 72 DPI)")
+    parser.add_argument('--sequential', action='store_true',
+                        help="Run the independent detectors one after another instead of at the same time")
+    parser.add_argument('--strips', action='store_true',
+                        help="Run the detectors of the in-memory modes on one band per staff instead of the whole "
+                             "page, bounding their memory at high --dpi")
+    parser.add_argument('--runlength', action='store_true',
+                        help="Erase staff lines by vertical run length in the in-memory modes, which keeps notes and "
+                             "stems crossing thick scanned staff lines")
+    parser.add_argument('--stream', action='store_true',
+                        help="Emit the MIDI in one chunk per staff, page by page as the pages are recognised "
+                             "(with --all-pages the first page can play before the rest is done)")
+    parser.add_argument('--polyphonic', action='store_true',
+                        help="Time the notes of the in-memory modes from their x positions: chords, rests and both "
+                             "hands of a system play together instead of one note after another")
     args = parser.parse_args()
-
-    main(args.filename)
\ No newline at end of file
+    if args.cache and (args.debug or args.artifacts not in (None, 'none') or args.stream):
+        parser.error("--cache cannot be combined with --debug, --artifacts or --stream")
+    if args.stream and args.polyphonic:
+        parser.error("--stream cannot be combined with --polyphonic: the timeline needs whole systems")
+
+    result_cache = None
+    if args.cache:
+        result_cache = ResultCache(args.cache, max_bytes=args.cache_size_mb * 1024 * 1024)
+
+    stage_recorder = None
+    if args.profile or args.trace:
+        stage_recorder = StageRecorder(track_arrays=args.track_arrays)
+
+    main(args.filename, in_memory=args.in_memory or stage_recorder is not None,
+         debug=args.artifacts if args.artifacts is not None else args.debug,
+         all_pages=args.all_pages, workers=args.workers, recorder=stage_recorder, cache=result_cache,
+         dpi=args.dpi, parallel=not args.sequential, strips=args.strips,
+         stream=args.stream, polyphonic=args.polyphonic, runlength=args.runlength)
+
+    if args.profile:
+        stage_recorder.save_json(args.profile)
+    if args.trace:
+        stage_recorder.save_chrome_trace(args.trace)
\ No newline at end of file
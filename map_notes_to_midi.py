@@ -1,6 +1,10 @@
+import io
 import re
+from collections import namedtuple
 
-from mido import MidiFile
+import numpy as np
+
+from mido import Message, MetaMessage, MidiFile, MidiTrack, bpm2tempo, tick2second
 import os
 
 # Extended MIDI note mappings for treble and bass clefs
@@ -23,34 +27,100 @@ NOTE_TO_MIDI_BASS = {
 }
 
 
+# Note names of the staff positions written by process_notes_with_staffs, per clef
+POSITION_TO_NOTE = {
+    "treble": {
+        "On Line 1": "F#5", "Between Line 1 and Line 2": "E5",
+        "On Line 2": "D5", "Between Line 2 and Line 3": "C5",
+        "On Line 3": "B4", "Between Line 3 and Line 4": "A4",
+        "Between Line 4 and Line 3": "A4",
+        "On Line 4": "G4", "Between Line 4 and Line 5": "F#4",
+        "On Line 5": "E4", "Below Line 5": "D4", "Below Line": "C4",
+    },
+    "bass": {
+        "On Line 1": "A3", "Between Line 1 and Line 2": "G3",
+        "On Line 2": "F#3", "Between Line 2 and Line 3": "E3",
+        "On Line 3": "D3", "Between Line 3 and Line 4": "C3",
+        "On Line 4": "B2", "Between Line 4 and Line 5": "A2",
+        "On Line 5": "G2", "Below Line 5": "F2", "Between Line 4 and Line 3": "C3"
+    },
+}
+
+# Staff step model (see pitch_identification.staff_steps): step 0 is the top line, each step one line or space
+# lower. Pitches are counted diatonically as 7 * octave + letter (C = 0, ..., B = 6); the top line is F5 on the
+# treble staff and A3 on the bass staff.
+TOP_LINE_DIATONIC = {"treble": 5 * 7 + 3, "bass": 3 * 7 + 5}
+# Semitones of C, D, E, F, G, A, B above C, with the F sharp of the key signature the position maps above assume
+SCALE_SEMITONES = np.array([0, 2, 4, 6, 7, 9, 11])
+# Steps covered by the lookup table: up to five ledger lines above and below the staff
+MIN_STEP = -10
+MAX_STEP = 18
+
+
+def step_table(top_line_diatonic):
+    """MIDI number of every staff step from MIN_STEP to MAX_STEP for a staff with the given top line."""
+    diatonic = top_line_diatonic - np.arange(MIN_STEP, MAX_STEP + 1)
+    return 12 * (diatonic // 7 + 1) + SCALE_SEMITONES[diatonic % 7]
+
+
+# Row 0 treble, row 1 bass
+STEP_TO_MIDI = np.stack([step_table(TOP_LINE_DIATONIC["treble"]), step_table(TOP_LINE_DIATONIC["bass"])])
+
+
 # Function to map note positions to MIDI numbers
 def get_midi_number(note_position, clef):
     if clef == "treble":
-        position_map = {
-            "On Line 1": "F#5", "Between Line 1 and Line 2": "E5",
-            "On Line 2": "D5", "Between Line 2 and Line 3": "C5",
-            "On Line 3": "B4", "Between Line 3 and Line 4": "A4",
-            "Between Line 4 and Line 3": "A4",
-            "On Line 4": "G4", "Between Line 4 and Line 5": "F#4",
-            "On Line 5": "E4", "Below Line 5": "D4", "Below Line": "C4",
-        }
-        note = position_map.get(note_position, "C4")
+        note = POSITION_TO_NOTE["treble"].get(note_position, "C4")
         return NOTE_TO_MIDI_TREBLE.get(note, 60)
 
     elif clef == "bass":
-        position_map = {
-            "On Line 1": "A3", "Between Line 1 and Line 2": "G3",
-            "On Line 2": "F#3", "Between Line 2 and Line 3": "E3",
-            "On Line 3": "D3", "Between Line 3 and Line 4": "C3",
-            "On Line 4": "B2", "Between Line 4 and Line 5": "A2",
-            "On Line 5": "G2", "Below Line 5": "F2", "Between Line 4 and Line 3": "C3"
-        }
-        note = position_map.get(note_position, "C3")
+        note = POSITION_TO_NOTE["bass"].get(note_position, "C3")
         return NOTE_TO_MIDI_BASS.get(note, 48)
 
     return 60  # Default MIDI number
 
 
+def steps_to_midi(steps, bass):
+    """MIDI numbers of staff steps in one table lookup. bass is True for the notes on a bass staff; steps beyond
+    the table are clamped to its outermost ledger lines."""
+    index = np.clip(np.asarray(steps, dtype=np.intp), MIN_STEP, MAX_STEP) - MIN_STEP
+    return STEP_TO_MIDI[np.asarray(bass, dtype=np.intp), index]
+
+
+def bass_clef_mask(bar_numbers, clef_data):
+    """For each bar number, True if assign_clef_to_notes would give it the bass clef: the clef with the largest
+    index not above the bar number decides, and bars before every clef are treble."""
+    bar_numbers = np.asarray(bar_numbers, dtype=np.int64)
+    if not clef_data:
+        return np.zeros(len(bar_numbers), dtype=bool)
+
+    indices = np.array([int(index) for index, _, _, _ in clef_data], dtype=np.int64)
+    is_bass = np.array([clef_type != "T" for _, clef_type, _, _ in clef_data])
+    order = np.argsort(indices, kind='stable')
+    indices, is_bass = indices[order], is_bass[order]
+
+    last_clef = np.searchsorted(indices, bar_numbers, side='right') - 1
+    return (last_clef >= 0) & is_bass[np.maximum(last_clef, 0)]
+
+
+def assign_midi_from_steps(processed_notes, steps, clef_data):
+    """Array version of notes_from_processed + assign_clef_to_notes for the output of
+    pitch_identification.process_notes_with_steps: the clef and MIDI number of every note come from two array
+    lookups. Returns the same (bar_info, note_type, position_text, duration, clef, midi_number) tuples."""
+    bars = [bar for bar, _, _, _, _, _, _ in processed_notes]
+    bass = bass_clef_mask(bars, clef_data)
+    midi_numbers = steps_to_midi(steps, bass)
+
+    assigned_notes = [
+        (str(bar), note_type, position, float(duration), "bass" if is_bass else "treble", midi_number)
+        for (bar, note_type, _, _, _, position, duration), is_bass, midi_number in
+        zip(processed_notes, bass.tolist(), midi_numbers.tolist())
+    ]
+    print(f"Assigned clefs and MIDI numbers to {len(assigned_notes)} notes "
+          f"({int(bass.sum())} on bass staves)")
+    return assigned_notes
+
+
 def parse_clef_classification(file_path):
     clefs = []
 
@@ -132,6 +202,18 @@ def parse_notes(note_file):
     return notes
 
 
+def notes_from_processed(processed_notes):
+    """Build the same (bar_info, note_type, position_text, duration) tuples as parse_notes straight from
+    the list returned by process_notes_with_staffs, without the processed_notes.txt round-trip."""
+    notes = []
+
+    for bar, note_type, cx, cy, differences, position, duration in processed_notes:
+        position_text = f"Position: {position}" if position is not None else "Position: Unknown"
+        notes.append((str(bar), note_type, position_text, float(duration)))
+
+    return notes
+
+
 def assign_clef_to_notes(note_data, clef_data):
     assigned_notes = []
 
@@ -161,61 +243,101 @@ def assign_clef_to_notes(note_data, clef_data):
     return assigned_notes
 
 
-def create_midi_file(notes, file_name, ticks_per_beat=479):
-    from mido import Message, MidiFile, MidiTrack
-
-    midi = MidiFile(ticks_per_beat=ticks_per_beat)
-    track = MidiTrack()
-    midi.tracks.append(track)
-
-    for midi_note, duration in notes:
-        tick_duration = int(duration * ticks_per_beat)  # Convert duration to int
-
-        track.append(Message('note_on', note=midi_note, velocity=120, time=0))
-        track.append(Message('note_off', note=midi_note, velocity=120, time=tick_duration))
-
-    midi.save(file_name)
-    print(f"MIDI file saved: {file_name}")
-
-
-def merge_midi_files(treble_file, bass_file, output_file):
-    midi_combined = MidiFile()
-    treble_midi = MidiFile(treble_file)
-    bass_midi = MidiFile(bass_file)
-
-    midi_combined.tracks.append(treble_midi.tracks[0])  # Add treble track
-    midi_combined.tracks.append(bass_midi.tracks[0])  # Add bass track
-
-    midi_combined.save(output_file)
-
-
-def create_piano_midi(assigned_notes, pdf_filename, output_dir="midi_files"):
+# A piece of a streamed piano MIDI file: a standalone MIDI file (data) holding the notes of one staff or page,
+# to be played start_tick ticks (start_seconds seconds) after the start of the piece
+MidiChunk = namedtuple('MidiChunk', ['index', 'start_tick', 'start_seconds', 'data'])
+
+
+class PianoMidiStream:
+    """Builds the two-track (treble, bass) piano MIDI file of build_piano_midi piece by piece.
+
+    Each call to add() appends notes to the complete file (self.midi) and returns them as a MidiChunk, so a
+    client can start playing the first staves while later ones are still being recognised. The tracks play at
+    the same time, so every track keeps its own position; a chunk starts at the earliest position of the
+    tracks it adds to, and a track that starts later is delayed within the chunk.
+    """
+
+    def __init__(self, tempo=None, time_signature=None, ticks_per_beat=480):
+        self.ticks_per_beat = ticks_per_beat
+        self.tempo = bpm2tempo(tempo) if tempo is not None else 500000  # MIDI default: 120 BPM
+        self.header = []
+        if tempo is not None:
+            self.header.append(MetaMessage('set_tempo', tempo=self.tempo, time=0))
+        if time_signature is not None:
+            numerator, denominator = time_signature
+            self.header.append(MetaMessage('time_signature', numerator=numerator, denominator=denominator, time=0))
+
+        self.midi = MidiFile(ticks_per_beat=ticks_per_beat)
+        self.tracks = {"treble": MidiTrack(self.header), "bass": MidiTrack()}
+        self.midi.tracks.extend(self.tracks.values())
+        self.ticks = {"treble": 0, "bass": 0}
+        self.chunks = 0
+
+    def append(self, assigned_notes):
+        """Append the clef-assigned notes to the tracks. Returns ({clef: new messages}, {clef: start tick})."""
+        starts = dict(self.ticks)
+        messages = {"treble": [], "bass": []}
+        for bar, note_type, position, duration, clef, midi_note in assigned_notes:
+            track = self.tracks.get(clef)
+            if track is None:
+                continue
+            tick_duration = int(duration * self.ticks_per_beat)  # Convert duration to int
+            note = [Message('note_on', note=midi_note, velocity=120, time=0),
+                    Message('note_off', note=midi_note, velocity=120, time=tick_duration)]
+            track.extend(note)
+            messages[clef].extend(note)
+            self.ticks[clef] += tick_duration
+        return messages, starts
+
+    def add(self, assigned_notes):
+        """Append the notes and return them as the next MidiChunk."""
+        messages, starts = self.append(assigned_notes)
+        played = [clef for clef in messages if messages[clef]] or list(messages)
+        start = min(starts[clef] for clef in played)
+
+        chunk = MidiFile(ticks_per_beat=self.ticks_per_beat)
+        for clef, track_messages in messages.items():
+            track = MidiTrack(self.header if clef == "treble" else [])
+            if track_messages:
+                track.append(track_messages[0].copy(time=starts[clef] - start))
+                track.extend(track_messages[1:])
+            chunk.tracks.append(track)
+
+        self.chunks += 1
+        return MidiChunk(self.chunks - 1, start, tick2second(start, self.ticks_per_beat, self.tempo),
+                         midi_to_bytes(chunk))
+
+
+def build_piano_midi(assigned_notes, tempo=None, time_signature=None, ticks_per_beat=480):
+    """Build the two-track (treble, bass) piano MIDI file of the clef-assigned notes in memory, in one pass.
+
+    tempo is in beats per minute and time_signature a (numerator, denominator) tuple; both are written at the
+    start of the treble track when given (MIDI players assume 120 BPM and 4/4 otherwise).
+    """
+    stream = PianoMidiStream(tempo, time_signature, ticks_per_beat)
+    stream.append(assigned_notes)
+    return stream.midi
+
+
+def midi_to_bytes(midi):
+    """Serialise a MidiFile to bytes, e.g. to send it over HTTP without writing a file."""
+    buffer = io.BytesIO()
+    midi.save(file=buffer)
+    return buffer.getvalue()
+
+
+def create_piano_midi(assigned_notes, pdf_filename, output_dir="midi_files", tempo=None, time_signature=None):
+    """Write the piano MIDI file of the clef-assigned notes to output_dir/<pdf_filename>.mid and return its path."""
+    return save_piano_midi(build_piano_midi(assigned_notes, tempo, time_signature), pdf_filename, output_dir)
+
+
+def save_piano_midi(midi, pdf_filename, output_dir="midi_files"):
+    """Write a piano MidiFile to output_dir/<pdf_filename>.mid and return its path."""
     os.makedirs(output_dir, exist_ok=True)
 
     # Use the same name as the input PDF
-    output_file = f"{pdf_filename}.mid"
-    output_file_path = os.path.join(output_dir, output_file)
-
-    treble_file = os.path.join(output_dir, f"{pdf_filename}_treble.mid")
-    bass_file = os.path.join(output_dir, f"{pdf_filename}_bass.mid")
-
-    treble_notes = []
-    bass_notes = []
-
-    for note_data in assigned_notes:
-        bar, note_type, position, duration, clef, midi_note = note_data
-
-        if clef == "treble":
-            treble_notes.append((midi_note, duration))
-        elif clef == "bass":
-            bass_notes.append((midi_note, duration))
-
-    # Create separate MIDI files for treble and bass clefs
-    create_midi_file(treble_notes, treble_file)
-    create_midi_file(bass_notes, bass_file)
-
-    # Merge both MIDI files
-    merge_midi_files(treble_file, bass_file, output_file_path)
+    output_file_path = os.path.join(output_dir, f"{pdf_filename}.mid")
+    midi.save(output_file_path)
 
     print(f"Piano MIDI file created successfully: {output_file_path}")
 
@@ -2,6 +2,23 @@ import os
 import cv2
 import numpy as np
 
+from artifacts import FULL, NO_ARTIFACTS, SUMMARY
+from note_events import (
+    FILLED,
+    HOLLOW,
+    DOT_RADIUS,
+    boxes_from_mask,
+    dot_mask,
+    dot_raster,
+    draw_blob_records,
+    integral_image,
+    window_counts,
+    boxes_from_rects,
+    build_beam_index,
+    near_beam,
+)
+from note_tables import save_notes, notes_lines
+
 
 def draw_boundingbox(barboundbox_image_path, notehead_image_path):
     # Load the barboundbox image (with the green bounding boxes)
@@ -16,6 +33,12 @@ def draw_boundingbox(barboundbox_image_path, notehead_image_path):
         print(f"Error: Could not load {notehead_image_path}")
         return None, []  # Return None and an empty list if loading fails
 
+    return draw_boundingbox_array(barboundbox_image, notehead_image)
+
+
+def draw_boundingbox_array(barboundbox_image, notehead_image):
+    """Remove the red and green dots of the notehead image (modified in place) that lie outside every bar
+    bounding box of the barboundbox image."""
     # Define the lower and upper bounds for the green color in BGR format
     lower_green = np.array([0, 200, 0])  # Lower bound for green
     upper_green = np.array([100, 255, 100])  # Upper bound for green
@@ -38,46 +61,60 @@ def draw_boundingbox(barboundbox_image_path, notehead_image_path):
         yellow_boxes.append((x, y, w, h))
 
     # Now remove the dots outside of the bounding boxes
-    for i in range(notehead_image.shape[0]):
-        for j in range(notehead_image.shape[1]):
-            pixel = notehead_image[i, j]
-            # Check for red or green dots
-            if np.array_equal(pixel, [0, 0, 255]) or np.array_equal(pixel, [0, 255, 0]):
-                # Check if the pixel (i, j) is inside any of the bounding boxes
-                inside_bbox = False
-                for (bx, by, bw, bh) in yellow_boxes:
-                    if bx <= j <= bx + bw and by <= i <= by + bh:
-                        inside_bbox = True
-                        break
-                # If the dot is outside of any bounding box, set it to white (background)
-                if not inside_bbox:
-                    notehead_image[i, j] = [255, 255, 255]  # Set to white (or background color)
+    clear_dots_outside_boxes(notehead_image, yellow_boxes)
 
     # Return the processed notehead image and the yellow boxes
     return notehead_image, yellow_boxes
 
 
-def draw_yellow_line_on_beam(lines_image_path, notehead_image):
-    output_folder = 'note_identification'
-    os.makedirs(output_folder, exist_ok=True)  # Ensure folder exists
+def clear_dots_outside_boxes(notehead_image, boxes):
+    """Set every pure red or green pixel of the notehead image that lies outside all (x, y, w, h) boxes to
+    white, in place. Box edges are inclusive, so each box covers (w + 1) x (h + 1) pixels."""
+    # Masks of the red and green dot pixels (BGR)
+    red = (notehead_image[:, :, 0] == 0) & (notehead_image[:, :, 1] == 0) & (notehead_image[:, :, 2] == 255)
+    green = (notehead_image[:, :, 0] == 0) & (notehead_image[:, :, 1] == 255) & (notehead_image[:, :, 2] == 0)
 
-    # Load the detected beam lines image (grayscale)
-    lines_img = cv2.imread(lines_image_path, cv2.IMREAD_GRAYSCALE)
-    if lines_img is None:
-        print(f"Error: Could not load {lines_image_path}")
-        return notehead_image  # Return unmodified notehead image
+    # Rasterise the boxes into a single "inside any box" mask
+    inside_bbox = np.zeros(notehead_image.shape[:2], dtype=bool)
+    for bx, by, bw, bh in boxes:
+        inside_bbox[max(by, 0):by + bh + 1, max(bx, 0):bx + bw + 1] = True
 
+    # If the dot is outside of any bounding box, set it to white (background)
+    notehead_image[(red | green) & ~inside_bbox] = (255, 255, 255)
+
+    return notehead_image
+
+
+def apply_beam_lines(lines_img, notehead_image):
+    """Paint the beam pixels of a grayscale lines image yellow onto the notehead image in place.
+    Returns True if any beam pixel was found."""
     # Check for white pixels (beam lines) in lines.png
     y_positions, x_positions = np.where(lines_img > 200)
 
     if len(y_positions) == 0:
         print("No beam lines detected in lines.png.")
-        return notehead_image  # Return unmodified image
+        return False
 
     # Draw yellow lines on detected beam pixels
     for y, x in zip(y_positions, x_positions):
         notehead_image[y, x] = (0, 255, 255)  # Yellow color in BGR
 
+    return True
+
+
+def draw_yellow_line_on_beam(lines_image_path, notehead_image):
+    output_folder = 'note_identification'
+    os.makedirs(output_folder, exist_ok=True)  # Ensure folder exists
+
+    # Load the detected beam lines image (grayscale)
+    lines_img = cv2.imread(lines_image_path, cv2.IMREAD_GRAYSCALE)
+    if lines_img is None:
+        print(f"Error: Could not load {lines_image_path}")
+        return notehead_image  # Return unmodified notehead image
+
+    if not apply_beam_lines(lines_img, notehead_image):
+        return notehead_image  # Return unmodified image
+
     output_path = os.path.join(output_folder, 'yellow_line_beam.png')
     cv2.imwrite(output_path, notehead_image)
     print(f"Image saved with yellow lines to {output_path}")
@@ -85,7 +122,58 @@ def draw_yellow_line_on_beam(lines_image_path, notehead_image):
     return notehead_image  # Always return an image
 
 
-def identify_notes(modified_image, output_folder):
+def group_notes_into_bars(notes):
+    """Group (note_type, cx, cy) tuples into bars by vertical proximity, each bar ordered left to right."""
+    # Sort notes by Y-coordinate (to group by bars)
+    notes.sort(key=lambda Note: Note[2])  # Sort by center_y (vertical position)
+
+    # Group notes into bars based on vertical proximity
+    bars = []
+    current_bar = [notes[0]] if notes else []  # Start with the first note
+
+    for i in range(1, len(notes)):
+        if abs(notes[i][2] - notes[i - 1][2]) > 30:  # If y-difference > 30, start a new bar
+            bars.append(current_bar)
+            current_bar = [notes[i]]
+        else:
+            current_bar.append(notes[i])
+
+    if current_bar:
+        bars.append(current_bar)  # Append the last group
+
+    # Sort each bar by X-coordinate (left to right order)
+    for bar in bars:
+        bar.sort(key=lambda Note: Note[1])  # Sort by center_x
+
+    return bars
+
+
+def group_notes_by_staff(notes, staff_index, num_staves):
+    """Group (note_type, cx, cy) tuples by the staff each one was assigned to (staff_index, see strips.staff_of),
+    each group ordered left to right. A staff without notes gives an empty group, so bar n is always staff n."""
+    bars = [[] for _ in range(num_staves)]
+    for note, index in zip(notes, staff_index.tolist()):
+        bars[index].append(note)
+
+    for bar in bars:
+        bar.sort(key=lambda Note: Note[1])  # Sort by center_x
+
+    return bars
+
+
+def bars_to_notes_data(bars):
+    """Flatten grouped bars into the (bar_number, note_type, cx, cy) rows stored in results.npz."""
+    notes_data = [(bar_index, note[0], note[1], note[2])
+                  for bar_index, bar in enumerate(bars, start=1)
+                  for note in bar]
+    return notes_data, len(bars)
+
+
+def identify_notes(modified_image, output_folder=None, artifacts=None):
+    """Classify the colour-coded dots of the annotated image into notes. The annotated image is saved to
+    output_folder; the results.npz and results.txt views of the notes are only written there when the artifact
+    sink asks for them (SUMMARY and FULL). Returns the boxes of each note kind and the (note_type, cx, cy) notes."""
+    artifacts = artifacts or NO_ARTIFACTS
     hsv_image = cv2.cvtColor(modified_image, cv2.COLOR_BGR2HSV)
 
     # Define HSV ranges for green, yellow, and red
@@ -109,6 +197,14 @@ def identify_notes(modified_image, output_folder):
     green_contours, _ = cv2.findContours(green_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     yellow_contours, _ = cv2.findContours(yellow_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     red_contours, _ = cv2.findContours(red_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    # Bounding boxes of the yellow beams are computed once and indexed by x; every green notehead is then
+    # checked for a nearby beam (quaver) in a single batch query
+    beam_index = build_beam_index(boxes_from_rects([cv2.boundingRect(contour) for contour in yellow_contours]))
+    green_rects = [cv2.boundingRect(contour) for contour in green_contours]
+    green_quavers = near_beam(beam_index, [x + w // 2 for x, _, w, _ in green_rects],
+                              [y + h // 2 for _, y, _, h in green_rects])
+
     # Initialize variables before conditionals
     dot_x, dot_y, dot_w, dot_h = 0, 0, 0, 0  # Default values
     # Initialize lists to store results
@@ -119,21 +215,12 @@ def identify_notes(modified_image, output_folder):
     gray_image = cv2.cvtColor(modified_image, cv2.COLOR_BGR2GRAY)
 
     # Process green contours (crotchets, quavers, crotchet rests)
-    for contour in green_contours:
-        x, y, w, h = cv2.boundingRect(contour)
+    for (x, y, w, h), is_quaver in zip(green_rects, green_quavers):
         center_x, center_y = x + w // 2, y + h // 2
 
         # Draw bounding box
         cv2.rectangle(modified_image, (x, y), (x + w, y + h), (255, 0, 255), 2)  # Blue box
 
-        # Check if near yellow beam (quaver)
-        is_quaver = any(
-            bx - 10 <= center_x <= bx + bw + 20 and
-            (by + bh < center_y <= by + bh + 50 or by - 50 <= center_y <= by)
-            for yellow_contour in yellow_contours
-            for bx, by, bw, bh in [cv2.boundingRect(yellow_contour)]
-        )
-
         if is_quaver:
             note_type = "Quaver"
             cv2.putText(modified_image, "Q", (x, y - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (128, 0, 128), 1)
@@ -259,35 +346,15 @@ def identify_notes(modified_image, output_folder):
 
         # Add note details to the notes list
         notes.append((note_type, center_x, center_y))
-    # Sort notes by Y-coordinate (to group by bars)
-    notes.sort(key=lambda Note: Note[2])  # Sort by center_y (vertical position)
 
-    # Group notes into bars based on vertical proximity
-    bars = []
-    current_bar = [notes[0]] if notes else []  # Start with the first note
+    bars = group_notes_into_bars(notes)
 
-    for i in range(1, len(notes)):
-        if abs(notes[i][2] - notes[i - 1][2]) > 30:  # If y-difference > 30, start a new bar
-            bars.append(current_bar)
-            current_bar = [notes[i]]
-        else:
-            current_bar.append(notes[i])
-
-    if current_bar:
-        bars.append(current_bar)  # Append the last group
-
-    # Sort each bar by X-coordinate (left to right order)
-    for bar in bars:
-        bar.sort(key=lambda Note: Note[1])  # Sort by center_x
-
-    # Save sorted results to results.txt with bar information
-    results_file_path = os.path.join(output_folder, 'results.txt')
-    with open(results_file_path, 'w') as results_file:
-        results_file.write("Bar, Note Type, CX, CY\n")  # Write header
-
-        for bar_index, bar in enumerate(bars, start=1):
-            for note in bar:
-                results_file.write(f"{bar_index}, {note[0]}, {note[1]}, {note[2]}\n")
+    # Sorted results with bar information, as debug views only: the caller gets the notes themselves
+    if output_folder is not None:
+        notes_data, _ = bars_to_notes_data(bars)
+        if artifacts.wants(SUMMARY):
+            save_notes(artifacts.path(output_folder, 'results.npz'), notes_data)
+        artifacts.text(output_folder, 'results.txt', lambda: notes_lines(notes_data), FULL)
 
     # Print sorted notes in playing order
     print("Sorted notes in playing order (by bar and x-axis):")
@@ -297,8 +364,82 @@ def identify_notes(modified_image, output_folder):
             print(f"  Note Type: {note[0]}, Center: ({note[1]}, {note[2]})")
 
     # Save output image
-    os.makedirs(output_folder, exist_ok=True)
-    output_path = os.path.join(output_folder, 'identified_notes.png')
-    cv2.imwrite(output_path, modified_image)
+    if output_folder is not None:
+        os.makedirs(output_folder, exist_ok=True)
+        output_path = os.path.join(output_folder, 'identified_notes.png')
+        cv2.imwrite(output_path, modified_image)
 
     return crochets, quavers, crotchet_rests, minims, dotted_minims, notes
+
+
+def identify_note_events(page_without_staff, blobs, bar_boxes, beam_index, lines_img=None):
+    """Classify notehead records into notes with array operations instead of colour images.
+
+    Returns the (note_type, cx, cy) tuples identify_notes finds on the colour image of the same blobs, bar boxes
+    and beam lines, filled notes first. identify_notes sees one note per contour of the dot colours, after the
+    dots outside the bar boxes are cleared and the beams painted over them, so the notes are the components of
+    the same dot raster (note_events.dot_raster): touching dots give one note and a beam can split a dot.
+    beam_index is a note_events.BeamIndex of the page's beam boxes. The pixels identify_notes sees as black
+    are the page ink minus every dot and beam line painted over it, so the windows are counted on that mask.
+    """
+    shape = page_without_staff.shape[:2]
+    height, width = shape
+    beam = lines_img > 200 if lines_img is not None else np.zeros(shape, dtype=bool)
+    raster = dot_raster(shape, blobs, bar_boxes, beam)
+    ink = (page_without_staff == 0) & ~dot_mask(shape, blobs) & ~beam
+    # The dotted minim check thresholds at 127, which the red dots (gray 76) also pass
+    dark = ink | (raster == HOLLOW)
+    ink_sums = integral_image(ink)
+    dark_sums = integral_image(dark)
+    filled = boxes_from_mask(raster == FILLED)
+    hollow = boxes_from_mask(raster == HOLLOW)
+    notes = []
+
+    # Filled noteheads: quavers next to a beam, otherwise crotchet or crotchet rest by the ink in the 12x12
+    # window at the top left of the dot
+    x, y = filled['x'], filled['y']
+    cx, cy = x + filled['w'] // 2, y + filled['h'] // 2
+    black = window_counts(ink_sums, x, y, x + 12, y + 12)
+    note_types = np.where(near_beam(beam_index, cx, cy), "Quaver",
+                          np.where(black > 19, "Crotchet Rest", "Crotchet"))
+    notes.extend(zip(note_types.tolist(), cx.tolist(), cy.tolist()))
+
+    # Hollow noteheads: a stem above or below makes a minim, ink right of a minim a dotted minim,
+    # otherwise the ink inside the 14x14 box separates semibreves from rests
+    x, y, w, h = hollow['x'], hollow['y'], hollow['w'], hollow['h']
+    cx, cy = x + w // 2, y + h // 2
+    above_y = np.maximum(0, y - 11)
+    below_y = np.minimum(height - 11, y + h)
+    # identify_notes slices the window below from x - 5, which wraps round to an empty slice left of the page
+    below = np.where(x >= 5, window_counts(ink_sums, x - 5, below_y, x + 6, below_y + 11), 0)
+    is_minim = (window_counts(ink_sums, x, above_y, x + 11, above_y + 11) > 0) | (below > 0)
+    dot_x = x + w
+    is_dm = is_minim & (dot_x + 12 < width) & (window_counts(dark_sums, dot_x, y, dot_x + 12, y + 12) > 0)
+    inside = window_counts(ink_sums, cx - 7, cy - 7, cx + 7, cy + 7)
+    note_types = np.select([is_dm, is_minim, inside > 5], ["Dotted Minim", "Minim", "semibreve"], "rests")
+    notes.extend(zip(note_types.tolist(), cx.tolist(), cy.tolist()))
+
+    print(f"Identified {len(notes)} notes ({len(filled)} filled, {len(hollow)} hollow noteheads)")
+    return notes
+
+
+def save_note_events(page_without_staff, blobs, in_bars, lines_img, notes_data, artifacts):
+    """Hand the results.npz, results.txt and identified_notes.png artifacts of the record-based identification
+    to the sink. The text view is only written at FULL level and the annotated image is only drawn when the sink
+    keeps it."""
+    if artifacts.wants(SUMMARY):
+        save_notes(artifacts.path('note_identification', 'results.npz'), notes_data)
+    artifacts.text('note_identification', 'results.txt', lambda: notes_lines(notes_data), FULL)
+
+    def identified_notes():
+        image = cv2.cvtColor(page_without_staff.astype(np.uint8), cv2.COLOR_GRAY2BGR)
+        draw_blob_records(image, blobs[in_bars])
+        if lines_img is not None:
+            image[lines_img > 200] = (0, 255, 255)  # Yellow beam lines
+        for _, note_type, center_x, center_y in notes_data:
+            label = ''.join(word[0].upper() for word in note_type.split())
+            cv2.putText(image, label, (center_x - DOT_RADIUS, center_y - DOT_RADIUS - 5),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 1)
+        return image
+
+    artifacts.image('note_identification', 'identified_notes.png', identified_notes, SUMMARY)
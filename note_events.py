@@ -0,0 +1,194 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from contour_features import contour_features
+
+# Blob classes, matching the dot colours of the image-based pipeline
+HOLLOW = 0  # Red dot: small blob or open notehead (minims, semibreves, rests)
+FILLED = 1  # Green dot: filled notehead (crotchets, quavers, crotchet rests)
+
+# Notehead blobs found on the staff-free page
+BLOB_DTYPE = np.dtype([
+    ('cx', np.int32),
+    ('cy', np.int32),
+    ('area', np.float32),
+    ('solidity', np.float32),
+    ('completeness', np.float32),
+    ('kind', np.uint8),
+])
+
+# Axis-aligned boxes (bar boxes, beam boxes); edges are inclusive like the original pixel checks
+BOX_DTYPE = np.dtype([
+    ('x', np.int32),
+    ('y', np.int32),
+    ('w', np.int32),
+    ('h', np.int32),
+])
+
+# Horizontal reach of a beam for the quaver test of identify_notes: a notehead belongs to a beam when it lies
+# between BEAM_REACH_LEFT pixels left of the box and BEAM_REACH_RIGHT pixels right of it, and no more than
+# BEAM_REACH_Y pixels above the top or below the bottom of the box
+BEAM_REACH_LEFT = 10
+BEAM_REACH_RIGHT = 20
+BEAM_REACH_Y = 50
+
+# Beam boxes sorted by their left edge, so that a notehead only has to look at the beams whose x range can
+# reach it. max_width is the widest box, which bounds how far left a reaching box can start.
+BeamIndex = namedtuple('BeamIndex', ['boxes', 'order', 'left', 'max_width'])
+
+# Radius of the classification dots the image-based pipeline draws for every blob
+DOT_RADIUS = 3
+
+# Pixels of a dot raster (see dot_raster) that no classification dot covers
+NO_DOT = 255
+
+
+def classify_blobs(blobs):
+    """Set the kind of every blob in place: filled if it is large, solid and complete enough, else hollow."""
+    filled = (blobs['area'] >= 25) & (blobs['solidity'] > 0.5) & (blobs['completeness'] > 0.4)
+    blobs['kind'] = np.where(filled, FILLED, HOLLOW)
+    return blobs
+
+
+def blobs_to_records(valid_blobs):
+    """Convert (cx, cy, area, solidity, contour_completeness) tuples to a classified BLOB_DTYPE array."""
+    blobs = np.zeros(len(valid_blobs), dtype=BLOB_DTYPE)
+    for i, (cx, cy, area, solidity, completeness) in enumerate(valid_blobs):
+        blobs[i] = (cx, cy, area, solidity, completeness, HOLLOW)
+    return classify_blobs(blobs)
+
+
+def boxes_from_mask(mask):
+    """Bounding boxes of the outer contours of a binary mask as a BOX_DTYPE array: the boxes cv2.boundingRect
+    gives for the contours of cv2.findContours(RETR_EXTERNAL), in the same order."""
+    features = contour_features(np.asarray(mask, dtype=np.uint8))
+    boxes = np.zeros(len(features), dtype=BOX_DTYPE)
+    for name in ('x', 'y', 'w', 'h'):
+        boxes[name] = features[name]
+    return boxes
+
+
+def boxes_from_rects(rects):
+    """BOX_DTYPE array from a sequence of (x, y, w, h) tuples such as cv2.boundingRect results."""
+    boxes = np.zeros(len(rects), dtype=BOX_DTYPE)
+    for i, rect in enumerate(rects):
+        boxes[i] = rect
+    return boxes
+
+
+def bar_boxes_from_image(bar_boxes_img):
+    """Boxes of the green bar outlines drawn by bar_detect (bar_bounding_boxes.png)."""
+    mask = cv2.inRange(bar_boxes_img, np.array([0, 200, 0]), np.array([100, 255, 100]))
+    return boxes_from_mask(mask > 0)
+
+
+def beam_boxes_from_image(lines_img):
+    """Boxes of the beam lines drawn by beam_detect (lines.png)."""
+    return boxes_from_mask(lines_img > 200)
+
+
+def points_in_boxes(x, y, boxes):
+    """Boolean array: which of the points lie inside (edges included) at least one box."""
+    if len(boxes) == 0:
+        return np.zeros(len(x), dtype=bool)
+    x = np.asarray(x)[:, None]
+    y = np.asarray(y)[:, None]
+    inside = ((boxes['x'] <= x) & (x <= boxes['x'] + boxes['w']) &
+              (boxes['y'] <= y) & (y <= boxes['y'] + boxes['h']))
+    return inside.any(axis=1)
+
+
+def dot_mask(shape, blobs):
+    """Mask of the pixels covered by the classification dots of the blobs."""
+    mask = np.zeros(shape, dtype=np.uint8)
+    for cx, cy in zip(blobs['cx'].tolist(), blobs['cy'].tolist()):
+        cv2.circle(mask, (cx, cy), DOT_RADIUS, 1, -1)
+    return mask.astype(bool)
+
+
+def dot_raster(shape, blobs, bar_boxes, beam):
+    """The classification dots of the image-based pipeline as one array of blob kinds (NO_DOT elsewhere).
+
+    As in that pipeline, the dots are drawn in blob order, so a later dot covers an earlier one, every dot pixel
+    outside all bar boxes (edges included) is cleared, and the beam mask is painted over the dots. Touching dots
+    of one kind therefore form one component, and a beam can cut a dot in two.
+    """
+    raster = np.full(shape, NO_DOT, dtype=np.uint8)
+    for cx, cy, kind in zip(blobs['cx'].tolist(), blobs['cy'].tolist(), blobs['kind'].tolist()):
+        cv2.circle(raster, (cx, cy), DOT_RADIUS, int(kind), -1)
+
+    inside_bbox = np.zeros(shape, dtype=bool)
+    for bx, by, bw, bh in zip(bar_boxes['x'].tolist(), bar_boxes['y'].tolist(), bar_boxes['w'].tolist(),
+                              bar_boxes['h'].tolist()):
+        inside_bbox[max(by, 0):by + bh + 1, max(bx, 0):bx + bw + 1] = True
+    raster[~inside_bbox | beam] = NO_DOT
+    return raster
+
+
+def draw_blob_records(image, blobs):
+    """Draw the red and green classification dots of the blobs onto a BGR image in place."""
+    for cx, cy, kind in zip(blobs['cx'].tolist(), blobs['cy'].tolist(), blobs['kind'].tolist()):
+        color = (0, 255, 0) if kind == FILLED else (0, 0, 255)
+        cv2.circle(image, (cx, cy), DOT_RADIUS, color, -1)
+    return image
+
+
+def integral_image(mask):
+    """Summed-area table of a boolean mask, for counting set pixels in many windows at once."""
+    return cv2.integral(mask.astype(np.uint8))
+
+
+def window_counts(integral, x0, y0, x1, y1):
+    """Number of set pixels in each window [y0, y1) x [x0, x1) of the mask behind the summed-area table.
+    Windows are clipped to the image like NumPy slices."""
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    x0 = np.clip(x0, 0, width)
+    y0 = np.clip(y0, 0, height)
+    x1 = np.clip(x1, x0, width)
+    y1 = np.clip(y1, y0, height)
+    return integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+
+
+def build_beam_index(beam_boxes):
+    """Sort the beam boxes by left edge once so that proximity queries only look at nearby beams."""
+    order = np.argsort(beam_boxes['x'], kind='stable')
+    boxes = beam_boxes[order]
+    max_width = int(boxes['w'].max()) if len(boxes) else 0
+    return BeamIndex(boxes, order, boxes['x'].astype(np.int64), max_width)
+
+
+def beam_associations(index, x, y):
+    """All (note, beam) pairs of a page in one call: for the notehead points (x, y), return the note indices and
+    the indices into the original beam_boxes of every beam that makes the note a quaver.
+
+    Only the beams whose left edge lies in [x - BEAM_REACH_RIGHT - max_width, x + BEAM_REACH_LEFT] are tested,
+    found with a binary search on the sorted left edges.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.int64)
+    first = np.searchsorted(index.left, x - BEAM_REACH_RIGHT - index.max_width, side='left')
+    last = np.searchsorted(index.left, x + BEAM_REACH_LEFT, side='right')
+    counts = np.maximum(last - first, 0)
+
+    # Expand each note into its candidate beams
+    note_idx = np.repeat(np.arange(len(x)), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    beam_pos = np.repeat(first, counts) + np.arange(counts.sum()) - starts
+
+    boxes = index.boxes[beam_pos]
+    bx, by = boxes['x'], boxes['y']
+    right, bottom = bx + boxes['w'], by + boxes['h']
+    px, py = x[note_idx], y[note_idx]
+    near = ((bx - BEAM_REACH_LEFT <= px) & (px <= right + BEAM_REACH_RIGHT) &
+            (((bottom < py) & (py <= bottom + BEAM_REACH_Y)) | ((by - BEAM_REACH_Y <= py) & (py <= by))))
+
+    return note_idx[near], index.order[beam_pos[near]]
+
+
+def near_beam(index, x, y):
+    """Boolean array: which of the notehead points (x, y) have a beam just above or below them."""
+    near = np.zeros(len(x), dtype=bool)
+    near[beam_associations(index, x, y)[0]] = True
+    return near
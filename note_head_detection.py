@@ -1,8 +1,11 @@
-import os
 import numpy as np
 from PIL import Image
 import cv2  # OpenCV for image processing
 
+from artifacts import NO_ARTIFACTS, SUMMARY, ArtifactSink
+from note_events import blobs_to_records, draw_blob_records
+from contour_features import contour_features, aspect_ratio
+
 
 def apply_method1(image_array):
     """Apply Canny edge detection with small dilation."""
@@ -19,9 +22,10 @@ def apply_method1(image_array):
     return canny_edges, dilated_edges
 
 
-def apply_method2(image_array):
+def apply_method2(image_array, outline_gaussian=True):
     """Remove stems while preserving noteheads using median blur, adaptive thresholding, and morphological
-    operations."""
+    operations. The outlined closing image is the input of the blob detection; the outlined Gaussian image is
+    only for inspection and is None unless outline_gaussian is set."""
 
     # Convert image to OpenCV format (uint8 array)
     processed_img_cv = image_array.astype(np.uint8)
@@ -43,28 +47,25 @@ def apply_method2(image_array):
     closing_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
     closed_img = cv2.morphologyEx(eroded, cv2.MORPH_CLOSE, closing_kernel)
 
-    # Convert to color images for drawing contours
-    color_img_gaussian = cv2.cvtColor(adaptive_threshold, cv2.COLOR_GRAY2BGR)
+    # Convert to color images and draw the contours in green (BGR format: green is (0, 255, 0))
     color_img_closing = cv2.cvtColor(closed_img, cv2.COLOR_GRAY2BGR)
-
-    # Find contours for both images
-    contours_gaussian, _ = cv2.findContours(adaptive_threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     contours_closing, _ = cv2.findContours(closed_img, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # Draw contours in green (BGR format: green is (0, 255, 0))
-    cv2.drawContours(color_img_gaussian, contours_gaussian, -1, (0, 255, 0), 2)
     cv2.drawContours(color_img_closing, contours_closing, -1, (0, 255, 0), 2)
 
-    return blurred_img, adaptive_threshold, color_img_gaussian, color_img_closing
+    color_img_gaussian = None
+    if outline_gaussian:
+        color_img_gaussian = cv2.cvtColor(adaptive_threshold, cv2.COLOR_GRAY2BGR)
+        contours_gaussian, _ = cv2.findContours(adaptive_threshold, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cv2.drawContours(color_img_gaussian, contours_gaussian, -1, (0, 255, 0), 2)
 
-
-cropped_img_color = None
+    return blurred_img, adaptive_threshold, color_img_gaussian, color_img_closing
 
 
-def detect_blobs(image, method_name, cropped_image_path=None):
-    """Apply blob detection based on circularity, aspect ratio, and size, and save the results."""
+def detect_blobs(image, method_name, cropped_image_path=None, artifacts=None):
+    """Apply blob detection based on circularity, aspect ratio, and size. The blobs are drawn and saved under
+    notehead_images only when the artifact sink keeps full output."""
     # Ensure image is in grayscale format (single-channel)
-    global cropped_img_color
+    artifacts = artifacts or NO_ARTIFACTS
     if len(image.shape) == 3:
         image_gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     else:
@@ -73,9 +74,6 @@ def detect_blobs(image, method_name, cropped_image_path=None):
     # Convert image to OpenCV format (uint8 array)
     image_cv = image_gray.astype(np.uint8)
 
-    # Find contours
-    contours, _ = cv2.findContours(image_cv, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
     # Define thresholds for filtering
     circularity_threshold = 0.2
     aspect_ratio_threshold = 2.8
@@ -85,85 +83,67 @@ def detect_blobs(image, method_name, cropped_image_path=None):
     contour_completeness_threshold = 0.4
     small_dot_area_threshold = 30
 
-    # Create an RGB version of the image to draw colored dots
-    blob_img_color = cv2.cvtColor(image_cv, cv2.COLOR_GRAY2BGR)
+    # Create an RGB version of the image to draw colored dots, only if it will be saved
+    blob_img_color = cv2.cvtColor(image_cv, cv2.COLOR_GRAY2BGR) if artifacts.wants() else None
 
-    # If a cropped image path is provided, load it to draw blobs on it
+    # If a cropped image path is provided, load it to draw blobs on it. The copy is local to this call, so
+    # concurrent calls (one per staff band, see strips.py) never draw on each other's image
+    cropped_img_color = None
     if cropped_image_path:
         cropped_img = cv2.imread(cropped_image_path)
         if cropped_img is None:
             print(f"Error: Unable to load cropped image from {cropped_image_path}")
         else:
             cropped_img_color = cropped_img.copy()
-    else:
-        cropped_img_color = None
-
-    leftmost_x = float('inf')  # Start with a very large value
-    valid_blobs = []
-
-    # First pass: Find the leftmost blob
-    for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour)
-        cx = x + w // 2  # X centroid
-        if cx < leftmost_x:
-            leftmost_x = cx
-
-    # Second pass: Filter blobs that are at least 10 columns away from the leftmost blob
-    for contour in contours:
-        x, y, w, h = cv2.boundingRect(contour)
-        cx = x + w // 2  # X centroid
-        cy = y + h // 2  # Y centroid
-        area = cv2.contourArea(contour)
-        perimeter = cv2.arcLength(contour, True)
-
-        if perimeter == 0:
-            continue
-
-        circularity = (4 * np.pi * area) / (perimeter ** 2)
-        aspect_ratio = float(w) / h if w > h else float(h) / w
-        hull = cv2.convexHull(contour)
-        hull_area = cv2.contourArea(hull)
-        solidity = float(area) / hull_area if hull_area > 0 else 0
-        hull_perimeter = cv2.arcLength(hull, True)
-        contour_completeness = perimeter / hull_perimeter if hull_perimeter > 0 else 0
-
-        # Apply filters and check distance from leftmost blob
-        if (circularity > circularity_threshold and
-                aspect_ratio < aspect_ratio_threshold and
-                min_area < area < max_area and
-                (cx - leftmost_x) >= 48):  # Ensure the blob is at least 10 columns away
-
-            valid_blobs.append((cx, cy, area, solidity, contour_completeness))
-
-    # Draw only valid blobs
-    for cx, cy, area, solidity, contour_completeness in valid_blobs:
+
+    # Every contour is measured at once; only the ones that pass the filters get their convex hull taken. The
+    # rows keep the findContours order of the original loop: the dots are drawn in it, and where dots overlap the
+    # later one wins
+    def is_blob(table):
+        # The leftmost blob is found among all contours; blobs must be at least 48 columns away from it
+        leftmost_x = table['cx'].min()
+        return ((table['circularity'] > circularity_threshold) &
+                (aspect_ratio(table) < aspect_ratio_threshold) &
+                (min_area < table['area']) & (table['area'] < max_area) &
+                (table['cx'] - leftmost_x >= 48))
+
+    features = contour_features(image_cv, hull=is_blob)
+    blobs = features[is_blob(features)] if len(features) else features
+    valid_blobs = list(zip(blobs['cx'].tolist(), blobs['cy'].tolist(), blobs['area'].tolist(),
+                           blobs['solidity'].tolist(), blobs['completeness'].tolist()))
+
+    # Draw only valid blobs, on the images that are kept
+    targets = [img for img in (blob_img_color, cropped_img_color) if img is not None]
+    for cx, cy, area, solidity, contour_completeness in (valid_blobs if targets else []):
         if area < small_dot_area_threshold:
-            cv2.circle(blob_img_color, (cx, cy), 3, (0, 0, 255), -1)
-            if cropped_img_color is not None:
-                cv2.circle(cropped_img_color, (cx, cy), 3, (0, 0, 255), -1)
+            color = (0, 0, 255)
         elif solidity > solidity_threshold and contour_completeness > contour_completeness_threshold:
-            cv2.circle(blob_img_color, (cx, cy), 3, (0, 255, 0), -1)
-            if cropped_img_color is not None:
-                cv2.circle(cropped_img_color, (cx, cy), 3, (0, 255, 0), -1)
+            color = (0, 255, 0)
         else:
-            cv2.circle(blob_img_color, (cx, cy), 3, (0, 0, 255), -1)
-            if cropped_img_color is not None:
-                cv2.circle(cropped_img_color, (cx, cy), 3, (0, 0, 255), -1)
+            color = (0, 0, 255)
+        for target in targets:
+            cv2.circle(target, (cx, cy), 3, color, -1)
 
-    # Save the blob-detected image
-    blob_save_path = os.path.join('notehead_images', f"{method_name}_blobs.png")
-    cv2.imwrite(blob_save_path, blob_img_color)
-    print(f"{method_name} Blob-detected image saved at: {blob_save_path}")
-
-    # Save the modified cropped image with blobs drawn on it
-    if cropped_img_color is not None:
-        cropped_blob_save_path = os.path.join('notehead_images', "cropped_image_with_blobs.png")
-        cv2.imwrite(cropped_blob_save_path, cropped_img_color)
-        print(f"Cropped image with blobs saved at: {cropped_blob_save_path}")
+    # Save the blob-detected image and the modified cropped image with blobs drawn on it
+    artifacts.image('notehead_images', f"{method_name}_blobs.png", blob_img_color)
+    artifacts.image('notehead_images', "cropped_image_with_blobs.png", cropped_img_color)
 
     return valid_blobs  # Return the list of valid blobs
 
 
+def draw_dots(original_img, valid_blobs):
+    """Draw the red and green classification dots for the detected blobs onto a BGR image in place."""
+    for cx, cy, area, solidity, contour_completeness in valid_blobs:
+        if area < 25:  # Small dots
+            cv2.circle(original_img, (cx, cy), 3, (0, 0, 255), -1)  # Red dot (BGR format)
+        elif solidity > 0.5 and contour_completeness > 0.4:  # Valid noteheads
+            cv2.circle(original_img, (cx, cy), 3, (0, 255, 0), -1)  # Green dot (BGR format)
+        else:  # Invalid blobs
+            cv2.circle(original_img, (cx, cy), 3, (0, 0, 255), -1)  # Red dot (BGR format)
+
+    return original_img
+
+
 def draw_detected_dots_on_original(processed_image_path, valid_blobs, output_path):
     """Draw detected blobs onto the original processed image."""
     # Load the original processed image
@@ -173,20 +153,51 @@ def draw_detected_dots_on_original(processed_image_path, valid_blobs, output_pat
         return
 
     # Draw new dots on the original image based on detected blobs
-    for cx, cy, area, solidity, contour_completeness in valid_blobs:
-        if area < 25:  # Small dots
-            cv2.circle(original_img, (cx, cy), 3, (0, 0, 255), -1)  # Red dot (BGR format)
-        elif solidity > 0.5 and contour_completeness > 0.4:  # Valid noteheads
-            cv2.circle(original_img, (cx, cy), 3, (0, 255, 0), -1)  # Green dot (BGR format)
-        else:  # Invalid blobs
-            cv2.circle(original_img, (cx, cy), 3, (0, 0, 255), -1)  # Red dot (BGR format)
+    draw_dots(original_img, valid_blobs)
 
     # Save the updated image with newly drawn dots
     cv2.imwrite(output_path, original_img)
     print(f"Updated image with new dots saved at: {output_path}")
 
 
-def notes_detect(processed_image_path):
+def detect_noteheads(processed_img_array, artifacts=None, method1=False):
+    """Detect the noteheads of the staff-free page array.
+
+    Returns the method 2 blobs as a classified note_events.BLOB_DTYPE array. Method 1 only produces
+    inspection images, so it only runs when asked for with method1=True and the artifact sink keeps full output.
+    """
+    artifacts = artifacts or NO_ARTIFACTS
+    folder = 'notehead_images'
+
+    if method1 and artifacts.wants():
+        # Apply Method 1 to the entire image and blob detection on its output
+        canny_edges, dilated_edges = apply_method1(processed_img_array)
+        artifacts.image(folder, "method1_cannyedges.png", canny_edges)
+        artifacts.image(folder, "method1_dilated_cannyedges.png", dilated_edges)
+        detect_blobs(dilated_edges, "method1_dilated_cannyedges", artifacts=artifacts)
+
+    # Apply Method 2 to the entire image
+    blurred_img, adaptive_threshold, color_img_gaussian, color_img_closing = apply_method2(
+        processed_img_array, outline_gaussian=artifacts.wants())
+
+    # Save each stage of Method 2 (the closing image before blob detection reads it)
+    artifacts.image(folder, "method2_medianblurred_image.png", blurred_img)
+    artifacts.image(folder, "method2_gaussian_outlined.png", color_img_gaussian)
+    artifacts.image(folder, "method2_closing_outlined.png", color_img_closing)
+
+    # Apply blob detection on Method 2’s output
+    blobs = blobs_to_records(detect_blobs(color_img_closing, "method2_closing_outlined", artifacts=artifacts))
+
+    # Draw the classified blobs onto a colour copy of the processed image
+    def image_with_dots():
+        return draw_blob_records(cv2.cvtColor(processed_img_array.astype(np.uint8), cv2.COLOR_GRAY2BGR), blobs)
+
+    artifacts.image(folder, "processed_image_with_dots.png", image_with_dots, SUMMARY)
+
+    return blobs
+
+
+def notes_detect(processed_image_path, method1=False):
     print(f"Loading processed image from: {processed_image_path}")
 
     try:
@@ -198,42 +209,8 @@ def notes_detect(processed_image_path):
         print(f"Error loading image: {e}")
         return None
 
-    # Create the output folder if it doesn't exist
-    output_folder = 'notehead_images'
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Apply Method 1 to the entire image
-    canny_edges, dilated_edges = apply_method1(processed_img_array)
-    canny_edges_save_path = os.path.join(output_folder, "method1_cannyedges.png")
-    dilated_edges_save_path = os.path.join(output_folder, "method1_dilated_cannyedges.png")
-    cv2.imwrite(canny_edges_save_path, canny_edges)
-    cv2.imwrite(dilated_edges_save_path, dilated_edges)
-    print(f"Method 1 Canny edges image saved at: {canny_edges_save_path}")
-    print(f"Method 1 Dilated Canny edges image saved at: {dilated_edges_save_path}")
-
-    # Apply blob detection on Method 1's output
-    detect_blobs(dilated_edges, "method1_dilated_cannyedges")
-
-    # Apply Method 2 to the entire image
-    blurred_img, adaptive_threshold, color_img_gaussian, color_img_closing = apply_method2(processed_img_array)
-
-    # Save each stage of Method 2
-    blurred_img_save_path = os.path.join(output_folder, "method2_medianblurred_image.png")
-    color_img_gaussian_save_path = os.path.join(output_folder, "method2_gaussian_outlined.png")
-    color_img_closing_save_path = os.path.join(output_folder, "method2_closing_outlined.png")
-
-    cv2.imwrite(blurred_img_save_path, blurred_img)
-    cv2.imwrite(color_img_gaussian_save_path, color_img_gaussian)
-    cv2.imwrite(color_img_closing_save_path, color_img_closing)
-
-    print(f"Method 2 Blurred image saved at: {blurred_img_save_path}")
-    print(f"Method 2 Gaussian outlined image saved at: {color_img_gaussian_save_path}")
-    print(f"Method 2 Closing outlined image saved at: {color_img_closing_save_path}")
-
-    # Apply blob detection on Method 2’s output
-    valid_blobs_method2 = detect_blobs(color_img_closing, "method2_closing_outlined")
+    # Run the detection (and method 1 when asked for), saving every intermediate image and the image with dots
+    with ArtifactSink('full') as artifacts:
+        blobs = detect_noteheads(processed_img_array, artifacts, method1)
 
-    # **New Step: Draw detected blobs onto original processed image**
-    output_image_with_dots = os.path.join(output_folder, "processed_image_with_dots.png")
-    draw_detected_dots_on_original(processed_image_path, valid_blobs_method2, output_image_with_dots)
+    return blobs
@@ -0,0 +1,146 @@
+import argparse
+
+import numpy as np
+
+# Columnar files that the stages exchange instead of results.txt and processed_notes.txt. Each file is an
+# uncompressed .npz holding one array per column plus the table's name and schema version; string columns are
+# stored as integer codes with a vocabulary array, and list columns as flat values with offsets. Bump
+# SCHEMA_VERSION whenever a column is added, removed or changes type.
+SCHEMA_VERSION = 1
+NOTES_TABLE = 'notes'
+PROCESSED_NOTES_TABLE = 'processed_notes'
+
+
+def encode_strings(values):
+    """Dictionary-encode a string column: returns (codes, vocabulary). None is stored as the empty string."""
+    values = np.array(['' if value is None else value for value in values], dtype=str)
+    vocabulary, codes = np.unique(values, return_inverse=True)
+    return codes.astype(np.int32), vocabulary
+
+
+def decode_strings(codes, vocabulary):
+    return [value or None for value in vocabulary[codes].tolist()] if len(codes) else []
+
+
+def as_number(value):
+    """Durations are written as 1 or 0.5 by the text files; keep whole numbers as ints."""
+    return int(value) if float(value).is_integer() else value
+
+
+def save_table(path, table, **columns):
+    with open(path, 'wb') as file:
+        np.savez(file, table=np.array(table), version=np.array(SCHEMA_VERSION), **columns)
+    print(f"Table saved at: {path}")
+
+
+def load_table(path, table):
+    """Load the columns of a table file, refusing files of another table or schema version."""
+    with np.load(path, allow_pickle=False) as data:
+        columns = {name: data[name] for name in data.files}
+
+    found = (str(columns.get('table', '')), int(columns.get('version', -1)))
+    if found != (table, SCHEMA_VERSION):
+        raise ValueError(f"{path} holds table {found[0]!r} version {found[1]}, "
+                         f"expected {table!r} version {SCHEMA_VERSION}")
+    return columns
+
+
+def save_notes(path, notes_data):
+    """Write the (bar_number, note_type, cx, cy) rows of the note identification stage."""
+    bars, note_types, xs, ys = zip(*notes_data) if notes_data else ((), (), (), ())
+    type_codes, type_names = encode_strings(note_types)
+    save_table(path, NOTES_TABLE,
+               bar=np.array(bars, dtype=np.int32),
+               note_type=type_codes,
+               note_type_names=type_names,
+               cx=np.array(xs, dtype=np.int32),
+               cy=np.array(ys, dtype=np.int32))
+
+
+def load_notes(path):
+    """Read a notes table back. Returns (notes_data, num_bars) like read_results_file_and_create_folder."""
+    columns = load_table(path, NOTES_TABLE)
+    note_types = decode_strings(columns['note_type'], columns['note_type_names'])
+    bars = columns['bar'].tolist()
+    notes_data = list(zip(bars, note_types, columns['cx'].tolist(), columns['cy'].tolist()))
+    return notes_data, max(bars, default=0)
+
+
+def save_processed_notes(path, processed_notes, steps=None):
+    """Write the (bar, note_type, cx, cy, differences, position, duration) rows of the pitch stage, with the
+    staff step of every note when the rows come from process_notes_with_steps."""
+    rows = list(zip(*processed_notes)) if processed_notes else [()] * 7
+    bars, note_types, xs, ys, differences, positions, durations = rows
+    type_codes, type_names = encode_strings(note_types)
+    position_codes, position_names = encode_strings(positions)
+
+    columns = dict(
+        bar=np.array(bars, dtype=np.int32),
+        note_type=type_codes,
+        note_type_names=type_names,
+        cx=np.array(xs, dtype=np.int32),
+        cy=np.array(ys, dtype=np.int32),
+        # The staff of the last bar can have fewer than five lines, so the differences are a list column
+        differences=np.array([diff for diffs in differences for diff in diffs], dtype=np.int32),
+        difference_offsets=np.cumsum([0] + [len(diffs) for diffs in differences]).astype(np.int64),
+        position=position_codes,
+        position_names=position_names,
+        duration=np.array(durations, dtype=np.float64),
+    )
+    if steps is not None:
+        columns['step'] = np.asarray(steps, dtype=np.int32)
+    save_table(path, PROCESSED_NOTES_TABLE, **columns)
+
+
+def load_processed_notes(path):
+    """Read a processed notes table back. Returns (processed_notes, steps), steps None if it was not saved."""
+    columns = load_table(path, PROCESSED_NOTES_TABLE)
+    offsets = columns['difference_offsets'].tolist()
+    differences = columns['differences'].tolist()
+
+    processed_notes = list(zip(
+        columns['bar'].tolist(),
+        decode_strings(columns['note_type'], columns['note_type_names']),
+        columns['cx'].tolist(),
+        columns['cy'].tolist(),
+        [differences[start:end] for start, end in zip(offsets, offsets[1:])],
+        decode_strings(columns['position'], columns['position_names']),
+        [as_number(duration) for duration in columns['duration'].tolist()],
+    ))
+    return processed_notes, columns.get('step')
+
+
+def notes_lines(notes_data):
+    """Text view of a notes table, in the results.txt format."""
+    return ["Bar, Note Type, CX, CY"] + [f"{bar}, {note_type}, {cx}, {cy}" for bar, note_type, cx, cy in notes_data]
+
+
+def processed_notes_lines(processed_notes):
+    """Text view of a processed notes table, in the processed_notes.txt format."""
+    return [f" {bar}, {note_type}, CX {cx}, CY {cy}, Differences: {differences}, "
+            f"Position: {position if position is not None else 'Unknown'}, Duration: {duration} beats"
+            for bar, note_type, cx, cy, differences, position, duration in processed_notes]
+
+
+def write_lines(path, lines):
+    with open(path, 'w') as file:
+        file.writelines(f"{line}\n" for line in lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print a notes or processed notes table as text.")
+    parser.add_argument('table', help="A .npz table written by save_notes or save_processed_notes")
+    parser.add_argument('--output', default=None, help="Write the text to this file instead of printing it")
+    args = parser.parse_args()
+
+    with np.load(args.table, allow_pickle=False) as table_data:
+        table_name = str(table_data['table'])
+    if table_name == NOTES_TABLE:
+        text_lines = notes_lines(load_notes(args.table)[0])
+    else:
+        text_lines = processed_notes_lines(load_processed_notes(args.table)[0])
+
+    if args.output:
+        write_lines(args.output, text_lines)
+    else:
+        print("\n".join(text_lines))
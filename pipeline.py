@@ -0,0 +1,516 @@
+import contextlib
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from grayscalebinarize import count_pages, render_pixmap, pixmap_to_array, binarize
+from artifacts import FULL, SUMMARY, ArtifactSink, parse_level
+from instrumentation import StageRecorder, stage
+from result_cache import cache_key
+from scheduler import THREAD, task, run_tasks
+from staff_removal import process_array
+from clef_detection import classify_clefs
+from note_head_detection import detect_noteheads
+from staff_detection import detect_staff, cropped_line_rows, cropped_staves, draw_staff_overlay
+from strips import band_halo, staff_bands, staff_boundaries, staff_of, run_band_detectors
+from stem_detection import process_image as detect_stem_lines
+from beam_detection import beam_detect
+from bar_lines_detection import bar_detect
+from note_events import bar_boxes_from_image, beam_boxes_from_image, build_beam_index, points_in_boxes
+from musicnote_identification import (
+    identify_note_events,
+    save_note_events,
+    group_notes_by_staff,
+    bars_to_notes_data,
+)
+from pitch_identification import process_notes_with_steps
+from note_tables import save_processed_notes, processed_notes_lines, write_lines
+from map_notes_to_midi import (
+    assign_midi_from_steps,
+    build_piano_midi,
+    PianoMidiStream,
+    midi_to_bytes,
+    create_piano_midi,
+    save_piano_midi,
+)
+from timeline import CHORD_TOLERANCE, score_timeline, timeline_to_midi
+
+# Page results that are plain data and can be stored in the result cache
+CACHED_KEYS = ('page_number', 'staff_line_rows', 'clefs', 'notes_data', 'processed_notes', 'assigned_notes')
+
+# Result images of the beam and bar detectors, which only work on files
+BEAM_LINES_PATH = os.path.join('beam_images', 'lines.png')
+BAR_BOXES_PATH = os.path.join('bar_line_images', 'bar_bounding_boxes.png')
+
+# How the detectors after staff removal are scheduled (see scheduler.py). They are all built on OpenCV calls
+# that release the GIL, so threads suffice; a detector that holds the GIL can be switched to scheduler.PROCESS
+DETECTOR_KINDS = {'clef': THREAD, 'notehead': THREAD, 'stem': THREAD, 'beam': THREAD, 'bar': THREAD}
+
+
+@contextlib.contextmanager
+def isolated_workspace(path=None):
+    """Run the enclosed stages in a private working directory, so that the fixed stage folders (beam_images,
+    bar_line_images, ...) of concurrent runs do not overwrite each other. A temporary directory is used and
+    removed afterwards unless a path is given."""
+    previous_dir = os.getcwd()
+    tmp_dir = None
+    if path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        path = tmp_dir.name
+    else:
+        os.makedirs(path, exist_ok=True)
+
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(previous_dir)
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+
+def detect_beam_lines(page_path):
+    """Run beam_detect on a page file and read back its beam lines image (grayscale)."""
+    beam_detect(page_path)
+    return cv2.imread(BEAM_LINES_PATH, cv2.IMREAD_GRAYSCALE)
+
+
+def detect_bar_boxes(page_path):
+    """Run bar_detect on a page file and read back its bar bounding boxes image."""
+    bar_detect(page_path)
+    return cv2.imread(BAR_BOXES_PATH)
+
+
+@contextlib.contextmanager
+def page_file(page_without_staff):
+    """Write the staff-free page to a temporary PNG for the detectors that only work on files."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        page_path = os.path.join(tmp_dir, 'page_cropped_without_staff.png')
+        cv2.imwrite(page_path, page_without_staff)
+        yield page_path
+
+
+def run_file_detectors(page_without_staff, recorder=None):
+    """Run beam_detect and bar_detect on the staff-free page.
+
+    Both detectors take an image path and write their results to fixed folders, so the page is written once
+    to a temporary file for them and their result images are read back. Returns (lines_img, bar_boxes_img).
+    """
+    with page_file(page_without_staff) as page_path:
+        with stage(recorder, 'beam'):
+            lines_img = detect_beam_lines(page_path)
+        with stage(recorder, 'bar'):
+            bar_boxes_img = detect_bar_boxes(page_path)
+
+    return lines_img, bar_boxes_img
+
+
+def run_detectors(page_without_staff, artifacts, recorder=None, parallel=True, page_number=0, bands=None):
+    """Run the clef, notehead, stem, beam and bar detectors on the staff-free page.
+
+    The detectors only read the page and do not depend on each other, so with parallel=True they run at the
+    same time (scheduled as in DETECTOR_KINDS) on one read-only view of the page array. With bands (see
+    strips.staff_bands) the clef, notehead and stem detectors run band by band through
+    strips.run_band_detectors; beam and bar detection only work on page files and still see the whole page.
+    Returns {detector name: result}.
+    """
+    shared_page = page_without_staff.view()
+    shared_page.flags.writeable = False  # A detector writing into the shared page fails instead of racing
+
+    with page_file(shared_page) as page_path:
+        tasks = [
+            task('beam', detect_beam_lines, page_path, kind=DETECTOR_KINDS['beam']),
+            task('bar', detect_bar_boxes, page_path, kind=DETECTOR_KINDS['bar']),
+        ]
+        if bands is None:
+            tasks += [
+                task('clef', classify_clefs, shared_page, artifacts, kind=DETECTOR_KINDS['clef']),
+                task('notehead', detect_noteheads, shared_page, artifacts, kind=DETECTOR_KINDS['notehead']),
+                task('stem', detect_stem_lines, shared_page, artifacts, kind=DETECTOR_KINDS['stem']),
+            ]
+        else:
+            tasks.append(task('bands', run_band_detectors, shared_page, bands, artifacts, recorder, parallel))
+        detected = run_tasks(tasks, recorder=recorder, parallel=parallel, page=page_number)
+
+    detected.update(detected.pop('bands', {}))
+    return detected
+
+
+def process_system(system_notes, num_bars, staff_line_rows, clefs):
+    """Pitch and MIDI numbers of the notes of one staff. Returns (processed_notes, steps, assigned_notes)."""
+    processed_notes, steps = process_notes_with_steps(system_notes, staff_line_rows, num_bars, output_file=None)
+    return processed_notes, steps, assign_midi_from_steps(processed_notes, steps, clefs)
+
+
+def run_systems(notes_data, num_bars, staff_line_rows, clefs, recorder=None, page_number=0):
+    """Run process_system for every staff and join the results in staff order. Returns (processed_notes, steps,
+    assigned_notes) for the whole page. The staves run inline, each timed as a system_<bar> stage: their work is
+    pure Python that holds the GIL, so a thread pool only adds its overhead."""
+    systems = [[] for _ in range(num_bars)]
+    for note in notes_data:
+        systems[note[0] - 1].append(note)
+
+    system_results = []
+    for bar, system_notes in enumerate(systems, start=1):
+        with stage(recorder, f'system_{bar}', page=page_number):
+            system_results.append(process_system(system_notes, num_bars, staff_line_rows, clefs))
+
+    processed_notes = [note for processed, _, _ in system_results for note in processed]
+    steps = np.concatenate([system_steps for _, system_steps, _ in system_results])
+    assigned_notes = [note for _, _, assigned in system_results for note in assigned]
+    return processed_notes, steps, assigned_notes
+
+
+def process_page(pdf_path, page_number=0, threshold=185, debug=False, recorder=None, dpi=None, artifacts=None,
+                 parallel=True, strips=False, runlength=False):
+    """Run the OMR chain on one PDF page, passing arrays from stage to stage.
+
+    Returns a dict with the structured results of every stage, or None if the page could not be processed.
+    Debug images are written to the usual stage folders through an artifact sink: either the given one, or one
+    made for the level debug names (False/'none', 'summary', True/'full'). Each stage is timed by the recorder
+    when one is given. With parallel=True the independent detectors run concurrently (see run_detectors).
+    dpi sets the render resolution (72 DPI by default); the detectors are tuned for 72 DPI, so other
+    resolutions trade accuracy for speed or the other way round. With strips=True the detectors run on one
+    horizontal band per staff instead of the whole page (see strips.py), which bounds their memory at high DPI.
+    With runlength=True the staff lines are erased by vertical run length (remove_staff_lines_runlength), which
+    keeps notation crossing thick scanned lines.
+    """
+    with stage(recorder, 'rasterise', page=page_number, dpi=dpi or 72):
+        pix = render_pixmap(pdf_path, page_number, dpi)
+    if pix is None:
+        return None
+
+    # The grayscale array is a view of the pixmap's samples and is only used while pix is alive
+    with stage(recorder, 'binarize', page=page_number):
+        binarized_array = binarize(pixmap_to_array(pix), threshold)
+    del pix
+
+    return process_binarized(binarized_array, page_number, debug, recorder, artifacts, parallel, strips, runlength)
+
+
+def process_binarized(binarized_array, page_number=0, debug=False, recorder=None, artifacts=None, parallel=True,
+                      strips=False, runlength=False):
+    """Run the OMR chain from staff removal onwards on a binarized page array. Returns the same result dict
+    as process_page; 'blobs', 'bar_boxes' and 'beam_boxes' are note_events record arrays."""
+    if artifacts is None:
+        # The sink is closed, and its pending images written, before the result is returned
+        with ArtifactSink(debug) as artifacts:
+            return process_binarized(binarized_array, page_number, recorder=recorder, artifacts=artifacts,
+                                     parallel=parallel, strips=strips, runlength=runlength)
+
+    # Staff lines are detected once; every later stage reads this model
+    with stage(recorder, 'staff_detection', page=page_number):
+        staff_model = detect_staff(binarized_array)
+        staff_line_rows = cropped_line_rows(staff_model)
+
+    with stage(recorder, 'staff_removal', page=page_number):
+        _, page_with_staff, page_without_staff = process_array(binarized_array, staff_model.raw_rows,
+                                                               runlength=runlength,
+                                                               line_thickness=staff_model.thickness)
+
+    bands = None
+    if strips:
+        bands = staff_bands(cropped_staves(staff_model), page_without_staff.shape[0], band_halo(staff_model.spacing))
+
+    print("Running clef, notehead, stem, beam and bar detection...")
+    detected = run_detectors(page_without_staff, artifacts, recorder, parallel, page_number, bands)
+    clefs, blobs, stem_lines = detected['clef'], detected['notehead'], detected['stem']
+    lines_img, bar_boxes_img = detected['beam'], detected['bar']
+
+    artifacts.image('.', 'outputstaffline.png', lambda: draw_staff_overlay(page_with_staff, staff_line_rows),
+                    SUMMARY)
+
+    if bar_boxes_img is None:
+        print(f"Error: Could not load {BAR_BOXES_PATH}")
+        return None
+
+    # Blobs, bar boxes and beam boxes are passed on as note_events records, not as colour-coded images
+    with stage(recorder, 'bbox_pruning', page=page_number):
+        bar_boxes = bar_boxes_from_image(bar_boxes_img)
+        beam_boxes = beam_boxes_from_image(lines_img) if lines_img is not None else bar_boxes[:0]
+        in_bars = points_in_boxes(blobs['cx'], blobs['cy'], bar_boxes)
+        beam_index = build_beam_index(beam_boxes)
+    if len(bar_boxes) == 0:
+        print("No green bounding boxes found in the barboundbox image.")
+        return None
+
+    # Identify crochets (filled noteheads) and quavers (filled noteheads next to a beam)
+    print("Identifying crochets and quavers...")
+    with stage(recorder, 'note_identification', page=page_number) as info:
+        notes = identify_note_events(page_without_staff, blobs, bar_boxes, beam_index, lines_img)
+        info['notes'] = len(notes)
+
+    # Assign every note to its staff by the rows between the staves; bar n of the page is staff n
+    with stage(recorder, 'segmentation', page=page_number) as info:
+        staves = cropped_staves(staff_model)
+        staff_index = staff_of(staff_boundaries(staves), [cy for _, _, cy in notes])
+        systems = group_notes_by_staff(notes, staff_index, max(len(staves), 1))
+        notes_data, num_bars = bars_to_notes_data(systems)
+        info['systems'] = num_bars
+    save_note_events(page_without_staff, blobs, in_bars, lines_img, notes_data, artifacts)
+
+    # Process the notes of each staff with its staff lines; the staves are independent work units
+    with stage(recorder, 'pitch', page=page_number):
+        processed_notes, steps, assigned_notes = run_systems(notes_data, num_bars, staff_line_rows, clefs,
+                                                             recorder, page_number)
+        if artifacts.wants(FULL):
+            write_lines('processed_notes.txt', processed_notes_lines(processed_notes))
+        if artifacts.wants(SUMMARY):
+            save_processed_notes('processed_notes.npz', processed_notes, steps)
+
+    return {
+        'page_number': page_number,
+        'staff_model': staff_model,
+        'staff_line_rows': staff_line_rows,
+        'clefs': clefs,
+        'blobs': blobs,
+        'stem_lines': stem_lines,
+        'bar_boxes': bar_boxes,
+        'beam_boxes': beam_boxes,
+        'notes_data': notes_data,
+        'processed_notes': processed_notes,
+        'assigned_notes': assigned_notes,
+    }
+
+
+def add_midi(result, assigned_notes, output_name, output_dir, timeline=None):
+    """Add the MIDI file of the notes to a result: written to output_dir under 'midi_path', or, when output_dir
+    is None, kept in memory as bytes under 'midi_bytes' (with 'midi_path' None).
+
+    Without a timeline the notes are played one after another; with a timeline (see timeline.py) the MIDI file
+    is built from it instead, with chords, rests and treble and bass sounding together.
+    """
+    midi = timeline_to_midi(timeline) if timeline is not None else None
+    if output_dir is None:
+        result['midi_path'] = None
+        result['midi_bytes'] = midi_to_bytes(midi if midi is not None else build_piano_midi(assigned_notes))
+    elif midi is not None:
+        result['midi_path'] = save_piano_midi(midi, output_name, output_dir)
+    else:
+        result['midi_path'] = create_piano_midi(assigned_notes, output_name, output_dir)
+    return result
+
+
+def page_timeline(page_results, dpi=None, polyphonic=True):
+    """The polyphonic timeline of the page results for add_midi, or None with polyphonic=False. The chord
+    tolerance scales with the render resolution."""
+    if not polyphonic:
+        return None
+    return score_timeline(page_results, CHORD_TOLERANCE * (dpi or 72) / 72)
+
+
+def run_pipeline(pdf_path, output_name=None, output_dir="midi_files", threshold=185, debug=False, recorder=None,
+                 dpi=None, parallel=True, strips=False, polyphonic=False, runlength=False):
+    """Convert the first page of a PDF to MIDI without intermediate image files.
+
+    Returns the page result dict of process_page with the MIDI file added by add_midi, or None if the page
+    could not be processed. With output_dir=None nothing is written to disk. With polyphonic=True the MIDI
+    file is built from the page's timeline (see timeline.py).
+    """
+    if output_name is None:
+        output_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    result = process_page(pdf_path, threshold=threshold, debug=debug, recorder=recorder, dpi=dpi, parallel=parallel,
+                          strips=strips, runlength=runlength)
+    if result is None:
+        print(f"Could not process {pdf_path}")
+        return None
+
+    with stage(recorder, 'midi'):
+        add_midi(result, result['assigned_notes'], output_name, output_dir,
+                 page_timeline([result], dpi, polyphonic))
+    return result
+
+
+def process_page_isolated(pdf_path, page_number, threshold=185, debug_dir=None, instrument=False, dpi=None,
+                          debug_level=FULL, strips=False, runlength=False):
+    """Process one page inside its own workspace. When debug_dir is given, the debug artifacts of debug_level
+    go to debug_dir/page_<n>.
+
+    With instrument=True the stage timings of the page are returned in the result under 'stages', together
+    with the 'recorder_origin' needed to merge them into the caller's recorder.
+    """
+    workspace = os.path.join(debug_dir, f"page_{page_number + 1}") if debug_dir is not None else None
+    recorder = StageRecorder() if instrument else None
+    with isolated_workspace(workspace):
+        # Pages already run in parallel, so the detectors of a page run one after another
+        level = debug_level if debug_dir is not None else False
+        result = process_page(pdf_path, page_number, threshold, debug=level, recorder=recorder, dpi=dpi,
+                              parallel=False, strips=strips, runlength=runlength)
+
+    if result is not None and recorder is not None:
+        result['stages'] = recorder.stages
+        result['recorder_origin'] = recorder.origin
+    return result
+
+
+def stitch_pages(page_results):
+    """Concatenate the clef-assigned notes of the pages in page order, numbering bars across the whole score."""
+    assigned_notes = []
+    bar_offset = 0
+
+    for result in page_results:
+        for bar_info, note_type, position_text, duration, clef, midi_number in result['assigned_notes']:
+            assigned_notes.append((str(int(bar_info) + bar_offset), note_type, position_text, duration, clef,
+                                   midi_number))
+        bar_offset += max((bar for bar, _, _, _ in result['notes_data']), default=0)
+
+    return assigned_notes
+
+
+def run_pipeline_pages(pdf_path, output_name=None, output_dir="midi_files", threshold=185, max_workers=None,
+                       debug_dir=None, recorder=None, dpi=None, debug_level=FULL, strips=False, polyphonic=False,
+                       runlength=False):
+    """Convert every page of a PDF to a single MIDI file.
+
+    Each page runs the whole OMR chain in a worker process of a ProcessPoolExecutor and the per-page note
+    streams are stitched together in page order. Pages that cannot be processed are skipped. Returns a dict
+    with the page results and the MIDI file as added by add_midi, or None if no page could be processed.
+    """
+    pdf_path = os.path.abspath(pdf_path)
+    if debug_dir is not None:
+        debug_dir = os.path.abspath(debug_dir)
+    if output_name is None:
+        output_name = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    num_pages = count_pages(pdf_path)
+    print(f"Processing {num_pages} pages of {pdf_path}")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_page_isolated, pdf_path, page_number, threshold, debug_dir,
+                                   recorder is not None, dpi, parse_level(debug_level), strips, runlength)
+                   for page_number in range(num_pages)]
+        page_results = [future.result() for future in futures]
+
+    for page_number, result in enumerate(page_results):
+        if result is None:
+            print(f"Skipping page {page_number + 1}: it could not be processed")
+        elif recorder is not None:
+            recorder.merge(result.pop('stages'), result.pop('recorder_origin'))
+    page_results = [result for result in page_results if result is not None]
+
+    if not page_results:
+        print(f"Could not process any page of {pdf_path}")
+        return None
+
+    with stage(recorder, 'midi'):
+        assigned_notes = stitch_pages(page_results)
+        return add_midi({'pages': page_results, 'assigned_notes': assigned_notes}, assigned_notes, output_name,
+                        output_dir, page_timeline(page_results, dpi, polyphonic))
+
+
+def staff_chunks(stream, assigned_notes, bar_offset=0, recorder=None, page_number=0):
+    """Add the notes of a page to a PianoMidiStream one staff at a time, yielding (bar, MidiChunk) pairs with
+    the bar numbers of the whole score. Each chunk is timed as a 'midi' stage by the recorder, if one is given."""
+    for bar, notes in itertools.groupby(assigned_notes, key=lambda note: int(note[0])):
+        with stage(recorder, 'midi', page=page_number, bar=bar + bar_offset):
+            chunk = stream.add(list(notes))
+        yield bar + bar_offset, chunk
+
+
+def stream_pipeline(pdf_path, output_name=None, output_dir="midi_files", threshold=185, all_pages=False,
+                    max_workers=None, dpi=None, tempo=None, time_signature=None, recorder=None, parallel=True,
+                    strips=False, runlength=False):
+    """Convert a PDF to MIDI incrementally, yielding one (page_number, bar, MidiChunk) per staff, so that
+    playback can start before the whole score is recognised. Chunks arrive a page at a time: the staves of a
+    page are emitted together once that page has been recognised, one chunk per staff.
+
+    With all_pages=True the pages run in worker processes as in run_pipeline_pages and are emitted in page
+    order, each as soon as it and every page before it are done. Pages that cannot be processed are skipped.
+    Without it the one page is emitted when it is done, so only all_pages gets playback going early.
+    Once every chunk is out, the complete MIDI file (the same as run_pipeline or run_pipeline_pages writes) is
+    saved to output_dir unless output_dir is None. recorder, parallel, strips and runlength work as in
+    run_pipeline and run_pipeline_pages. The chunks play the notes one after another; the polyphonic timeline
+    needs both staves of a system before it can time either, so it cannot be streamed staff by staff.
+    """
+    pdf_path = os.path.abspath(pdf_path)
+    if output_name is None:
+        output_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    stream = PianoMidiStream(tempo, time_signature)
+
+    if all_pages:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(process_page_isolated, pdf_path, page_number, threshold, dpi=dpi,
+                                       instrument=recorder is not None, strips=strips, runlength=runlength)
+                       for page_number in range(count_pages(pdf_path))]
+            bar_offset = 0
+            for page_number, future in enumerate(futures):
+                result = future.result()
+                if result is None:
+                    print(f"Skipping page {page_number + 1}: it could not be processed")
+                    continue
+                if recorder is not None:
+                    recorder.merge(result.pop('stages'), result.pop('recorder_origin'))
+                for bar, chunk in staff_chunks(stream, result['assigned_notes'], bar_offset, recorder, page_number):
+                    yield page_number, bar, chunk
+                bar_offset += max((bar for bar, _, _, _ in result['notes_data']), default=0)
+    else:
+        result = process_page(pdf_path, threshold=threshold, recorder=recorder, dpi=dpi, parallel=parallel,
+                              strips=strips, runlength=runlength)
+        if result is None:
+            print(f"Could not process {pdf_path}")
+            return
+        for bar, chunk in staff_chunks(stream, result['assigned_notes'], recorder=recorder):
+            yield 0, bar, chunk
+
+    if output_dir is not None and stream.chunks:
+        os.makedirs(output_dir, exist_ok=True)
+        midi_path = os.path.join(output_dir, f"{output_name}.mid")
+        stream.midi.save(midi_path)
+        print(f"Piano MIDI file created successfully: {midi_path}")
+
+
+def cacheable(result):
+    """Keep the plain-data part of a run_pipeline or run_pipeline_pages result."""
+    if 'pages' in result:
+        return {
+            'pages': [{key: page[key] for key in CACHED_KEYS} for page in result['pages']],
+            'assigned_notes': result['assigned_notes'],
+        }
+    return {key: result[key] for key in CACHED_KEYS}
+
+
+def run_pipeline_cached(pdf_path, cache, output_name=None, output_dir="midi_files", threshold=185, all_pages=False,
+                        max_workers=None, recorder=None, dpi=None, strips=False, polyphonic=False,
+                        runlength=False, parallel=True):
+    """Convert a PDF through the result cache.
+
+    The cache key combines the PDF bytes with the parameters below, so a hit skips rasterisation and every
+    detection stage: the cached MIDI file is copied to output_dir and the cached structured results are
+    returned with 'cached' set to True. A miss runs the pipeline and stores its result. parallel only decides
+    how a miss runs the detectors of a single page, not what they find, so it is not part of the key.
+    """
+    if output_name is None:
+        output_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    params = {'threshold': threshold, 'all_pages': all_pages, 'dpi': dpi or 72, 'strips': strips,
+              'polyphonic': polyphonic, 'runlength': runlength}
+
+    start = time.perf_counter()
+    key = cache_key(pdf_path, params)
+    hit = cache.get(key)
+    if hit is not None:
+        cached_midi_path, result = hit
+        os.makedirs(output_dir, exist_ok=True)
+        result['midi_path'] = os.path.join(output_dir, f"{output_name}.mid")
+        shutil.copyfile(cached_midi_path, result['midi_path'])
+        result['cached'] = True
+        print(f"Cache hit for {pdf_path} ({(time.perf_counter() - start) * 1000:.1f} ms)")
+        return result
+
+    if all_pages:
+        result = run_pipeline_pages(pdf_path, output_name, output_dir, threshold, max_workers, recorder=recorder,
+                                    dpi=dpi, strips=strips, polyphonic=polyphonic, runlength=runlength)
+    else:
+        result = run_pipeline(pdf_path, output_name, output_dir, threshold, recorder=recorder, dpi=dpi,
+                              parallel=parallel, strips=strips, polyphonic=polyphonic, runlength=runlength)
+
+    if result is not None:
+        cache.put(key, result['midi_path'], cacheable(result))
+        result['cached'] = False
+    return result
@@ -1,3 +1,8 @@
+import numpy as np
+
+from note_tables import processed_notes_lines, write_lines
+
+
 def read_results_file_and_create_folder(file_path):
     """
     Reads the results.txt file and creates a new folder called 'pitch_identification'.
@@ -41,10 +46,55 @@ def assign_note_duration(note_type):
     return duration_mapping.get(note_type.lower(), 0)  # Default to 0 if note type is unknown
 
 
-def process_notes_with_staffs(notes_data, staff_lines, num_bars, output_file="processed_notes.txt"):
+def staff_position(cy_differences):
+    """Position of a note on its staff from the row differences to the five staff lines ("On Line 3",
+    "Between Line 1 and Line 2", "Below Line 5", ...), or None when no rule places it."""
+    note_position = None
+
+    # First loop: Check if note is exactly on a line
+    for i, diff in enumerate(cy_differences):
+        if diff == 0:
+            note_position = f"On Line {i + 1}"
+            break
+        elif abs(diff) == 1:
+            note_position = f"On Line {i + 1}"
+
+    # Second check: Find two closest values to zero
+    if note_position is None:
+        sorted_diffs = sorted(enumerate(cy_differences), key=lambda x: abs(x[1]))
+
+        # Get the two closest differences to zero
+        closest_idx, closest_diff = sorted_diffs[0]
+        second_closest_idx, second_closest_diff = sorted_diffs[1]
+
+        # Correct absolute difference calculation
+        diff_value = abs(abs(closest_diff) - abs(second_closest_diff))
+
+        # Check if they are adjacent staff lines
+        if diff_value <= 1:
+            note_position = f"Between Line {closest_idx + 1} and Line {second_closest_idx + 1}"
+        elif diff_value == 6 and closest_diff == cy_differences[4] and closest_diff < 7:
+            note_position = "Below Line 5"
+        elif diff_value == 2 and closest_diff == cy_differences[4]:
+            note_position = f"Between Line {second_closest_idx + 1} and Line {closest_idx + 1}"
+        elif diff_value == 2 and closest_diff == cy_differences[2]:
+            note_position = f"Between Line {second_closest_idx + 1} and Line {closest_idx + 1}"
+        elif closest_diff == 7 and closest_diff == cy_differences[4]:
+            note_position = "Below Line"
+        elif closest_diff > 2 and closest_diff == cy_differences[4]:
+            note_position = "Below Line"
+        elif diff_value == 2:
+            closest_idx = cy_differences.index(closest_diff)
+            note_position = f"On Line {closest_idx + 1}"
+
+    return note_position
+
+
+def process_notes_with_staffs(notes_data, staff_lines, num_bars, output_file=None):
     """
     Processes notes to compute the CY differences relative to the staff lines.
     Assigns a duration based on the note type.
+    Returns the processed notes, which are also written to output_file when one is given.
     """
     grouped_staffs = [staff_lines[i:i + 5] for i in range(0, len(staff_lines), 5)]
 
@@ -64,59 +114,100 @@ def process_notes_with_staffs(notes_data, staff_lines, num_bars, output_file="pr
         staff_y_values = grouped_staffs[bar_number - 1]
         cy_differences = [note_y - staff_y for staff_y in staff_y_values]
 
-        note_position = None
-
-        # First loop: Check if note is exactly on a line
-        for i, diff in enumerate(cy_differences):
-            if diff == 0:
-                note_position = f"On Line {i + 1}"
-                break
-            elif abs(diff) == 1:
-                note_position = f"On Line {i + 1}"
-
-        # Second check: Find two closest values to zero
-        if note_position is None:
-            sorted_diffs = sorted(enumerate(cy_differences), key=lambda x: abs(x[1]))
-
-            # Get the two closest differences to zero
-            closest_idx, closest_diff = sorted_diffs[0]
-            second_closest_idx, second_closest_diff = sorted_diffs[1]
-
-            # Correct absolute difference calculation
-            diff_value = abs(abs(closest_diff) - abs(second_closest_diff))
-
-            # Print for debugging
-            print(f"Closest to 0: {closest_diff} (Index {closest_idx + 1}), "
-                  f"Second Closest: {second_closest_diff} (Index {second_closest_idx + 1}), "
-                  f"Corrected Absolute Difference: {diff_value}")
-
-            # Check if they are adjacent staff lines
-            if diff_value <= 1:
-                note_position = f"Between Line {closest_idx + 1} and Line {second_closest_idx + 1}"
-            elif diff_value == 6 and closest_diff == cy_differences[4] and closest_diff < 7:
-                note_position = "Below Line 5"
-            elif diff_value == 2 and closest_diff == cy_differences[4]:
-                note_position = f"Between Line {second_closest_idx + 1} and Line {closest_idx + 1}"
-            elif diff_value == 2 and closest_diff == cy_differences[2]:
-                note_position = f"Between Line {second_closest_idx + 1} and Line {closest_idx + 1}"
-            elif closest_diff == 7 and closest_diff == cy_differences[4]:
-                note_position = "Below Line"
-            elif closest_diff > 2 and closest_diff == cy_differences[4]:
-                note_position = "Below Line"
-            elif diff_value == 2:
-                closest_idx = cy_differences.index(closest_diff)
-                note_position = f"On Line {closest_idx + 1}"
-
+        note_position = staff_position(cy_differences)
 
         duration = assign_note_duration(note_type)
 
         processed_notes.append((bar_number, note_type, note_x, note_y, cy_differences, note_position, duration))
 
-    with open(output_file, "w") as f:
-        for bar, note_type, cx, cy, differences, position, duration in processed_notes:
-            position_text = f", Position: {position}" if position is not None else ", Position: Unknown"
-            f.write(
-                f" {bar}, {note_type}, CX {cx}, CY {cy}, Differences: {differences}{position_text}"
-                f", Duration: {duration} beats\n")
+    if output_file is not None:
+        write_lines(output_file, processed_notes_lines(processed_notes))
+        print(f"Processed {len(processed_notes)} notes and saved results to {output_file}")
+
+    return processed_notes
+
 
-    print(f"Processed {len(processed_notes)} notes and saved results to {output_file}")
\ No newline at end of file
+def complete_staves(staff_lines):
+    """The staff line rows as an (n, 5) array, one row per complete staff of five lines."""
+    count = len(staff_lines) // 5 * 5
+    return np.asarray(staff_lines[:count], dtype=np.float64).reshape(-1, 5)
+
+
+def staff_steps(staves, staff_index, note_y):
+    """Diatonic staff steps of notes, for all notes at once.
+
+    Step 0 is the top line of the note's staff, 1 the space below it, and so on down to 8 on the bottom line.
+    Notes above the staff get negative steps and notes below it steps above 8 (ledger lines). staves is an
+    (n, 5) array of line rows, staff_index the 0-based staff of each note and note_y its centre row.
+
+    On the staff the steps follow the rules of staff_position: a note is in a space only when it lies within
+    half a pixel of the middle between its two lines (and more than a pixel from both), and otherwise on the
+    nearer line; one pixel off the middle still counts as the space when the nearer line is line 3 or line 5.
+    Above and below the staff the offset from the outer line is rounded to half line spacings.
+    """
+    rows = staves[np.asarray(staff_index, dtype=np.intp)]
+    y = np.asarray(note_y, dtype=np.float64)
+    notes = np.arange(len(y))
+
+    half_space = (rows[:, 4] - rows[:, 0]) / 8
+    offset = y - rows[:, 0]
+    outside = np.divide(offset, half_space, out=np.zeros_like(offset), where=half_space > 0)
+
+    # The two lines around the note: k is the upper one (0-based)
+    k = np.clip((rows <= y[:, None]).sum(axis=1) - 1, 0, 3)
+    from_upper = y - rows[notes, k]
+    from_lower = rows[notes, k + 1] - y
+    nearest = np.where(from_upper <= from_lower, k, k + 1)
+    distance = np.minimum(from_upper, from_lower)
+    skew = np.abs(from_lower - from_upper)  # Difference of the distances to the two lines
+    space = (distance > 1) & ((skew <= 1) | ((skew == 2) & ((nearest == 2) | (nearest == 4))))
+    inside = np.where(space, 2 * k + 1, 2 * nearest)
+
+    on_staff = (y >= rows[:, 0]) & (y <= rows[:, 4])
+    return np.where(on_staff, inside, np.rint(outside)).astype(np.int64)
+
+
+def step_position(step):
+    """Readable position of a staff step, in the wording of staff_position where it overlaps."""
+    if step < 0:
+        return f"Above Line 1 by {-step} steps"
+    if step > 8:
+        return f"Below Line 5 by {step - 8} steps"
+    if step % 2 == 0:
+        return f"On Line {step // 2 + 1}"
+    return f"Between Line {step // 2 + 1} and Line {step // 2 + 2}"
+
+
+def process_notes_with_steps(notes_data, staff_lines, num_bars, output_file="processed_notes.txt"):
+    """Vectorized process_notes_with_staffs: place every note on its staff with staff_steps instead of
+    matching the row differences note by note. Notes whose bar has no complete staff are skipped and counted.
+
+    Returns (processed_notes, steps): processed_notes has the tuples of process_notes_with_staffs with the
+    position named by step_position, and steps holds the staff step of each of them. The notes are also written
+    to output_file unless it is None.
+    """
+    staves = complete_staves(staff_lines)
+    bars = np.array([note[0] for note in notes_data], dtype=np.int64)
+    note_y = np.array([note[3] for note in notes_data], dtype=np.int64)
+
+    valid = (bars >= 1) & (bars <= min(num_bars, len(staves)))
+    skipped = len(notes_data) - int(valid.sum())
+    if skipped:
+        print(f"Skipping {skipped} notes whose bar number has no staff ({len(staves)} complete staves, "
+              f"{num_bars} bars)")
+
+    staff_index = bars[valid] - 1
+    steps = staff_steps(staves, staff_index, note_y[valid])
+    differences = (note_y[valid, None] - staves[staff_index]).astype(np.int64).tolist()
+
+    kept_notes = [note for note, ok in zip(notes_data, valid.tolist()) if ok]
+    processed_notes = [
+        (bar_number, note_type, cx, cy, diffs, step_position(step), assign_note_duration(note_type))
+        for (bar_number, note_type, cx, cy), diffs, step in zip(kept_notes, differences, steps.tolist())
+    ]
+
+    if output_file is not None:
+        write_lines(output_file, processed_notes_lines(processed_notes))
+        print(f"Processed {len(processed_notes)} notes and saved results to {output_file}")
+
+    return processed_notes, steps
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# Bump when the pipeline changes in a way that makes cached results stale
+CACHE_VERSION = 11
+
+
+def hash_pdf(pdf_path, chunk_size=1 << 20):
+    """SHA-256 of the PDF bytes."""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(pdf_path, params):
+    """Key a conversion by the PDF content and the parameters that change its result."""
+    digest = hashlib.sha256()
+    digest.update(hash_pdf(pdf_path).encode())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    digest.update(str(CACHE_VERSION).encode())
+    return digest.hexdigest()
+
+
+def as_tuples(value):
+    """JSON turns tuples into lists; turn lists of records back into lists of tuples."""
+    if isinstance(value, list):
+        return [tuple(item) if isinstance(item, list) else item for item in value]
+    return value
+
+
+class ResultCache:
+    """Content-addressed cache of conversions on local disk.
+
+    Each entry is a folder named after its key holding the MIDI file and the structured results as JSON.
+    Entries are evicted least recently used first once the cache holds more than max_entries entries or
+    max_bytes bytes. A hit refreshes the entry's modification time, which is what the LRU order uses.
+    """
+
+    def __init__(self, cache_dir='result_cache', max_bytes=512 * 1024 * 1024, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """Return (midi_path, results) for a cached key, or None on a miss."""
+        entry_dir = self.entry_dir(key)
+        midi_path = os.path.join(entry_dir, 'result.mid')
+        try:
+            with open(os.path.join(entry_dir, 'results.json')) as file:
+                results = json.load(file)
+            os.utime(entry_dir)  # Mark as recently used
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(midi_path):
+            return None
+
+        results = {name: as_tuples(value) for name, value in results.items()}
+        if 'pages' in results:
+            results['pages'] = [{name: as_tuples(value) for name, value in page.items()}
+                                for page in results['pages']]
+        return midi_path, results
+
+    def put(self, key, midi_path, results):
+        """Store a MIDI file and its JSON-serialisable results under the key, then evict old entries."""
+        entry_dir = self.entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # Build the entry next to its final place and rename it, so readers never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp_')
+        try:
+            shutil.copyfile(midi_path, os.path.join(tmp_dir, 'result.mid'))
+            with open(os.path.join(tmp_dir, 'results.json'), 'w') as file:
+                json.dump(results, file)
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def entries(self):
+        """List (mtime, size, path) of every entry, oldest first."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('.') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue  # Evicted by another process meanwhile
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within its limits."""
+        entries = self.entries()
+        total_bytes = sum(size for _, size, _ in entries)
+
+        while entries and ((self.max_bytes is not None and total_bytes > self.max_bytes) or
+                           (self.max_entries is not None and len(entries) > self.max_entries)):
+            _, size, path = entries.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total_bytes -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
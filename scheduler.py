@@ -0,0 +1,97 @@
+import os
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from instrumentation import StageRecorder, stage
+
+# Where a task runs: THREAD for work that releases the GIL (OpenCV and NumPy calls), PROCESS for work that
+# holds it (pure-Python loops). Process tasks need a picklable function, arguments and result.
+THREAD = 'thread'
+PROCESS = 'process'
+
+# One node of a task graph. The task runs func(*args, *dependency_results) once every task named in deps has
+# finished, with the dependency results appended in the order of deps.
+Task = namedtuple('Task', ['name', 'func', 'args', 'deps', 'kind'])
+
+
+def task(name, func, *args, deps=(), kind=THREAD):
+    return Task(name, func, args, tuple(deps), kind)
+
+
+def run_in_stage(recorder, name, info, func, args):
+    with stage(recorder, name, **info):
+        return func(*args)
+
+
+def run_in_process(name, info, instrument, func, args):
+    """Run a task in a worker process, returning its result with the stage timing recorded there."""
+    recorder = StageRecorder() if instrument else None
+    result = run_in_stage(recorder, name, info, func, args)
+    if recorder is None:
+        return result, None, None
+    return result, recorder.stages, recorder.origin
+
+
+def ready_tasks(pending, results):
+    return [t for t in pending.values() if all(dep in results for dep in t.deps)]
+
+
+def run_tasks(tasks, max_workers=None, recorder=None, parallel=True, **info):
+    """Run a graph of tasks, each as soon as its dependencies have finished, and return {name: result}.
+
+    Independent tasks run at the same time on a thread pool, or a process pool for PROCESS tasks. Each task is
+    timed as a stage by the recorder, tagged with info. With parallel=False the tasks run one after another in
+    the calling thread, in dependency order. An exception in a task is raised once the running tasks finish.
+    """
+    pending = {t.name: t for t in tasks}
+    results = {}
+
+    if not parallel:
+        while pending:
+            ready = ready_tasks(pending, results)
+            if not ready:
+                raise ValueError(f"Tasks with missing or circular dependencies: {sorted(pending)}")
+            for t in ready:
+                del pending[t.name]
+                results[t.name] = run_in_stage(recorder, t.name, info, t.func,
+                                               t.args + tuple(results[dep] for dep in t.deps))
+        return results
+
+    if max_workers is None:
+        max_workers = min(len(pending), os.cpu_count() or 1) or 1
+    threads = ThreadPoolExecutor(max_workers=max_workers)
+    processes = None
+    running = {}
+
+    try:
+        while pending or running:
+            # Submit process tasks first, so worker processes are started before more threads are busy
+            for t in sorted(ready_tasks(pending, results), key=lambda t: t.kind != PROCESS):
+                del pending[t.name]
+                args = t.args + tuple(results[dep] for dep in t.deps)
+                if t.kind == PROCESS:
+                    if processes is None:
+                        processes = ProcessPoolExecutor(max_workers=max_workers)
+                    future = processes.submit(run_in_process, t.name, info, recorder is not None, t.func, args)
+                else:
+                    future = threads.submit(run_in_stage, recorder, t.name, info, t.func, args)
+                running[future] = t
+
+            if not running:
+                raise ValueError(f"Tasks with missing or circular dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                t = running.pop(future)
+                result = future.result()
+                if t.kind == PROCESS:
+                    result, stages, origin = result
+                    if stages is not None:
+                        recorder.merge(stages, origin)
+                results[t.name] = result
+    finally:
+        threads.shutdown()
+        if processes is not None:
+            processes.shutdown()
+
+    return results
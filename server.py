@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from flask import Flask, jsonify, request, send_file
+
+from grayscalebinarize import count_pages
+from instrumentation import StageRecorder
+from pipeline import CACHED_KEYS, add_midi, isolated_workspace, process_page, run_pipeline, stitch_pages
+
+# Stages of a single-page conversion in the order they finish; a job's progress is the share of them done
+PROGRESS_STAGES = ('rasterise', 'binarize', 'staff_detection', 'staff_removal', 'clef', 'notehead', 'stem',
+                   'beam', 'bar', 'bbox_pruning', 'note_identification', 'segmentation', 'pitch', 'midi')
+
+# Set in each worker process by warm_worker
+progress_events = None
+
+
+def warm_worker(events):
+    """Initializer of the worker processes: import the heavy libraries once per worker instead of per job."""
+    global progress_events
+    progress_events = events
+    import cv2  # noqa: F401
+    import fitz  # noqa: F401
+    import mido  # noqa: F401
+    import pipeline  # noqa: F401  (imports every detection stage)
+
+
+class ProgressRecorder(StageRecorder):
+    """Stage recorder that reports every finished stage of a job to the server process."""
+
+    def __init__(self, job_id, events):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+
+    @contextlib.contextmanager
+    def stage(self, name, **info):
+        with super().stage(name, **info) as stage_info:
+            yield stage_info
+        self.events.put((self.job_id, name))
+
+
+def job_recorder(job_id):
+    return ProgressRecorder(job_id, progress_events) if progress_events is not None else None
+
+
+def run_job(job_id, pdf_path):
+    """Convert the first page of one uploaded PDF in a worker process. The MIDI file is built in memory and
+    never written to disk. Returns (midi_bytes, error, seconds)."""
+    start = time.perf_counter()
+    try:
+        # Each job gets its own workspace, so the fixed stage folders of concurrent jobs do not collide
+        with isolated_workspace():
+            result = run_pipeline(pdf_path, job_id, None, recorder=job_recorder(job_id))
+    except Exception:
+        return None, traceback.format_exc(limit=3), time.perf_counter() - start
+
+    if result is None:
+        return None, "no page could be processed", time.perf_counter() - start
+    return result['midi_bytes'], None, time.perf_counter() - start
+
+
+def run_page(job_id, pdf_path, page_number):
+    """Process one page of an all-pages job in a worker process. Returns the plain-data part of the page
+    result (see pipeline.CACHED_KEYS), or None if the page could not be processed."""
+    with isolated_workspace():
+        result = process_page(pdf_path, page_number, recorder=job_recorder(job_id), parallel=False)
+    return {key: result[key] for key in CACHED_KEYS} if result is not None else None
+
+
+class ConversionService:
+    """Queue of conversion jobs served by a pool of pre-warmed worker processes.
+
+    Uploads wait in a bounded queue; submit() refuses new jobs once max_pending are waiting, so a burst of
+    uploads is absorbed up to that point and rejected beyond it instead of piling up. One dispatcher thread
+    per worker takes jobs from the queue and runs them on the process pool; the pages of an all-pages job are
+    spread over the same pool. Job state, including the finished MIDI files, is kept in memory: a finished
+    job is dropped job_ttl seconds after it finishes, and the oldest finished jobs are dropped once more than
+    max_finished are kept.
+    """
+
+    def __init__(self, upload_dir='uploads', workers=2, max_pending=16, job_ttl=3600, max_finished=256):
+        self.upload_dir = os.path.abspath(upload_dir)
+        os.makedirs(self.upload_dir, exist_ok=True)
+
+        self.workers = workers
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.pending = queue.Queue(maxsize=max_pending)
+
+        self.events = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=warm_worker, initargs=(self.events,))
+        self.warm_up()
+
+        self.threads = [threading.Thread(target=self.dispatch, name=f'dispatcher-{i}', daemon=True)
+                        for i in range(workers)]
+        self.threads.append(threading.Thread(target=self.collect_progress, name='progress', daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def warm_up(self):
+        """Start every worker process now, so the first uploads do not pay for interpreter start and imports."""
+        for future in [self.executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, file, filename, all_pages=False):
+        """Store an uploaded PDF and queue its conversion. Returns the job id, or None if the queue is full."""
+        job_id = uuid.uuid4().hex
+        pdf_path = os.path.join(self.upload_dir, f"{job_id}.pdf")
+        job = {
+            'job_id': job_id,
+            'filename': filename,
+            'status': 'queued',
+            'progress': 0.0,
+            'midi': None,
+            'error': None,
+            'seconds': None,
+            'submitted': time.time(),
+        }
+
+        with self.lock:
+            self.expire()
+            if self.pending.full():
+                return None
+            file.save(pdf_path)
+            self.jobs[job_id] = job
+            self.pending.put_nowait((job_id, pdf_path, all_pages))
+        return job_id
+
+    def status(self, job_id):
+        """A copy of the job's state, with its place in the queue while it waits, or None for unknown ids."""
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            if job['status'] == 'queued':
+                waiting = [queued_id for queued_id, _, _ in list(self.pending.queue)]
+                job['queue_position'] = waiting.index(job_id) + 1 if job_id in waiting else 0
+        return job
+
+    def update(self, job_id, **changes):
+        with self.lock:
+            self.jobs[job_id].update(changes)
+
+    def expire(self):
+        """Drop the finished jobs older than job_ttl, then the oldest finished jobs beyond max_finished. Called
+        with the lock held."""
+        finished = sorted((job['finished'], job_id) for job_id, job in self.jobs.items() if 'finished' in job)
+        cutoff = time.time() - self.job_ttl
+        expired = [job_id for finished_at, job_id in finished if finished_at < cutoff]
+        kept = [job_id for finished_at, job_id in finished if finished_at >= cutoff]
+        expired += kept[:max(len(kept) - self.max_finished, 0)]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def run_pages(self, job_id, pdf_path):
+        """Convert every page of a PDF: the pages run as separate tasks on the process pool and are stitched in
+        page order here, skipping pages that cannot be processed. Returns (midi_bytes, error, seconds)."""
+        start = time.perf_counter()
+        num_pages = count_pages(pdf_path)
+        self.update(job_id, pages=num_pages, pages_done=0)
+        futures = [self.executor.submit(run_page, job_id, pdf_path, page_number) for page_number in range(num_pages)]
+        for done, _ in enumerate(as_completed(futures), 1):
+            self.update(job_id, pages_done=done, progress=min(done / num_pages, 0.99))
+
+        page_results = [result for result in (future.result() for future in futures) if result is not None]
+        if not page_results:
+            return None, "no page could be processed", time.perf_counter() - start
+        assigned_notes = stitch_pages(page_results)
+        result = add_midi({'assigned_notes': assigned_notes}, assigned_notes, job_id, None)
+        return result['midi_bytes'], None, time.perf_counter() - start
+
+    def dispatch(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            job_id, pdf_path, all_pages = item
+            self.update(job_id, status='running', started=time.time())
+            try:
+                if all_pages:
+                    midi, error, seconds = self.run_pages(job_id, pdf_path)
+                else:
+                    midi, error, seconds = self.executor.submit(run_job, job_id, pdf_path).result()
+            except Exception:
+                # A page failed or a worker process died (then the pool is broken from here on)
+                midi, error, seconds = None, traceback.format_exc(limit=3), None
+            finally:
+                with contextlib.suppress(OSError):
+                    os.remove(pdf_path)
+
+            if error is None:
+                self.update(job_id, status='done', progress=1.0, midi=midi, seconds=seconds, finished=time.time())
+            else:
+                self.update(job_id, status='failed', error=error, seconds=seconds, finished=time.time())
+            print(f"[{'ok' if error is None else 'FAILED'}] job {job_id}")
+
+    def collect_progress(self):
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            job_id, stage_name = event
+            if stage_name not in PROGRESS_STAGES:
+                continue
+            progress = (PROGRESS_STAGES.index(stage_name) + 1) / len(PROGRESS_STAGES)
+            with self.lock:
+                job = self.jobs.get(job_id)
+                # The progress of an all-pages job counts its finished pages (see run_pages)
+                if job is not None and job['status'] == 'running' and 'pages' not in job:
+                    job['progress'] = max(job['progress'], min(progress, 0.99))
+
+    def shutdown(self):
+        for _ in range(self.workers):
+            self.pending.put(None)
+        self.executor.shutdown()
+        self.events.put(None)
+
+
+def create_app(service=None, **service_options):
+    """Build the Flask app around a ConversionService (created from service_options when none is given).
+
+    Endpoints:
+        POST /convert              upload a PDF as the 'file' form field (optional form field all_pages=1);
+                                   202 with the job id, 503 when the queue is full
+        GET  /jobs/<job_id>        status, progress (0 to 1) and queue position of a job
+        GET  /jobs/<job_id>/midi   the MIDI file of a finished job
+        GET  /health               worker count and queue length
+    """
+    app = Flask(__name__)
+    app.config['service'] = service if service is not None else ConversionService(**service_options)
+
+    def public(job):
+        job = {key: value for key, value in job.items() if key != 'midi'}
+        if job['status'] == 'done':
+            job['midi_url'] = f"/jobs/{job['job_id']}/midi"
+        return job
+
+    @app.route('/convert', methods=['POST'])
+    def convert():
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify(error="no file uploaded as 'file'"), 400
+        if not file.filename.lower().endswith('.pdf'):
+            return jsonify(error="only PDF files are accepted"), 400
+
+        all_pages = request.form.get('all_pages', '').lower() in ('1', 'true', 'yes')
+        job_id = app.config['service'].submit(file, file.filename, all_pages)
+        if job_id is None:
+            response = jsonify(error="the conversion queue is full, try again later")
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        return jsonify(job_id=job_id, status_url=f"/jobs/{job_id}"), 202
+
+    @app.route('/jobs/<job_id>')
+    def job_status(job_id):
+        job = app.config['service'].status(job_id)
+        if job is None:
+            return jsonify(error="unknown job"), 404
+        return jsonify(public(job))
+
+    @app.route('/jobs/<job_id>/midi')
+    def job_midi(job_id):
+        job = app.config['service'].status(job_id)
+        if job is None:
+            return jsonify(error="unknown job"), 404
+        if job['status'] != 'done':
+            return jsonify(error=f"job is {job['status']}"), 409
+        download_name = f"{os.path.splitext(job['filename'])[0]}.mid"
+        return send_file(io.BytesIO(job['midi']), mimetype='audio/midi', as_attachment=True,
+                         download_name=download_name)
+
+    @app.route('/health')
+    def health():
+        service_ = app.config['service']
+        return jsonify(workers=service_.workers, queued=service_.pending.qsize())
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP service that converts uploaded music PDFs to MIDI.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes converting PDFs (default: number of CPUs)")
+    parser.add_argument('--max-queue', type=int, default=32,
+                        help="Uploads that may wait for a worker; further uploads get 503")
+    parser.add_argument('--upload-dir', default='uploads', help="Folder for uploaded PDFs while they wait")
+    parser.add_argument('--job-ttl', type=float, default=3600,
+                        help="Seconds a finished job and its MIDI file are kept (default: 3600)")
+    parser.add_argument('--max-finished', type=int, default=256,
+                        help="Finished jobs kept at most; the oldest are dropped first (default: 256)")
+    args = parser.parse_args()
+
+    conversion_service = ConversionService(args.upload_dir, args.workers, args.max_queue, args.job_ttl,
+                                           args.max_finished)
+    try:
+        create_app(conversion_service).run(host=args.host, port=args.port, threaded=True)
+    finally:
+        conversion_service.shutdown()
@@ -0,0 +1,84 @@
+from collections import namedtuple
+
+import cv2
+
+from staff_removal import find_staff_line_rows, vertical_crop_bounds
+
+
+# Staff lines of one page, detected once and shared by every stage that needs them. All rows are in page
+# coordinates; cropped_line_rows() translates them to the cropped images produced by staff_removal.crop_image.
+#   raw_rows:  every page row dark enough to belong to a staff line
+#   line_rows:   one row per staff line (the last row of each line)
+#   staves:      the line_rows inside the vertical crop grouped into staves of five lines
+#   thickness:   thickness of the thickest line in rows
+#   spacing:     median distance between neighbouring lines of a staff
+#   crop_top:    first page row kept by the vertical crop
+#   crop_bottom: page row after the last one kept by the vertical crop
+StaffModel = namedtuple('StaffModel', ['raw_rows', 'line_rows', 'staves', 'thickness', 'spacing', 'crop_top',
+                                       'crop_bottom'])
+
+
+def group_line_rows(raw_rows, max_gap=2):
+    """Merge runs of staff rows no more than max_gap apart into lines. Returns (line_rows, thickness)."""
+    line_rows = []
+    thickness = 0
+    if not raw_rows:
+        return line_rows, thickness
+
+    first_row = prev_row = raw_rows[0]
+    for row in raw_rows[1:]:
+        if row - prev_row > max_gap:  # If gap > 2 pixels, consider it a new line
+            line_rows.append(prev_row)
+            thickness = max(thickness, prev_row - first_row + 1)
+            first_row = row
+        prev_row = row
+    line_rows.append(prev_row)  # Append last detected row
+    thickness = max(thickness, prev_row - first_row + 1)
+
+    return line_rows, thickness
+
+
+def detect_staff(binarized_img_array):
+    """Detect the staff lines of a binarized page in a single pass and return a StaffModel."""
+    raw_rows = find_staff_line_rows(binarized_img_array)
+    line_rows, thickness = group_line_rows(raw_rows)
+
+    bounds = vertical_crop_bounds(raw_rows, binarized_img_array.shape[0])
+    crop_top, crop_bottom = bounds if bounds is not None else (0, binarized_img_array.shape[0])
+
+    # Lines cut off by the crop (e.g. a rule under the last staff) are not in the page images the stages see
+    kept_rows = [row for row in line_rows if crop_top <= row < crop_bottom]
+    staves = [kept_rows[i:i + 5] for i in range(0, len(kept_rows), 5)]
+
+    gaps = sorted(b - a for staff in staves for a, b in zip(staff, staff[1:]))
+    spacing = float(gaps[len(gaps) // 2]) if gaps else 0.0
+
+    print(f"Detected {len(line_rows)} staff lines in {len(staves)} staves "
+          f"(thickness {thickness} px, spacing {spacing} px)")
+
+    return StaffModel(raw_rows, line_rows, staves, thickness, spacing, crop_top, crop_bottom)
+
+
+def cropped_line_rows(staff_model):
+    """The staff line rows inside the vertical crop, in the coordinates of the cropped page images."""
+    return [row - staff_model.crop_top for row in staff_model.line_rows
+            if staff_model.crop_top <= row < staff_model.crop_bottom]
+
+
+def cropped_staves(staff_model):
+    """The line rows of each staff in the coordinates of the cropped page images."""
+    return [[row - staff_model.crop_top for row in staff] for staff in staff_model.staves]
+
+
+def draw_staff_overlay(page_img, line_rows):
+    """A colour copy of the page with the given staff line rows marked in red."""
+    img_color = cv2.cvtColor(page_img, cv2.COLOR_GRAY2BGR)
+    for row in line_rows:
+        cv2.line(img_color, (0, row), (page_img.shape[1], row), (0, 0, 255), 1)  # Draw red lines
+    return img_color
+
+
+def save_staff_overlay(page_img, line_rows, save_path):
+    """Save the page with the given staff line rows marked in red."""
+    cv2.imwrite(save_path, draw_staff_overlay(page_img, line_rows))
+    print(f"Image with staff lines marked saved to: {save_path}")
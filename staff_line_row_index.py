@@ -1,15 +1,12 @@
 import cv2
 import numpy as np
 
+from staff_detection import group_line_rows, save_staff_overlay
 
-def getstafflinerow(image_path, save_path):
-    # Load the image in grayscale
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-
-    if img is None:
-        print(f"Error: Unable to load image {image_path}")
-        return None
 
+def getstafflinerow_array(img, save_path=None):
+    """Find the grouped staff line rows of a grayscale page array. The marked-up image is only saved when a
+    save path is given."""
     # Apply binary threshold (assuming staff lines are dark)
     _, binary_img = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY_INV)
 
@@ -21,27 +18,26 @@ def getstafflinerow(image_path, save_path):
     raw_staff_rows = [i for i, count in enumerate(black_pixel_counts) if count > staff_threshold]
 
     # Group consecutive rows to count thick lines as one
-    staff_line_rows = []
-    if raw_staff_rows:
-        prev_row = raw_staff_rows[0]
-        for row in raw_staff_rows[1:]:
-            if row - prev_row > 2:  # If gap > 2 pixels, consider it a new line
-                staff_line_rows.append(prev_row)
-            prev_row = row
-        staff_line_rows.append(prev_row)  # Append last detected row
+    staff_line_rows, _ = group_line_rows(raw_staff_rows)
 
     # Print the total number of detected staff lines
     total_staff_lines = len(staff_line_rows)
     print(f"Total detected staff lines: {total_staff_lines}")
     print(f"Identified staff line rows (grouped): {staff_line_rows}")
 
-    # Draw detected lines on the image
-    img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-    for row in staff_line_rows:
-        cv2.line(img_color, (0, row), (img.shape[1], row), (0, 0, 255), 1)  # Draw red lines
-
-    # Save the image with staff lines marked
-    cv2.imwrite(save_path, img_color)
-    print(f"Image with staff lines marked saved to: {save_path}")
+    if save_path is not None:
+        # Save the image with staff lines marked
+        save_staff_overlay(img, staff_line_rows, save_path)
 
     return staff_line_rows, total_staff_lines
+
+
+def getstafflinerow(image_path, save_path):
+    # Load the image in grayscale
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+
+    if img is None:
+        print(f"Error: Unable to load image {image_path}")
+        return None
+
+    return getstafflinerow_array(img, save_path)
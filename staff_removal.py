@@ -17,6 +17,13 @@ def calculate_histogram(binarized_image_path):
         print(f"Error loading image: {e}")
         return None
 
+    staff_line_rows = find_staff_line_rows(binarized_img_array)
+    height, width = binarized_img_array.shape
+
+    return staff_line_rows, binarized_img_array, height, width
+
+
+def find_staff_line_rows(binarized_img_array):
     # Print the dimensions of the image
     height, width = binarized_img_array.shape
     print(f"Image dimensions: height={height}, width={width}")
@@ -30,19 +37,75 @@ def calculate_histogram(binarized_image_path):
     print(f"Staff threshold: {staff_threshold}")
     staff_line_rows = [i for i, count in enumerate(black_pixel_counts) if count > staff_threshold]
 
-    return staff_line_rows, binarized_img_array, height, width
+    return staff_line_rows
 
 
 def remove_staff_lines(binarized_img_array, staff_line_rows, height, width):
     # Remove staff lines
     cleaned_img_array = binarized_img_array.copy()
+    no_neighbour = np.zeros(width, dtype=bool)
+    # Rows are cleaned in order because a staff row looks at the already cleaned row above it
     for row in staff_line_rows:
-        for col in range(width):
-            if cleaned_img_array[row, col] == 0:  # Pixel is part of staff line
-                above = row > 0 and cleaned_img_array[row - 1, col] == 0
-                below = row < height - 1 and cleaned_img_array[row + 1, col] == 0
-                if not (above and below):
-                    cleaned_img_array[row, col] = 255  # Set to white if not part of musical notation
+        line = cleaned_img_array[row]
+        above = cleaned_img_array[row - 1] == 0 if row > 0 else no_neighbour
+        below = cleaned_img_array[row + 1] == 0 if row < height - 1 else no_neighbour
+        # A black pixel is part of the staff line unless notation continues both above and below it
+        line[(line == 0) & ~(above & below)] = 255  # Set to white if not part of musical notation
+
+    return cleaned_img_array
+
+
+def vertical_run_lengths(black_mask):
+    """Return, for every pixel, the length of the vertical run of True pixels it belongs to (0 elsewhere)."""
+    height, width = black_mask.shape
+    # Work on columns laid out one after another, padded with a False row so runs cannot cross columns
+    columns = np.zeros((width, height + 1), dtype=bool)
+    columns[:, :height] = black_mask.T
+    flat = columns.ravel()
+
+    edges = np.diff(flat.astype(np.int8), prepend=0)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+
+    # Spread each run's length over its pixels with a cumulative sum of +length/-length markers
+    markers = np.zeros(flat.size + 1, dtype=np.int64)
+    markers[starts] = lengths
+    markers[ends] = -lengths
+    run_lengths = np.cumsum(markers[:-1]).reshape(width, height + 1)[:, :height]
+
+    return run_lengths.T
+
+
+def estimate_line_thickness(staff_line_rows):
+    """Thickness of the thickest staff line, counting consecutive staff rows as one line."""
+    if not staff_line_rows:
+        return 0
+
+    thickness = current = 1
+    for i in range(1, len(staff_line_rows)):
+        current = current + 1 if staff_line_rows[i] - staff_line_rows[i - 1] == 1 else 1
+        thickness = max(thickness, current)
+
+    return thickness
+
+
+def remove_staff_lines_runlength(binarized_img_array, staff_line_rows, line_thickness=None):
+    """Remove staff lines by erasing, on the staff rows, every vertical black run no longer than the line
+    thickness. Runs that continue past the line belong to notation and are kept, however thick the scanned
+    lines are."""
+    if line_thickness is None:
+        line_thickness = estimate_line_thickness(staff_line_rows)
+
+    cleaned_img_array = binarized_img_array.copy()
+    if not staff_line_rows:
+        return cleaned_img_array
+
+    rows = np.asarray(staff_line_rows)
+    run_lengths = vertical_run_lengths(binarized_img_array == 0)[rows]
+    staff_rows = cleaned_img_array[rows]
+    staff_rows[(run_lengths > 0) & (run_lengths <= line_thickness)] = 255
+    cleaned_img_array[rows] = staff_rows
 
     return cleaned_img_array
 
@@ -63,6 +126,18 @@ def crop_image(cleaned_img_array, staff_line_rows, height, width):
         cleaned_img_array = cleaned_img_array[:, first_col:last_col + 5]
 
     # Vertical cropping
+    bounds = vertical_crop_bounds(staff_line_rows, height)
+    if bounds is None:
+        return cleaned_img_array
+
+    top_crop, bottom_crop = bounds
+    cropped_img_array = cleaned_img_array[top_crop:bottom_crop, :]
+
+    return cropped_img_array
+
+
+def vertical_crop_bounds(staff_line_rows, height):
+    """Return the (top, bottom) rows that crop_image keeps, or None if it does not crop vertically."""
     staff_spacing = []
     for i in range(1, len(staff_line_rows)):
         spacing = staff_line_rows[i] - staff_line_rows[i - 1]
@@ -70,7 +145,7 @@ def crop_image(cleaned_img_array, staff_line_rows, height, width):
             staff_spacing.append(spacing)
 
     if len(staff_spacing) == 0:
-        return cleaned_img_array
+        return None
 
     average_spacing = sum(staff_spacing) / len(staff_spacing)
 
@@ -80,24 +155,41 @@ def crop_image(cleaned_img_array, staff_line_rows, height, width):
     top_crop = int(max(0, top_crop - 1))
     bottom_crop = int(min(height, bottom_crop + 10))
 
-    cropped_img_array = cleaned_img_array[int(top_crop):int(bottom_crop), :]
+    return top_crop, bottom_crop
 
-    return cropped_img_array
+
+def process_array(binarized_img_array, staff_line_rows=None, runlength=False, line_thickness=None):
+    """Crop the binarized page with and without staff lines, returning the staff rows and both arrays.
+    With runlength=True the lines are erased with remove_staff_lines_runlength instead."""
+    if staff_line_rows is None:
+        staff_line_rows = find_staff_line_rows(binarized_img_array)
+    height, width = binarized_img_array.shape
+
+    # Crop *without* removing staff lines
+    cropped_img_array_with_staff = crop_image(binarized_img_array, staff_line_rows, height, width)
+
+    # Crop *after* removing staff lines
+    if runlength:
+        cleaned_img_array = remove_staff_lines_runlength(binarized_img_array, staff_line_rows, line_thickness)
+    else:
+        cleaned_img_array = remove_staff_lines(binarized_img_array, staff_line_rows, height, width)
+    cropped_img_array_without_staff = crop_image(cleaned_img_array, staff_line_rows, height, width)
+
+    return staff_line_rows, cropped_img_array_with_staff, cropped_img_array_without_staff
 
 
 def process_image(binarized_image_path):
     staff_line_rows, binarized_img_array, height, width = calculate_histogram(binarized_image_path)
+    _, cropped_img_array_with_staff, cropped_img_array_without_staff = process_array(binarized_img_array,
+                                                                                     staff_line_rows)
 
     # Save cropped image *without* removing staff lines
-    cropped_img_array_with_staff = crop_image(binarized_img_array, staff_line_rows, height, width)
     cropped_img_with_staff = Image.fromarray(cropped_img_array_with_staff)
     cropped_image_path_with_staff = os.path.join(os.path.dirname(binarized_image_path),
                                                  f"{os.path.basename(binarized_image_path).replace('.png', '_cropped_with_staff.png')}")
     cropped_img_with_staff.save(cropped_image_path_with_staff)
 
     # Save cropped image *after* removing staff lines
-    cleaned_img_array = remove_staff_lines(binarized_img_array, staff_line_rows, height, width)
-    cropped_img_array_without_staff = crop_image(cleaned_img_array, staff_line_rows, height, width)
     cropped_img_without_staff = Image.fromarray(cropped_img_array_without_staff)
     cropped_image_path_without_staff = os.path.join(os.path.dirname(binarized_image_path),
                                                     f"{os.path.basename(binarized_image_path).replace('.png', '_cropped_without_staff.png')}")
@@ -1,62 +1,56 @@
-import os
 import numpy as np
 from PIL import Image
 import cv2  # OpenCV for image processing
 
+from artifacts import NO_ARTIFACTS, SUMMARY, ArtifactSink
 
-def process_image(image_array, output_folder):
+
+def process_image(image_array, artifacts=None):
     """Process the image by dilating, eroding, applying Canny edge detection, dilating again, and detecting vertical
-    lines using Hough Transform."""
+    lines using Hough Transform. Returns the image of detected vertical lines, or None if no lines were found.
+    Intermediate images go to the artifact sink, if one is given, under stem_images."""
+    artifacts = artifacts or NO_ARTIFACTS
+    folder = 'stem_images'
 
     # Dilate the image with a kernel size of 7x1 to enhance vertical lines
     dilation_kernel = np.ones((6, 1), np.uint8)
     dilated_img = cv2.dilate(image_array, dilation_kernel, iterations=1)
 
-    # Save the dilated image
-    dilated_output_path = os.path.join(output_folder, 'dilated_stem.png')
-    Image.fromarray(dilated_img).save(dilated_output_path)
-    print(f"Dilated image saved to: {dilated_output_path}")
+    artifacts.image(folder, 'dilated_stem.png', dilated_img)
 
     # Erode the dilated image with a kernel size
     erosion_kernel = np.ones((1, 3), np.uint8)
     eroded_img = cv2.erode(dilated_img, erosion_kernel, iterations=1)
 
-    # Save the eroded image
-    eroded_output_path = os.path.join(output_folder, 'eroded_stem.png')
-    Image.fromarray(eroded_img).save(eroded_output_path)
-    print(f"Eroded image saved to: {eroded_output_path}")
+    artifacts.image(folder, 'eroded_stem.png', eroded_img)
 
     # Apply Canny edge detection with an aperture size of 3
     edges = cv2.Canny(eroded_img, 50, 100, apertureSize=3)
 
-    # Save the image after Canny edge detection
-    canny_output_path = os.path.join(output_folder, 'canny_edges.png')
-    Image.fromarray(edges).save(canny_output_path)
-    print(f"Canny edges image saved to: {canny_output_path}")
+    artifacts.image(folder, 'canny_edges.png', edges)
 
     # Dilate the Canny edges image with a kernel size of 5x5 to thicken outlines
     dilation_kernel_2 = np.ones((3, 3), np.uint8)
     dilated_edges = cv2.dilate(edges, dilation_kernel_2, iterations=1)
 
-    # Save the dilated edges image
-    dilated_edges_output_path = os.path.join(output_folder, 'dilated_stem2.png')
-    Image.fromarray(dilated_edges).save(dilated_edges_output_path)
-    print(f"Dilated edges image saved to: {dilated_edges_output_path}")
+    artifacts.image(folder, 'dilated_stem2.png', dilated_edges)
 
     # Detect lines using the Hough Transform
     lines = cv2.HoughLinesP(dilated_edges, 1, np.pi / 180, threshold=8, minLineLength=5, maxLineGap=1)
-    if lines is not None:
-        line_img = np.zeros_like(image_array)  # Black image to draw lines on
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            # Only draw vertical lines
-            if abs(x1 - x2) < 5:  # Angle close to 90 or 180 degrees
-                cv2.line(line_img, (x1, y1), (x2, y2), (255, 255, 255), 2)
+    if lines is None:
+        return None
+
+    line_img = np.zeros_like(image_array)  # Black image to draw lines on
+    for line in lines:
+        x1, y1, x2, y2 = line[0]
+        # Only draw vertical lines
+        if abs(x1 - x2) < 5:  # Angle close to 90 or 180 degrees
+            cv2.line(line_img, (x1, y1), (x2, y2), (255, 255, 255), 2)
 
-        # Save the image with detected vertical lines
-        vertical_lines_output_path = os.path.join(output_folder, 'vertical_lines.png')
-        Image.fromarray(line_img).save(vertical_lines_output_path)
-        print(f"Image with vertical lines saved to: {vertical_lines_output_path}")
+    # Save the image with detected vertical lines
+    artifacts.image(folder, 'vertical_lines.png', line_img, SUMMARY)
+
+    return line_img
 
 
 def stem_detect(processed_image_path):
@@ -72,13 +66,11 @@ def stem_detect(processed_image_path):
         print(f"Error loading image: {e}")
         return None
 
-    # Create the output folder if it doesn't exist
-    output_folder = 'stem_images'
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Process the image to enhance vertical lines (stems)
-    process_image(processed_img_array, output_folder)
+    # Process the image to enhance vertical lines (stems), saving every intermediate image
+    with ArtifactSink('full') as artifacts:
+        line_img = process_image(processed_img_array, artifacts)
 
     # Output message after processing
     print("Stem detection processing complete.")
+
+    return line_img
@@ -0,0 +1,114 @@
+import math
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from artifacts import NO_ARTIFACTS, SUMMARY
+from clef_detection import classify_clefs, label_clefs
+from note_events import draw_blob_records
+from note_head_detection import detect_noteheads
+from scheduler import task, run_tasks
+from stem_detection import process_image as detect_stem_lines
+
+# Horizontal band of a page around one staff. Rows top:bottom are processed; the band owns the core rows
+# core_top:core_bottom, which partition the page between the bands, and the rows around the core are its halo.
+Band = namedtuple('Band', ['index', 'top', 'bottom', 'core_top', 'core_bottom'])
+
+# Smallest halo in rows. The detectors' kernels reach at most 8 rows (the 15x15 adaptive threshold plus the
+# 3x3 blur and closing), and a notehead blob owned by a band has to lie inside it in full.
+MIN_HALO = 16
+
+
+def band_halo(spacing):
+    """Halo for a page with the given staff line spacing: three spaces, which covers a notehead on the second
+    ledger line outside a staff, and at least MIN_HALO rows."""
+    return max(MIN_HALO, int(math.ceil(3 * spacing)))
+
+
+def staff_boundaries(staves):
+    """Sorted array of the rows that separate neighbouring staves: halfway between the bottom line of the upper
+    staff and the top line of the lower one. staves holds the line rows of each staff, top to bottom."""
+    staves = [staff for staff in staves if staff]
+    return np.array([(upper[-1] + lower[0] + 1) // 2 for upper, lower in zip(staves, staves[1:])], dtype=np.int64)
+
+
+def staff_of(boundaries, rows):
+    """0-based staff of each row, by a binary search of the rows in the boundary array."""
+    return np.searchsorted(boundaries, np.asarray(rows), side='right')
+
+
+def staff_bands(staves, height, halo=MIN_HALO):
+    """Cut a page of the given height into one band per staff.
+
+    staves holds the line rows of each staff in page coordinates, top to bottom. The core boundary between two
+    staves lies halfway between the bottom line of the upper one and the top line of the lower one; the first
+    core starts at row 0 and the last ends at height. Each band adds halo rows above and below its core.
+    Returns [Band], or a single band over the whole page when there are no staves.
+    """
+    staves = [staff for staff in staves if staff]
+    if not staves:
+        return [Band(0, 0, height, 0, height)]
+
+    edges = [0] + staff_boundaries(staves).tolist() + [height]
+    return [Band(i, max(0, core_top - halo), min(height, core_bottom + halo), core_top, core_bottom)
+            for i, (core_top, core_bottom) in enumerate(zip(edges, edges[1:]))]
+
+
+def owned(band, rows):
+    """Mask of the page rows that fall in the band's core."""
+    return (rows >= band.core_top) & (rows < band.core_bottom)
+
+
+def detect_band(band_page, band):
+    """Run the clef, notehead and stem detectors on the rows of one band. Coordinates are moved to page rows
+    and only the results in the band's core are kept. Returns (clef_blobs, blobs, stem_lines)."""
+    clef_blobs = [(cx, cy + band.top) for _, _, cx, cy in classify_clefs(band_page)]
+    clef_blobs = [(cx, cy) for cx, cy in clef_blobs if band.core_top <= cy < band.core_bottom]
+
+    blobs = detect_noteheads(band_page)
+    blobs['cy'] += band.top
+    blobs = blobs[owned(band, blobs['cy'])]
+
+    band_lines = detect_stem_lines(band_page)
+    if band_lines is not None:
+        core = slice(band.core_top - band.top, band.core_bottom - band.top)
+        band_lines = band_lines[core]
+
+    return clef_blobs, blobs, band_lines
+
+
+def run_band_detectors(page_without_staff, bands, artifacts=None, recorder=None, parallel=True, max_workers=None,
+                       page_number=0):
+    """Run the clef, notehead and stem detectors band by band instead of on the whole page.
+
+    Each band only holds its own rows and the intermediate images of its detectors, so the peak memory of a
+    worker follows the band height rather than the page height; with parallel=True the bands run at the same
+    time on max_workers threads. The merged results match those of the whole-page detectors: clefs labelled
+    top to bottom over the page, one BLOB_DTYPE array and one stem lines image of the page size. Blob filters
+    that look at the whole page (the distance from the leftmost blob) are applied per band, that is, per
+    staff. Only the summary images are written. Returns {'clef': ..., 'notehead': ..., 'stem': ...}.
+    """
+    artifacts = artifacts or NO_ARTIFACTS
+    tasks = [task(f'band_{band.index}', detect_band, page_without_staff[band.top:band.bottom], band)
+             for band in bands]
+    results = run_tasks(tasks, max_workers=max_workers, recorder=recorder, parallel=parallel, page=page_number)
+    band_results = [results[f'band_{band.index}'] for band in bands]
+
+    clef_blobs = sorted((blob for clefs, _, _ in band_results for blob in clefs), key=lambda blob: blob[1])
+    blobs = np.concatenate([band_blobs for _, band_blobs, _ in band_results])
+
+    stem_lines = None
+    if any(lines is not None for _, _, lines in band_results):
+        stem_lines = np.zeros_like(page_without_staff)
+        for band, (_, _, lines) in zip(bands, band_results):
+            if lines is not None:
+                stem_lines[band.core_top:band.core_bottom] = lines
+
+    artifacts.image('notehead_images', 'processed_image_with_dots.png',
+                    lambda: draw_blob_records(cv2.cvtColor(page_without_staff.astype(np.uint8),
+                                                           cv2.COLOR_GRAY2BGR), blobs), SUMMARY)
+    artifacts.image('stem_images', 'vertical_lines.png', stem_lines, SUMMARY)
+
+    print(f"Detected {len(blobs)} noteheads and {len(clef_blobs)} clefs in {len(bands)} bands")
+    return {'clef': label_clefs(clef_blobs), 'notehead': blobs, 'stem': stem_lines}
@@ -0,0 +1,32 @@
+import glob
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The bundled scores every page-level test runs on
+BUNDLED_PDFS = sorted(glob.glob(os.path.join(ROOT, 'Image', 'music*.pdf')))
+
+
+@pytest.fixture(params=BUNDLED_PDFS, ids=os.path.basename)
+def pdf_path(request):
+    return request.param
+
+
+@pytest.fixture
+def binarized_page(pdf_path):
+    """The binarized first page of a bundled score, rendered at the default 72 DPI."""
+    from grayscalebinarize import render_and_binarize
+    return render_and_binarize(pdf_path)[1]
+
+
+@pytest.fixture
+def page_without_staff(binarized_page):
+    """The cropped staff-free page of a bundled score, with its staff model."""
+    from staff_detection import detect_staff
+    from staff_removal import process_array
+    staff_model = detect_staff(binarized_page)
+    return process_array(binarized_page, staff_model.raw_rows)[2], staff_model
@@ -0,0 +1,16 @@
+import os
+
+from clef_detection import classify_clefs
+
+# Clefs of the bundled scores as the clef detector finds them when it blurs its crop of the page
+EXPECTED_CLEFS = {
+    'music1.pdf': [(1, 'T', 8, 45), (2, 'B', 3, 84), (3, 'T', 8, 191), (4, 'B', 3, 231), (5, 'T', 8, 338),
+                   (6, 'B', 4, 377), (7, 'T', 8, 484), (8, 'B', 4, 523)],
+    'music2.pdf': [(1, 'T', 4, 35), (2, 'B', 1, 66)],
+    'music3.pdf': [(1, 'T', 4, 35), (2, 'B', 1, 66)],
+}
+
+
+def test_clefs_of_bundled_pages(pdf_path, page_without_staff):
+    page, _ = page_without_staff
+    assert classify_clefs(page) == EXPECTED_CLEFS[os.path.basename(pdf_path)]
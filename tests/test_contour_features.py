@@ -0,0 +1,66 @@
+import cv2
+import numpy as np
+
+from contour_features import contour_features
+
+
+def synthetic_shapes():
+    """Filled circles, ellipses, squares, triangles, rings with a dot inside, thick and thin diagonal strokes
+    and single pixels, spread over one image."""
+    image = np.zeros((240, 400), dtype=np.uint8)
+    for i, radius in enumerate([1, 2, 3, 4, 6, 9, 14]):
+        cv2.circle(image, (20 + 40 * i, 20), radius, 255, -1)
+    for i, axes in enumerate([(3, 2), (5, 3), (9, 4), (14, 6), (6, 12)]):
+        cv2.ellipse(image, (25 + 60 * i, 65), axes, 30 * i, 0, 360, 255, -1)
+    for i, side in enumerate([2, 5, 11]):
+        cv2.rectangle(image, (20 + 40 * i, 100), (20 + 40 * i + side, 100 + side), 255, -1)
+    cv2.fillPoly(image, [np.array([[160, 120], [190, 100], [200, 125]])], 255)
+    for i, radius in enumerate([6, 12]):
+        cv2.circle(image, (250 + 50 * i, 110), radius, 255, 2)
+        image[110, 250 + 50 * i] = 255
+    for i, thickness in enumerate([1, 2, 4]):
+        cv2.line(image, (20 + 60 * i, 150), (60 + 60 * i, 200), 255, thickness)
+    cv2.line(image, (220, 160), (380, 170), 255, 1)
+    image[220, 10] = image[225, 30] = 255
+    return image
+
+
+def reference_features(image):
+    """(box, area, perimeter, circularity, solidity, completeness, centroid) of every outer contour, straight
+    from findContours and the per-contour OpenCV calls."""
+    contours, _ = cv2.findContours(image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rows = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        perimeter = cv2.arcLength(contour, True)
+        hull = cv2.convexHull(contour)
+        hull_area, hull_perimeter = cv2.contourArea(hull), cv2.arcLength(hull, True)
+        moments = cv2.moments(contour)
+        centroid = ((int(moments['m10'] / moments['m00']), int(moments['m01'] / moments['m00']))
+                    if moments['m00'] != 0 else (-1, -1))
+        rows.append((cv2.boundingRect(contour), area, perimeter,
+                     4 * np.pi * area / perimeter ** 2 if perimeter > 0 else 0,
+                     area / hull_area if hull_area > 0 else 0,
+                     perimeter / hull_perimeter if hull_perimeter > 0 else 0, centroid))
+    return rows
+
+
+def test_features_match_findcontours():
+    image = synthetic_shapes()
+    features = contour_features(image, hull=True)
+
+    reference = reference_features(image)
+    assert len(features) == len(reference)
+    for row, (box, *measures, centroid) in zip(features.tolist(), reference):
+        assert row[:4] == box
+        assert list(row[6:11]) == measures
+        assert row[11:] == centroid
+
+
+def test_hull_only_for_the_selected_rows():
+    image = synthetic_shapes()
+    wanted = contour_features(image)['w'] > 10
+    features = contour_features(image, hull=lambda table: table['w'] > 10)
+
+    assert (features['completeness'][wanted] > 0).all()
+    assert (features['solidity'][~wanted] == 0).all() and (features['completeness'][~wanted] == 0).all()
@@ -0,0 +1,50 @@
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+from instrumentation import StageRecorder
+from scheduler import task, run_tasks
+
+
+def spin(seconds):
+    """Busy-wait in this thread for the given CPU time."""
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def sleep_then_spin(barrier, seconds):
+    barrier.wait()
+    spin(seconds)
+
+
+def test_concurrent_stages_count_their_own_cpu_time():
+    recorder = StageRecorder()
+    barrier = threading.Barrier(2)
+    run_tasks([task('short', sleep_then_spin, barrier, 0.05), task('long', sleep_then_spin, barrier, 0.3)],
+              max_workers=2, recorder=recorder)
+
+    stages = {stage['name']: stage for stage in recorder.stages}
+    assert stages['short']['cpu_s'] < 0.2
+    assert stages['long']['cpu_s'] >= 0.3
+    assert stages['short']['overlapped'] and stages['long']['overlapped']
+
+
+def test_array_peaks_only_for_stages_that_ran_alone():
+    recorder = StageRecorder(track_arrays=True)
+    try:
+        with recorder.stage('alone'):
+            np.ones(4 * 1024 * 1024, dtype=np.uint8)
+
+        barrier = threading.Barrier(2)
+        run_tasks([task('a', sleep_then_spin, barrier, 0.01), task('b', sleep_then_spin, barrier, 0.01)],
+                  max_workers=2, recorder=recorder)
+    finally:
+        tracemalloc.stop()
+
+    stages = {stage['name']: stage for stage in recorder.stages}
+    assert not stages['alone']['overlapped']
+    assert stages['alone']['array_peak_mb'] >= 3.9
+    assert 'array_peak_mb' not in stages['a'] and 'array_peak_mb' not in stages['b']
@@ -0,0 +1,74 @@
+from collections import Counter
+
+import cv2
+import numpy as np
+import pytest
+
+from musicnote_identification import apply_beam_lines, draw_boundingbox_array, identify_note_events, identify_notes
+from note_events import FILLED, bar_boxes_from_image, beam_boxes_from_image, build_beam_index
+from note_head_detection import detect_noteheads, draw_dots
+from staff_detection import cropped_staves
+
+
+def colour_path_notes(page, blobs, bar_boxes_img, lines_img):
+    """Notes of the original colour pipeline: dots drawn on the page, cleared outside the bar boxes, beams
+    painted yellow, then the HSV passes of identify_notes."""
+    valid_blobs = list(zip(blobs['cx'].tolist(), blobs['cy'].tolist(), blobs['area'].tolist(),
+                           blobs['solidity'].tolist(), blobs['completeness'].tolist()))
+    image = draw_dots(cv2.cvtColor(page, cv2.COLOR_GRAY2BGR), valid_blobs)
+    image, _ = draw_boundingbox_array(bar_boxes_img, image)
+    apply_beam_lines(lines_img, image)
+    return identify_notes(image)[-1]
+
+
+def record_notes(page, blobs, bar_boxes_img, lines_img):
+    bar_boxes = bar_boxes_from_image(bar_boxes_img)
+    return identify_note_events(page, blobs, bar_boxes, build_beam_index(beam_boxes_from_image(lines_img)),
+                                lines_img)
+
+
+def synthetic_detections(page, staff_model, blobs):
+    """Bar boxes and beam lines for a page without the file-based detectors: three boxes per staff whose
+    edges cut through some dots, beams above neighbouring filled noteheads and short lines through every
+    fourth dot, so that clipped, merged and split dots all occur."""
+    height, width = page.shape
+    bar_boxes_img = cv2.cvtColor(page, cv2.COLOR_GRAY2BGR)
+    spacing = int(staff_model.spacing)
+    cuts = [0, width // 3, 2 * width // 3, width - 1]
+    for staff in cropped_staves(staff_model):
+        top, bottom = max(0, staff[0] - 2 * spacing), min(height - 1, staff[-1] + 2 * spacing)
+        for left, right in zip(cuts, cuts[1:]):
+            cv2.rectangle(bar_boxes_img, (left, top), (right - 2, bottom), (0, 255, 0), 1)
+
+    lines_img = np.zeros((height, width), dtype=np.uint8)
+    filled = np.sort(blobs[blobs['kind'] == FILLED], order=['cy', 'cx'])
+    for a, b in zip(filled.tolist(), filled[1:].tolist()):
+        if abs(a[1] - b[1]) < 8 and 0 < b[0] - a[0] < 25:
+            y = min(a[1], b[1]) - 14
+            cv2.line(lines_img, (a[0], y), (b[0], y), 255, 3)
+    for cx, cy in zip(blobs['cx'][::4].tolist(), blobs['cy'][::4].tolist()):
+        cv2.line(lines_img, (cx - 5, cy - 1), (cx + 5, cy - 1), 255, 2)
+    return bar_boxes_img, lines_img
+
+
+def test_records_match_colour_path(page_without_staff):
+    page, staff_model = page_without_staff
+    blobs = detect_noteheads(page)
+    bar_boxes_img, lines_img = synthetic_detections(page, staff_model, blobs)
+
+    expected = colour_path_notes(page, blobs, bar_boxes_img, lines_img)
+    assert Counter(record_notes(page, blobs, bar_boxes_img, lines_img)) == Counter(expected)
+
+
+def test_records_match_colour_path_with_detectors(page_without_staff, tmp_path, monkeypatch):
+    pytest.importorskip('beam_detection')
+    pytest.importorskip('bar_lines_detection')
+    from pipeline import run_file_detectors
+
+    page, _ = page_without_staff
+    monkeypatch.chdir(tmp_path)
+    blobs = detect_noteheads(page)
+    lines_img, bar_boxes_img = run_file_detectors(page)
+
+    expected = colour_path_notes(page, blobs, bar_boxes_img, lines_img)
+    assert Counter(record_notes(page, blobs, bar_boxes_img, lines_img)) == Counter(expected)
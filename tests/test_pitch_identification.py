@@ -0,0 +1,76 @@
+import re
+
+import numpy as np
+
+from clef_detection import classify_clefs
+from map_notes_to_midi import POSITION_TO_NOTE, assign_clef_to_notes, assign_midi_from_steps, notes_from_processed
+from note_head_detection import detect_noteheads
+from pitch_identification import process_notes_with_staffs, process_notes_with_steps, staff_position, staff_steps
+from staff_detection import cropped_line_rows, cropped_staves
+from strips import staff_boundaries, staff_of
+
+
+def legacy_step(position):
+    """Staff step of a line or space named by process_notes_with_staffs, or None for positions off the staff."""
+    match = re.fullmatch(r'On Line (\d)', position or '')
+    if match:
+        return 2 * int(match[1]) - 2
+    match = re.fullmatch(r'Between Line (\d) and Line (\d)', position or '')
+    if match and abs(int(match[1]) - int(match[2])) == 1:
+        return int(match[1]) + int(match[2]) - 2
+    return None
+
+
+def page_notes(page, staff_model):
+    """Every notehead of the page as a crotchet in the bar of its staff, as segmentation numbers them."""
+    blobs = detect_noteheads(page)
+    staves = cropped_staves(staff_model)
+    staff_index = staff_of(staff_boundaries(staves), blobs['cy'])
+    notes_data = [(int(index) + 1, 'crotchet', cx, cy)
+                  for index, cx, cy in zip(staff_index.tolist(), blobs['cx'].tolist(), blobs['cy'].tolist())]
+    return notes_data, len(staves)
+
+
+def test_steps_match_positions_on_the_staff(page_without_staff):
+    page, staff_model = page_without_staff
+    notes_data, num_bars = page_notes(page, staff_model)
+    staff_lines = cropped_line_rows(staff_model)
+    clefs = classify_clefs(page)
+
+    legacy = process_notes_with_staffs(notes_data, staff_lines, num_bars, output_file=None)
+    legacy_assigned = assign_clef_to_notes(notes_from_processed(legacy), clefs)
+    processed, steps = process_notes_with_steps(notes_data, staff_lines, num_bars, output_file=None)
+    assigned = assign_midi_from_steps(processed, steps, clefs)
+
+    assert len(processed) == len(legacy) == len(notes_data)
+    legacy_steps = [legacy_step(note[5]) for note in legacy]
+    assert any(step is not None for step in legacy_steps)
+    # Every note the legacy rules put on a line or space of the staff gets that step
+    assert all(step == expected for step, expected in zip(steps.tolist(), legacy_steps) if expected is not None)
+    # and the MIDI number of the legacy position table wherever the table names the position
+    for note, legacy_note, expected in zip(assigned, legacy_assigned, legacy_steps):
+        if expected is not None and legacy_note[2] in POSITION_TO_NOTE[legacy_note[4]]:
+            assert note[5] == legacy_note[5]
+
+
+def test_steps_match_legacy_rules_on_every_row():
+    # Even and uneven line spacings, as staff detection finds them at 72 DPI and above
+    staves = np.array([[10, 16, 22, 28, 34], [10, 16, 22, 29, 35], [10, 17, 24, 31, 38], [10, 15, 20, 25, 30],
+                       [10, 19, 28, 37, 46]], dtype=np.float64)
+    for staff, lines in enumerate(staves.astype(int).tolist()):
+        rows = np.arange(lines[0], lines[-1] + 1)
+        steps = staff_steps(staves, [staff] * len(rows), rows).tolist()
+        for row, step in zip(rows.tolist(), steps):
+            expected = legacy_step(staff_position([row - line for line in lines]))
+            assert expected is None or step == expected, (lines, row)
+
+
+def test_notes_without_a_staff_are_counted(capsys):
+    staff_lines = [10, 16, 22, 28, 34]
+    notes_data = [(1, 'crotchet', 50, 22), (2, 'minim', 60, 80), (0, 'crotchet', 70, 5)]
+
+    processed, steps = process_notes_with_steps(notes_data, staff_lines, 2, output_file=None)
+
+    assert [note[:4] for note in processed] == [(1, 'crotchet', 50, 22)]
+    assert steps.tolist() == [4]
+    assert "Skipping 2 notes" in capsys.readouterr().out
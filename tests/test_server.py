@@ -0,0 +1,101 @@
+import queue
+import time
+
+import pytest
+
+pytest.importorskip('beam_detection')
+pytest.importorskip('bar_lines_detection')
+
+import server  # noqa: E402
+from server import PROGRESS_STAGES, ConversionService, create_app  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    service = ConversionService(str(tmp_path_factory.mktemp('uploads')), workers=2, max_pending=4)
+    yield service
+    service.shutdown()
+
+
+@pytest.fixture
+def client(service):
+    return create_app(service).test_client()
+
+
+def upload(client, path, filename='score.pdf', **form):
+    with open(path, 'rb') as file:
+        return client.post('/convert', data={'file': (file, filename), **form}, content_type='multipart/form-data')
+
+
+def wait_for(client, job_id, timeout=300):
+    """Poll a job until it finishes; returns its last status and the progress values seen on the way."""
+    progress = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        progress.append(job['progress'])
+        if job['status'] in ('done', 'failed'):
+            return job, progress
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish in {timeout} s")
+
+
+def test_convert_and_download(client, pdf_path):
+    response = upload(client, pdf_path)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job, progress = wait_for(client, job_id)
+    assert job['status'] == 'done', job['error']
+    assert progress == sorted(progress) and progress[-1] == 1.0
+    assert job['midi_url'] == f'/jobs/{job_id}/midi'
+
+    midi = client.get(job['midi_url'])
+    assert midi.status_code == 200
+    assert midi.mimetype == 'audio/midi'
+    assert midi.data.startswith(b'MThd')
+
+
+def test_all_pages_job_runs_pages_on_the_service_pool(client, pdf_path):
+    job_id = upload(client, pdf_path, all_pages='1').get_json()['job_id']
+
+    job, progress = wait_for(client, job_id)
+    assert job['status'] == 'done', job['error']
+    assert job['pages_done'] == job['pages'] >= 1
+    assert progress == sorted(progress)
+    assert client.get(job['midi_url']).data.startswith(b'MThd')
+
+
+def test_stage_events_cover_the_progress_stages(pdf_path, monkeypatch):
+    events = queue.Queue()
+    monkeypatch.setattr(server, 'progress_events', events)
+
+    midi, error, _ = server.run_job('job', pdf_path)
+    assert error is None and midi.startswith(b'MThd')
+
+    # The detectors run concurrently and may finish in any order, but every stage is reported once
+    names = [events.get_nowait()[1] for _ in range(events.qsize())]
+    names = [name for name in names if name in PROGRESS_STAGES]
+    assert sorted(names) == sorted(PROGRESS_STAGES)
+    assert names[0] == PROGRESS_STAGES[0] and names[-1] == PROGRESS_STAGES[-1]
+
+
+def test_rejected_requests(client):
+    assert client.post('/convert', data={}, content_type='multipart/form-data').status_code == 400
+    assert upload(client, __file__, 'test_server.py').status_code == 400
+    assert client.get('/jobs/unknown').status_code == 404
+    assert client.get('/jobs/unknown/midi').status_code == 404
+    assert client.get('/health').get_json()['workers'] == 2
+
+
+def test_finished_jobs_expire(service, client, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(service, 'jobs', {f'old-{i}': {'job_id': f'old-{i}', 'status': 'done', 'finished': finished}
+                                          for i, finished in enumerate([now - 100, now - 3, now - 2, now - 1])})
+    monkeypatch.setattr(service, 'job_ttl', 10)
+    monkeypatch.setattr(service, 'max_finished', 2)
+
+    assert client.get('/jobs/old-0').status_code == 404  # Older than the TTL
+    assert client.get('/jobs/old-1').status_code == 404  # Beyond max_finished
+    assert client.get('/jobs/old-2').get_json()['status'] == 'done'
+    assert client.get('/jobs/old-3').get_json()['status'] == 'done'
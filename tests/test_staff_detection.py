@@ -0,0 +1,14 @@
+from staff_detection import detect_staff, cropped_line_rows, cropped_staves
+from staff_line_row_index import getstafflinerow_array
+from staff_removal import process_array
+
+
+def test_staff_model_matches_getstafflinerow(binarized_page):
+    """The shared staff model gives the rows the file pipeline finds on the cropped page."""
+    staff_model = detect_staff(binarized_page)
+    _, page_with_staff, _ = process_array(binarized_page, staff_model.raw_rows)
+    expected, _ = getstafflinerow_array(page_with_staff)
+
+    assert cropped_line_rows(staff_model) == expected
+    assert [row for staff in cropped_staves(staff_model) for row in staff] == expected
+    assert all(0 <= row < page_with_staff.shape[0] for row in expected)
@@ -0,0 +1,47 @@
+import numpy as np
+
+from staff_removal import (
+    find_staff_line_rows,
+    process_array,
+    remove_staff_lines,
+    remove_staff_lines_runlength,
+)
+
+
+def remove_staff_lines_loop(binarized_img_array, staff_line_rows, height, width):
+    """The original pixel loop that remove_staff_lines replaces."""
+    cleaned_img_array = binarized_img_array.copy()
+    for row in staff_line_rows:
+        for col in range(width):
+            if cleaned_img_array[row, col] == 0:
+                above = row > 0 and cleaned_img_array[row - 1, col] == 0
+                below = row < height - 1 and cleaned_img_array[row + 1, col] == 0
+                if not (above and below):
+                    cleaned_img_array[row, col] = 255
+    return cleaned_img_array
+
+
+def test_vectorized_removal_is_byte_identical(binarized_page):
+    rows = find_staff_line_rows(binarized_page)
+    height, width = binarized_page.shape
+    expected = remove_staff_lines_loop(binarized_page, rows, height, width)
+    cleaned = remove_staff_lines(binarized_page, rows, height, width)
+    assert cleaned.dtype == expected.dtype
+    assert cleaned.tobytes() == expected.tobytes()
+
+
+def test_runlength_keeps_notation_across_thick_lines():
+    page = np.full((40, 60), 255, dtype=np.uint8)
+    page[10:13, :] = 0  # A staff line three pixels thick
+    page[5:20, 30] = 0  # A stem crossing it
+    rows = [10, 11, 12]
+
+    cleaned = remove_staff_lines_runlength(page, rows)
+    assert (cleaned[10:13, 30] == 0).all()
+    assert (cleaned[10:13, :30] == 255).all() and (cleaned[10:13, 31:] == 255).all()
+
+
+def test_runlength_option_of_process_array(binarized_page):
+    rows, _, default = process_array(binarized_page)
+    _, _, runlength = process_array(binarized_page, rows, runlength=True)
+    assert runlength.shape == default.shape
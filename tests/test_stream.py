@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip('beam_detection')
+pytest.importorskip('bar_lines_detection')
+
+from instrumentation import StageRecorder  # noqa: E402
+from pipeline import run_pipeline, stream_pipeline  # noqa: E402
+
+
+@pytest.mark.parametrize('strips', [False, True])
+def test_stream_records_stages_and_matches_run_pipeline(pdf_path, strips, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    recorder = StageRecorder()
+
+    chunks = list(stream_pipeline(pdf_path, output_dir=None, recorder=recorder, strips=strips))
+    result = run_pipeline(pdf_path, output_dir=None, strips=strips)
+
+    names = {stage['name'] for stage in recorder.stages}
+    assert {'staff_detection', 'note_identification', 'pitch', 'midi'} <= names
+    assert ('bands' in names) == strips
+    # One chunk per staff with notes, in staff order
+    assert [bar for _, bar, _ in chunks] == sorted({int(note[0]) for note in result['assigned_notes']})
+
+
+def test_stream_rejects_polyphonic():
+    main = pytest.importorskip('main')
+    with pytest.raises(ValueError):
+        main.main('music1', stream=True, polyphonic=True)
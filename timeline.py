@@ -0,0 +1,140 @@
+import numpy as np
+
+from mido import Message
+
+from map_notes_to_midi import PianoMidiStream
+
+TREBLE = 0
+BASS = 1
+
+# Notes of the polyphonic timeline, in beats from the start of the piece
+TIMELINE_DTYPE = np.dtype([
+    ('onset', np.float64),
+    ('duration', np.float64),
+    ('track', np.uint8),  # TREBLE or BASS
+    ('midi', np.uint8),
+    ('bar', np.int32),
+    ('cx', np.int32),
+])
+
+# Noteheads closer than this in x (pixels at 72 DPI, about one notehead width) start together: noteheads on
+# one stem form a chord, and notes of the treble and bass staff of a system above each other are played at
+# the same time
+CHORD_TOLERANCE = 8
+
+
+def is_rest(note_type):
+    return 'rest' in note_type.lower()
+
+
+def system_numbers(bars, tracks):
+    """System of each staff, given the staves' bar numbers and tracks in page order: a treble staff starts a new
+    system, and a bass staff joins the treble staff above it (or starts a system if there is none)."""
+    systems = []
+    previous = None
+    for bar, track in zip(bars, tracks):
+        if previous is None or track == TREBLE or previous == BASS:
+            systems.append(len(systems))
+        else:
+            systems.append(systems[-1])
+        previous = track
+    return dict(zip(bars, systems))
+
+
+def build_timeline(processed_notes, assigned_notes, start=0.0, x_tolerance=CHORD_TOLERANCE):
+    """Place the notes of a page on a polyphonic timeline. Returns (timeline, end): a TIMELINE_DTYPE array of
+    the notes, without the rests, and the beat at which the page ends.
+
+    processed_notes and assigned_notes are the matching lists of the pitch stage. Within each system the
+    noteheads are sorted by x and cut into columns wherever the gap to the previous notehead exceeds
+    x_tolerance; each column starts when the staves it covers have finished their previous column, and moves
+    those staves on by its longest note. Rests move their staff on like notes but play nothing, and the next
+    system starts when the longer of its two staves has finished, so treble and bass stay in step. Notes
+    without a treble or bass clef keep their time but are not played, as in build_piano_midi.
+    """
+    if not assigned_notes:
+        return np.zeros(0, dtype=TIMELINE_DTYPE), start
+
+    bars = np.array([int(note[0]) for note in assigned_notes], dtype=np.int64)
+    tracks = np.array([BASS if note[4] == "bass" else TREBLE for note in assigned_notes], dtype=np.uint8)
+    durations = np.array([note[3] for note in assigned_notes], dtype=np.float64)
+    rests = np.array([is_rest(note[1]) for note in assigned_notes])
+    known_clef = np.array([note[4] in ("treble", "bass") for note in assigned_notes])
+    cx = np.array([note[2] for note in processed_notes], dtype=np.int64)
+
+    staff_bars, first = np.unique(bars, return_index=True)
+    system_of_bar = system_numbers(staff_bars.tolist(), tracks[first].tolist())
+    systems = np.array([system_of_bar[bar] for bar in bars.tolist()], dtype=np.int64)
+
+    # One sort puts the notes in system order and left to right; columns break at new systems and x gaps
+    order = np.lexsort((cx, systems))
+    new_system = np.diff(systems[order], prepend=-1) != 0
+    new_column = new_system | (np.diff(cx[order], prepend=cx[order[0]]) > x_tolerance)
+    columns = np.split(order, np.flatnonzero(new_column)[1:])
+
+    onsets = np.zeros(len(assigned_notes), dtype=np.float64)
+    system = None
+    system_start = start
+    staff_ends = {}  # Beat at which each staff of the current system is free again
+    for column in columns:
+        if systems[column[0]] != system:
+            system = systems[column[0]]
+            system_start = max([system_start] + list(staff_ends.values()))
+            staff_ends = {}
+        column_bars = bars[column]
+        staves = set(column_bars.tolist())
+        onset = max(staff_ends.get(bar, system_start) for bar in staves)
+        onsets[column] = onset
+        for bar in staves:
+            staff_ends[bar] = onset + durations[column][column_bars == bar].max()
+    end = max([system_start] + list(staff_ends.values()))
+
+    notes = ~rests & known_clef
+    timeline = np.zeros(int(notes.sum()), dtype=TIMELINE_DTYPE)
+    timeline['onset'] = onsets[notes]
+    timeline['duration'] = durations[notes]
+    timeline['track'] = tracks[notes]
+    timeline['midi'] = [note[5] for note, keep in zip(assigned_notes, notes.tolist()) if keep]
+    timeline['bar'] = bars[notes]
+    timeline['cx'] = cx[notes]
+    return timeline, end
+
+
+def timeline_to_midi(timeline, tempo=None, time_signature=None, ticks_per_beat=480):
+    """Serialise a timeline to the two-track (treble, bass) piano MIDI file.
+
+    The note_on and note_off events of all notes are sorted in one np.lexsort by track, time, note_off before
+    note_on (so a repeated pitch is released before it sounds again) and pitch, and their times are
+    delta-encoded with np.diff per track.
+    """
+    midi = PianoMidiStream(tempo, time_signature, ticks_per_beat).midi
+
+    on = np.rint(timeline['onset'] * ticks_per_beat).astype(np.int64)
+    off = on + np.rint(timeline['duration'] * ticks_per_beat).astype(np.int64)
+    times = np.concatenate([on, off])
+    is_on = np.concatenate([np.ones(len(timeline), dtype=np.int8), np.zeros(len(timeline), dtype=np.int8)])
+    tracks = np.concatenate([timeline['track'], timeline['track']])
+    pitches = np.concatenate([timeline['midi'], timeline['midi']])
+    order = np.lexsort((pitches, is_on, times, tracks))
+
+    for track_index, track in enumerate(midi.tracks):
+        events = order[tracks[order] == track_index]
+        deltas = np.diff(times[events], prepend=0)
+        for delta, note_on, pitch in zip(deltas.tolist(), is_on[events].tolist(), pitches[events].tolist()):
+            track.append(Message('note_on' if note_on else 'note_off', note=pitch, velocity=120, time=delta))
+
+    return midi
+
+
+def score_timeline(page_results, x_tolerance=CHORD_TOLERANCE):
+    """Timeline of the pages of a score in page order, each page starting where the previous one ends, with the
+    bar numbers of the whole score as in pipeline.stitch_pages."""
+    timelines = []
+    start = 0.0
+    bar_offset = 0
+    for result in page_results:
+        timeline, start = build_timeline(result['processed_notes'], result['assigned_notes'], start, x_tolerance)
+        timeline['bar'] += bar_offset
+        timelines.append(timeline)
+        bar_offset += max((bar for bar, _, _, _ in result['notes_data']), default=0)
+    return np.concatenate(timelines) if timelines else np.zeros(0, dtype=TIMELINE_DTYPE)